@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class ChatbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
+
+    def ready(self):
+        # The embedding model is loaded lazily by default. Set
+        # CHATBOT_PRELOAD_EMBEDDINGS=1 to load it at startup instead.
+        from .rag.config import PRELOAD_EMBEDDINGS
+
+        if PRELOAD_EMBEDDINGS:
+            from .rag.embeddings import warm_up
+            from .rag.rerank import get_reranker
+            warm_up()
+
+            reranker = get_reranker()
+            if reranker is not None:
+                reranker.warm_up()
@@ -0,0 +1,170 @@
+"""
+answer_cache.py
+
+Semantic cache of LLM-generated answers.
+
+Generating an answer is by far the slowest step of the LLM chat paths, and
+farmers describe the same problem in many slightly different words. A
+cached answer is reused when a new question
+
+    1. retrieved exactly the same chunk ids (so the LLM would see the same
+       context), and
+    2. has an embedding within `max_distance` cosine distance of the
+       question the answer was generated for.
+
+Entries live in a SQLite file so they survive restarts and are shared by
+every process on the machine. The file is bounded to `max_entries`; the
+least recently used entries are evicted first, and entries older than
+`ttl` seconds are never served.
+
+Chunk ids are content hashes (see project/ingest_embeddings.py), so
+re-ingesting changed documents produces new ids and old answers simply
+stop matching.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from .config import (
+    ANSWER_CACHE_FILE,
+    ANSWER_CACHE_MAX_DISTANCE,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    LLM_MODEL,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    chunk_key TEXT NOT NULL,
+    question TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    answer TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_chunk_key ON answers (chunk_key);
+CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used);
+"""
+
+
+class AnswerCache:
+    """Disk-backed (question embedding, chunk ids) -> answer cache."""
+
+    def __init__(self, path=ANSWER_CACHE_FILE, llm_model=LLM_MODEL, max_entries=ANSWER_CACHE_SIZE,
+                 max_distance=ANSWER_CACHE_MAX_DISTANCE, ttl=ANSWER_CACHE_TTL):
+        self.path = path
+        self.llm_model = llm_model
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ------------------------------
+    # Keys
+    # ------------------------------
+    def chunk_key(self, chunk_ids):
+        """Answers depend on the LLM and on the exact retrieved context."""
+        raw = "\x1f".join([self.llm_model, *map(str, chunk_ids)])
+        return hashlib.sha1(raw.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+    # ------------------------------
+    # Public API
+    # ------------------------------
+    def get(self, question_vector, chunk_ids):
+        """Return the cached answer for a close enough question, or None."""
+        query = _unit(question_vector)
+        now = time.time()
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, embedding, answer FROM answers WHERE chunk_key = ? AND created > ?",
+                (self.chunk_key(chunk_ids), now - self.ttl),
+            ).fetchall()
+
+            best_id, best_answer, best_distance = None, None, self.max_distance
+            for row_id, embedding, answer in rows:
+                cached = np.frombuffer(embedding, dtype=np.float32)
+                if cached.shape != query.shape:  # stored by another embedding model
+                    continue
+                distance = 1.0 - float(cached @ query)
+                if distance <= best_distance:
+                    best_id, best_answer, best_distance = row_id, answer, distance
+
+            if best_id is not None:
+                conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best_id))
+
+        with self._lock:
+            if best_id is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best_answer
+
+    def put(self, question, question_vector, chunk_ids, answer):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO answers (chunk_key, question, embedding, answer, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.chunk_key(chunk_ids), question, _unit(question_vector).tobytes(), answer,
+                 now, now),
+            )
+            self._evict(conn, now)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    # ------------------------------
+    # Internals
+    # ------------------------------
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:  # commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl,))
+        excess = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM answers WHERE id IN "
+                "(SELECT id FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
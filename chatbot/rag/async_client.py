@@ -0,0 +1,156 @@
+"""
+async_client.py
+
+asyncio counterpart of endee_client.py for the async chat endpoint.
+
+AsyncEndeeClient speaks the same REST API through one pooled
+httpx.AsyncClient, so a single ASGI worker can have many searches in
+flight without a thread each. Request bodies and result decoding are
+shared with the synchronous client, and so is its circuit breaker: both
+paths agree on whether Endee is currently reachable.
+
+httpx clients are bound to the event loop that created them, so
+get_async_client() keeps one client per running loop.
+"""
+
+import asyncio
+import weakref
+
+import httpx
+
+from .config import (
+    ENDEE_ASYNC_POOL_SIZE,
+    ENDEE_BASE_URL,
+    ENDEE_RETRIES,
+    ENDEE_TIMEOUT,
+    INDEX_NAME,
+    VECTOR_BACKEND,
+)
+from .crops import query_for_crop, query_for_crop_async
+from .endee_client import EndeeError, EndeeUnavailable, decode_results, get_client, search_body
+from .endee_index import get_index, search_with_fallback
+from .metrics import count_endee_error
+
+
+class AsyncEndeeClient:
+    def __init__(self, base_url=ENDEE_BASE_URL, pool_size=ENDEE_ASYNC_POOL_SIZE,
+                 timeout=ENDEE_TIMEOUT, retries=ENDEE_RETRIES, breaker=None, auth_token=None):
+        connect_timeout, read_timeout = timeout
+        self.breaker = breaker or get_client().breaker
+
+        headers = {"Authorization": auth_token} if auth_token else None
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            # Requests beyond the pool size wait for a free connection
+            # (bounded by the read timeout) instead of opening new ones.
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=read_timeout),
+            transport=httpx.AsyncHTTPTransport(
+                retries=retries,
+                limits=httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size),
+            ),
+        )
+        self._indexes = {}
+
+    async def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            count_endee_error("circuit_open")
+            raise EndeeUnavailable("Endee circuit breaker is open")
+
+        trial = self.breaker.is_open  # let through as the half-open trial
+        try:
+            resp = await self.http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            count_endee_error("unavailable")
+            raise EndeeUnavailable(str(e)) from e
+        except BaseException:
+            # Cancelled (client gone, timeout) before Endee answered: no verdict
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+        if resp.status_code >= 500:
+            self.breaker.record_failure()
+            count_endee_error("unavailable")
+            raise EndeeUnavailable(f"{resp.status_code}: {resp.text}")
+
+        self.breaker.record_success()
+        if resp.status_code >= 400:
+            count_endee_error("request")
+            raise EndeeError(f"{resp.status_code}: {resp.text}")
+        return resp
+
+    async def index_info(self, name):
+        return (await self.request("GET", f"/index/{name}/info")).json()
+
+    async def get_index(self, name=INDEX_NAME):
+        """Return an AsyncEndeeIndex handle; raises EndeeError if it doesn't exist."""
+        index = self._indexes.get(name)
+        if index is None:
+            info = await self.index_info(name)
+            index = self._indexes[name] = AsyncEndeeIndex(self, name, info.get("space_type", "cosine"))
+        return index
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class AsyncEndeeIndex:
+    def __init__(self, client, name, space_type="cosine"):
+        self.client = client
+        self.name = name
+        self.space_type = space_type
+
+    async def query(self, vector=None, top_k=10, filter=None, ef=0, include_vectors=False,
+                    sparse_indices=None, sparse_values=None):
+        body = search_body(self.space_type, vector, top_k, filter, ef, include_vectors,
+                           sparse_indices, sparse_values)
+        resp = await self.client.request("POST", f"/index/{self.name}/search", json=body)
+        return decode_results(resp.content)
+
+
+# ==============================
+# Shared instances
+# ==============================
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the AsyncEndeeClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncEndeeClient()
+    return client
+
+
+async def get_async_index(name=INDEX_NAME):
+    """Return the async handle for index `name`, or None if it is not available."""
+    if VECTOR_BACKEND == "memory":
+        # In-process search is sub-millisecond; it is queried synchronously
+        return get_index(name)
+
+    try:
+        return await get_async_client().get_index(name)
+    except EndeeError as e:
+        print(f"❌ Endee index {name} not available: {e}")
+        return None
+
+
+async def search_with_fallback_async(index, query_vector, top_k, crop=None, sparse_query=None):
+    """Async endee_index.search_with_fallback() for an AsyncEndeeIndex."""
+    if index is not None and not isinstance(index, AsyncEndeeIndex):
+        return query_for_crop(index, query_vector, top_k, crop=crop, sparse_query=sparse_query)
+
+    if index is not None:
+        try:
+            return await query_for_crop_async(
+                index, query_vector, top_k, crop=crop, sparse_query=sparse_query
+            )
+        except EndeeUnavailable as e:
+            print(f"❌ Endee search failed: {e}")
+
+    # Local search is CPU work on a memory map; keep it off the event loop
+    return await asyncio.to_thread(search_with_fallback, None, query_vector, top_k, crop)
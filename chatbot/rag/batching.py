@@ -0,0 +1,167 @@
+"""
+batching.py
+
+Micro-batching in front of the embedding model.
+
+Concurrent chat requests each need one query vector. Instead of running
+one forward pass per request, callers hand their question to an
+EmbeddingBatcher, which collects whatever arrives within `max_wait_ms` of
+the first queued question (up to `max_batch_size`) and encodes them in a
+single batched call. Each caller gets back its own vector. The time each
+question waited for its batch is exported as the "batch_queue" stage
+(see metrics.py).
+
+Async callers use submit() and await the returned Future (see
+asyncio.wrap_future), so waiting for a batch doesn't tie up a thread.
+A caller that gives up (a cancelled request, a timed-out encode())
+cancels its Future; the worker drops cancelled Futures from the batch
+and never lets a completion error stop it.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+
+import numpy as np
+
+from .metrics import observe
+
+
+class EmbeddingBatcher:
+    """Coalesces single-text encode calls into batched model calls."""
+
+    def __init__(self, encode_batch, max_batch_size=32, max_wait_ms=5, timeout=30.0):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout  # default wait of encode(), in seconds
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def submit(self, text):
+        """Queue `text` for the next batch; returns a Future for its vector."""
+        future = Future()
+        self._get_queue().put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, text, timeout=None):
+        """
+        Encode `text` as part of the next batch. Blocks until done, or
+        raises concurrent.futures.TimeoutError after `timeout` seconds
+        (self.timeout by default).
+        """
+        future = self.submit(text)
+        try:
+            return future.result(timeout if timeout is not None else self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_queue_delay_ms": (
+                    1000.0 * self.queue_delay_total / self.items if self.items else 0.0
+                ),
+                "max_queue_delay_ms": 1000.0 * self.queue_delay_max,
+            }
+
+    # ------------------------------
+    # Worker thread
+    # ------------------------------
+    def _get_queue(self):
+        # Threads don't survive fork(): a gunicorn worker needs its own
+        # queue and worker thread even if the master created one.
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = queue.Queue()
+                    worker = threading.Thread(
+                        target=self._run, args=(self._queue,),
+                        name="embedding-batcher", daemon=True,
+                    )
+                    worker.start()
+                    self._pid = pid
+        return self._queue
+
+    def _collect(self, pending):
+        first = pending.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Claim each Future; the ones already cancelled by their caller are dropped
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+
+    def _run(self, pending):
+        while True:
+            try:
+                self._run_once(pending)
+            except Exception as e:
+                # This is the only worker thread; it must survive anything
+                print(f"❌ Embedding batcher error: {e}")
+
+    def _run_once(self, pending):
+        batch = self._collect(pending)
+        if not batch:
+            return
+        started = time.monotonic()
+
+        try:
+            vectors = self.encode_batch([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                _complete(future, exception=e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            # A copy, not a row view: a cached view would keep the whole batch alive
+            _complete(future, result=np.array(vector))
+
+        self._record(batch, started)
+
+    def _record(self, batch, started):
+        delays = [started - queued_at for _, _, queued_at in batch]
+        for delay in delays:
+            observe("batch_queue", delay)
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, max(delays))
+
+
+def _complete(future, result=None, exception=None):
+    """Resolve `future`, ignoring one that was resolved or cancelled meanwhile."""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
@@ -0,0 +1,123 @@
+"""
+config.py
+
+Shared configuration for the Endee RAG chatbot.
+
+Values can be overridden with environment variables so the Django app,
+the Flask app in project/ and the ingestion scripts all agree on the
+index, model and server they talk to.
+"""
+
+import os
+
+INDEX_NAME = os.getenv("ENDEE_INDEX_NAME", "crop_diseases")
+MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+ENDEE_BASE_URL = os.getenv("ENDEE_BASE_URL", "http://localhost:8080/api/v1")
+SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", "0.45"))
+
+# Ranked answers (see ranking.py): candidates fetched per question, runners-up
+# returned with the answer, softmax temperature for the calibrated confidence
+# and the top-1 vs top-2 margin below which the runners-up are spelled out.
+ANSWER_CANDIDATES = int(os.getenv("ANSWER_CANDIDATES", "10"))
+ANSWER_ALTERNATIVES = int(os.getenv("ANSWER_ALTERNATIVES", "2"))
+ANSWER_TEMPERATURE = float(os.getenv("ANSWER_TEMPERATURE", "0.05"))
+ANSWER_MIN_MARGIN = float(os.getenv("ANSWER_MIN_MARGIN", "0.05"))
+
+# Cross-encoder rerank of the candidates (see rerank.py). Scores are logits,
+# so ranking uses its own temperature and margin for reranked results.
+RERANK = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "10"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))  # per request, from its start
+RERANK_TEMPERATURE = float(os.getenv("RERANK_TEMPERATURE", "1.0"))
+RERANK_MIN_MARGIN = float(os.getenv("RERANK_MIN_MARGIN", "1.0"))
+
+# Load the embedding model as soon as the process starts instead of on the
+# first chat request (useful with gunicorn --preload, see gunicorn.conf.py).
+PRELOAD_EMBEDDINGS = os.getenv("CHATBOT_PRELOAD_EMBEDDINGS", "0") == "1"
+
+# Query embedding cache (see embedding_cache.py). Set
+# EMBEDDING_CACHE_DJANGO to a Django cache alias (e.g. "default") to share
+# cached vectors between workers.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "32"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+EMBEDDING_CACHE_DJANGO = os.getenv("EMBEDDING_CACHE_DJANGO", "")
+
+# Per-index generation counters, bumped by ingestion (see index_state.py)
+INDEX_STATE_FILE = os.getenv(
+    "INDEX_STATE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_state.json"),
+)
+
+# Full answer cache for the chat endpoint (see response_cache.py)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Micro-batching of concurrent query encodes (see batching.py)
+EMBEDDING_BATCHING = os.getenv("EMBEDDING_BATCHING", "1") == "1"
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+EMBEDDING_BATCH_TIMEOUT = float(os.getenv("EMBEDDING_BATCH_TIMEOUT", "30"))  # seconds
+
+# Crop names present in the index, written by ingestion (see crops.py)
+CROP_VOCAB_FILE = os.getenv(
+    "CROP_VOCAB_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "crop_vocabulary.json"),
+)
+
+# Hybrid dense + sparse (BM25) search (see sparse.py). Requires an index
+# created with --sparse-dim and ingestion run with --sparse.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "0") == "1"
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.7"))  # weight of the dense score
+SPARSE_STATS_FILE = os.getenv(
+    "SPARSE_STATS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "sparse_stats.json"),
+)
+
+# Shared Endee HTTP client (see endee_client.py)
+ENDEE_POOL_SIZE = int(os.getenv("ENDEE_POOL_SIZE", "16"))
+ENDEE_TIMEOUT = (
+    float(os.getenv("ENDEE_CONNECT_TIMEOUT", "2")),
+    float(os.getenv("ENDEE_READ_TIMEOUT", "10")),
+)
+ENDEE_RETRIES = int(os.getenv("ENDEE_RETRIES", "2"))
+ENDEE_BREAKER_THRESHOLD = int(os.getenv("ENDEE_BREAKER_THRESHOLD", "5"))
+ENDEE_BREAKER_RESET = float(os.getenv("ENDEE_BREAKER_RESET", "30"))
+
+# Async chat endpoint (see async_client.py and views.rag_chatbot_async)
+ENDEE_ASYNC_POOL_SIZE = int(os.getenv("ENDEE_ASYNC_POOL_SIZE", "64"))
+ASYNC_ENCODE_WORKERS = int(os.getenv("ASYNC_ENCODE_WORKERS", "4"))
+
+# LLM used by the answer-generating chat paths (see llm.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")  # "fake" for tests
+LLM_MODEL = os.getenv("LLM_MODEL", "tinyllama")   # or "phi"
+# Prompt token budget (see prompt.py); 0 = the known context size of LLM_MODEL
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "0"))
+LLM_ANSWER_TOKENS = int(os.getenv("LLM_ANSWER_TOKENS", "512"))  # reserved for the reply
+
+# Semantic cache of LLM answers (see answer_cache.py)
+ANSWER_CACHE_FILE = os.getenv(
+    "ANSWER_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_cache.sqlite3"),
+)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.1"))  # cosine distance
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Memory-mapped local index used when Endee is unreachable (see local_index.py)
+LOCAL_INDEX_PATH = os.getenv(
+    "LOCAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb"),
+)
+LOCAL_FALLBACK = os.getenv("LOCAL_FALLBACK", "1") == "1"
+
+# Vector store: "endee" (server) or "memory" (in-process, see memory_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "endee")
+MEMORY_INDEX_DIR = os.getenv(
+    "MEMORY_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_index"),
+)
+
+# Per-stage latency metrics (see metrics.py): samples kept per stage for p50/p95/p99
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
@@ -0,0 +1,135 @@
+"""
+crops.py
+
+Crop vocabulary and crop filters for Endee queries.
+
+Ingestion stores `"filter": {"crop": crop}` on every vector. When a
+question names a crop (or the caller passes one explicitly), searching
+only that crop's vectors shrinks the search space and avoids matching a
+similar-sounding disease of another crop.
+
+The vocabulary is written by project/ingest_embeddings.py so it matches
+the crop names actually stored in the index; DEFAULT_CROPS is used until
+the first ingest.
+"""
+
+import json
+import os
+import re
+
+from .config import CROP_VOCAB_FILE, HYBRID_ALPHA
+from .sparse import hybrid_query, hybrid_query_async
+
+DEFAULT_CROPS = [
+    "Apple", "Banana", "Barley", "Corn", "Cotton", "Grape", "Maize", "Mango",
+    "Potato", "Rice", "Soybean", "Sugarcane", "Tomato", "Wheat",
+]
+
+# Other names farmers use for the same crop
+ALIASES = {
+    "paddy": "Rice",
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+_vocab_mtime = None
+_vocab = None
+
+
+def load_vocabulary():
+    """Return {lowercase name: stored crop name}, re-read when the file changes."""
+    global _vocab_mtime, _vocab
+
+    try:
+        mtime = os.stat(CROP_VOCAB_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if _vocab is None or mtime != _vocab_mtime:
+        crops = DEFAULT_CROPS
+        if mtime is not None:
+            with open(CROP_VOCAB_FILE, "r", encoding="utf-8") as f:
+                crops = json.load(f)
+
+        vocab = {crop.lower(): crop for crop in crops}
+        for alias, crop in ALIASES.items():
+            if crop.lower() in vocab:
+                vocab.setdefault(alias, vocab[crop.lower()])
+        _vocab, _vocab_mtime = vocab, mtime
+    return _vocab
+
+
+def save_vocabulary(crops):
+    """Record the crop names present in the index (called by ingestion)."""
+    with open(CROP_VOCAB_FILE, "w", encoding="utf-8") as f:
+        json.dump(sorted(crops), f)
+
+
+def canonical_crop(name):
+    """Map a user supplied crop name to the name stored in the index."""
+    if not name:
+        return None
+    return load_vocabulary().get(name.strip().lower(), name.strip())
+
+
+def detect_crop(question):
+    """
+    Return the crop mentioned in `question`, or None if there is none or
+    more than one crop is mentioned.
+    """
+    vocab = load_vocabulary()
+    found = set()
+
+    for word in _WORD_RE.findall(question.lower()):
+        crop = vocab.get(word)
+        # "tomatoes", "potatoes", "apples"
+        if crop is None and word.endswith("es"):
+            crop = vocab.get(word[:-2])
+        if crop is None and word.endswith("s"):
+            crop = vocab.get(word[:-1])
+        if crop is not None:
+            found.add(crop)
+
+    return found.pop() if len(found) == 1 else None
+
+
+def crop_filter(crop):
+    """Endee filter restricting a query to vectors of `crop`."""
+    return [{"crop": {"$eq": crop}}]
+
+
+def query_for_crop(index, vector, top_k, crop=None, sparse_query=None):
+    """
+    Query `index`, restricted to `crop` when given. Falls back to searching
+    every crop if the filtered search finds nothing (e.g. the crop name is
+    not in the index). With a `sparse_query` the search is hybrid (see
+    sparse.hybrid_query()).
+    """
+    def run(filter=None):
+        if sparse_query is not None:
+            return hybrid_query(index, vector, sparse_query, top_k, filter, HYBRID_ALPHA)
+        if filter:
+            return index.query(vector=vector, top_k=top_k, filter=filter)
+        return index.query(vector=vector, top_k=top_k)
+
+    if crop:
+        results = run(crop_filter(crop))
+        if results:
+            return results
+    return run()
+
+
+async def query_for_crop_async(index, vector, top_k, crop=None, sparse_query=None):
+    """query_for_crop() for an AsyncEndeeIndex."""
+    async def run(filter=None):
+        if sparse_query is not None:
+            return await hybrid_query_async(index, vector, sparse_query, top_k, filter, HYBRID_ALPHA)
+        if filter:
+            return await index.query(vector=vector, top_k=top_k, filter=filter)
+        return await index.query(vector=vector, top_k=top_k)
+
+    if crop:
+        results = await run(crop_filter(crop))
+        if results:
+            return results
+    return await run()
@@ -0,0 +1,150 @@
+"""
+embedding_cache.py
+
+Cache of query embeddings, keyed on the normalized question text.
+
+Farmers ask the same few symptom phrases over and over, so most queries can
+skip the transformer forward pass entirely. Lookups go through two tiers:
+
+    1. an in-process LRU, bounded by entry count, memory and TTL
+    2. optionally a Django cache backend (e.g. Redis or memcached), so
+       workers and restarts share the vectors
+
+Keys include the model name, so vectors from different models never mix.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class EmbeddingCache:
+    """Thread-safe LRU + TTL cache of text -> embedding vector."""
+
+    def __init__(self, model_name, max_entries=2048, max_bytes=32 * 1024 * 1024,
+                 ttl=3600, django_cache_alias=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.django_cache_alias = django_cache_alias
+
+        self._entries = OrderedDict()  # key -> (vector, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    # ------------------------------
+    # Keys
+    # ------------------------------
+    def key(self, text):
+        raw = normalize_text(text).encode("utf-8")
+        digest = hashlib.sha1(raw, usedforsecurity=False).hexdigest()
+        return f"emb:{self.model_name}:{digest}"
+
+    # ------------------------------
+    # Public API
+    # ------------------------------
+    def get(self, text):
+        """Return the cached vector for `text`, or None on a miss."""
+        key = self.key(text)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                self._remove(key)
+
+        shared = self._shared_cache()
+        if shared is not None:
+            vector = shared.get(key)
+            if vector is not None:
+                self._store(key, vector)
+                with self._lock:
+                    self.shared_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, vector):
+        key = self.key(text)
+        self._store(key, vector)
+
+        shared = self._shared_cache()
+        if shared is not None:
+            shared.set(key, vector, self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    # ------------------------------
+    # Internals
+    # ------------------------------
+    def _store(self, key, vector):
+        # Callers get the same array back on every hit; make sure none of
+        # them can modify it in place.
+        vector.setflags(write=False)
+        size = vector.nbytes
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key):
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes
+
+    def _shared_cache(self):
+        if not self.django_cache_alias:
+            return None
+        try:
+            from django.conf import settings
+            from django.core.cache import caches
+
+            if not settings.configured:
+                return None
+            return caches[self.django_cache_alias]
+        except Exception:
+            return None
@@ -0,0 +1,179 @@
+"""
+embeddings.py
+
+Lazy, process-shared embedding model for the chatbot.
+
+The SentenceTransformer is only loaded the first time a vector is needed,
+so Django workers, `manage.py migrate` and other management commands that
+never answer a chat question start without paying for it.
+
+To share one copy of the weights between gunicorn workers, load it in the
+master before forking (see warm_up() and gunicorn.conf.py); forked workers
+then read the same pages copy-on-write.
+
+Query vectors go through an EmbeddingCache first (see encode_query()), so
+repeated questions never reach the model; misses from concurrent requests
+are coalesced into batched forward passes by an EmbeddingBatcher.
+
+Async views use aencode_query(), which awaits the batcher (or a small,
+bounded thread pool when batching is off) instead of blocking the event
+loop on the forward pass.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .batching import EmbeddingBatcher
+from .config import (
+    ASYNC_ENCODE_WORKERS,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_BATCH_TIMEOUT,
+    EMBEDDING_BATCHING,
+    EMBEDDING_CACHE_DJANGO,
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    MODEL_NAME,
+)
+from .embedding_cache import EmbeddingCache
+from .metrics import timed
+
+
+class EmbeddingProvider:
+    """Loads a SentenceTransformer on first use and encodes text with it."""
+
+    def __init__(self, model_name=MODEL_NAME, device=None, cache=None, batcher=None):
+        self.model_name = model_name
+        self.device = device
+        self.cache = cache
+        self.batcher = batcher
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                # Another thread may have loaded it while we waited
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    print(f"Loading embedding model {self.model_name}...")
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def encode(self, text):
+        """Encode a single string. Returns a numpy vector."""
+        return self.encode_queries([text])[0]
+
+    def encode_queries(self, texts):
+        """
+        Encode a few questions in one forward pass. Tokenization and the
+        forward pass are timed separately (the "tokenize" and "forward"
+        stages in metrics.py).
+        """
+        import torch
+        from sentence_transformers.util import batch_to_device
+
+        model = self.model
+        with timed("tokenize"):
+            features = batch_to_device(model.tokenize(list(texts)), model.device)
+        # The copy to the CPU waits for the GPU, so it belongs to the forward pass
+        with timed("forward"), torch.inference_mode():
+            return model.forward(features)["sentence_embedding"].float().cpu().numpy()
+
+    def encode_query(self, text):
+        """Encode a user question, reusing a cached vector when possible."""
+        vector = self.cache.get(text) if self.cache is not None else None
+        if vector is None:
+            if self.batcher is not None:
+                vector = self.batcher.encode(text)
+            else:
+                vector = self.encode(text)
+            if self.cache is not None:
+                self.cache.put(text, vector)
+        return vector
+
+    async def aencode_query(self, text):
+        """Async encode_query(): the forward pass runs off the event loop."""
+        vector = self.cache.get(text) if self.cache is not None else None
+        if vector is None:
+            if self.batcher is not None:
+                vector = await asyncio.wrap_future(self.batcher.submit(text))
+            else:
+                loop = asyncio.get_running_loop()
+                vector = await loop.run_in_executor(get_encode_executor(), self.encode, text)
+            if self.cache is not None:
+                self.cache.put(text, vector)
+        return vector
+
+    def encode_batch(self, texts, batch_size=32):
+        """Encode a list of strings (e.g. a corpus) in batched forward passes."""
+        return self.model.encode(list(texts), batch_size=batch_size)
+
+    def warm_up(self):
+        """Load the model and run one forward pass so the first request is fast."""
+        self.encode("warm up")
+        return self
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(model_name=MODEL_NAME):
+    """Return the process-wide provider for `model_name` (not loaded yet)."""
+    provider = _providers.get(model_name)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(model_name)
+            if provider is None:
+                cache = EmbeddingCache(
+                    model_name,
+                    max_entries=EMBEDDING_CACHE_SIZE,
+                    max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+                    ttl=EMBEDDING_CACHE_TTL,
+                    django_cache_alias=EMBEDDING_CACHE_DJANGO or None,
+                )
+                provider = EmbeddingProvider(model_name, cache=cache)
+                if EMBEDDING_BATCHING:
+                    provider.batcher = EmbeddingBatcher(
+                        provider.encode_queries,
+                        max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+                        max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
+                        timeout=EMBEDDING_BATCH_TIMEOUT,
+                    )
+                _providers[model_name] = provider
+    return provider
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_encode_executor():
+    """Bounded thread pool for encodes from async code (a new one after fork)."""
+    global _executor, _executor_pid
+
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_ENCODE_WORKERS, thread_name_prefix="embedding-encode"
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def warm_up(model_name=MODEL_NAME):
+    """Warm-up hook: load the shared model now instead of on first use."""
+    return get_embedding_provider(model_name).warm_up()
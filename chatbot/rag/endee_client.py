@@ -0,0 +1,322 @@
+"""
+endee_client.py
+
+Pooled, keep-alive HTTP client for the Endee REST API.
+
+Every entry point (Django views, the Flask app in project/, the ingestion
+and benchmark scripts) goes through get_client()/get_index() instead of
+building its own `Endee()` client, so queries reuse persistent
+connections instead of paying TCP setup each time.
+
+    - one requests.Session per process, with a bounded connection pool
+    - connect/read timeouts on every call
+    - retries with exponential backoff for connection errors and 5xx
+    - a circuit breaker: after repeated failures calls fail immediately
+      with EndeeUnavailable for a cool-down period, so a dead server
+      degrades the chatbot gracefully instead of hanging workers
+
+EndeeIndex mirrors the subset of the `endee` SDK index API the project
+uses (query, upsert, delete_vector), returning results in the same shape:
+dicts with "id", "similarity", "meta", "filter" and optionally "vector".
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+
+import msgpack
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import (
+    ENDEE_BASE_URL,
+    ENDEE_BREAKER_RESET,
+    ENDEE_BREAKER_THRESHOLD,
+    ENDEE_POOL_SIZE,
+    ENDEE_RETRIES,
+    ENDEE_TIMEOUT,
+    INDEX_NAME,
+)
+from .metrics import count_endee_error
+
+
+class EndeeError(Exception):
+    """The Endee server rejected a request."""
+
+
+class EndeeUnavailable(EndeeError):
+    """The Endee server can't be reached (or the circuit breaker is open)."""
+
+
+# ==============================
+# Circuit breaker
+# ==============================
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. While open, allow() is
+    False until `reset_timeout` seconds have passed; then one trial call is
+    let through (half-open) and its outcome closes or re-opens the breaker.
+    A trial that ends without an outcome (e.g. it was cancelled) must call
+    release_trial(), or no further trial would ever be let through.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def release_trial(self):
+        """Give up the half-open trial without a verdict; the next call may try again."""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+# ==============================
+# Wire format helpers
+# ==============================
+def encode_meta(meta):
+    return zlib.compress(json.dumps(meta or {}).encode("utf-8"))
+
+
+def decode_meta(raw):
+    if not raw:
+        return {}
+    raw = bytes(raw)
+    try:
+        raw = zlib.decompress(raw)
+    except zlib.error:
+        pass
+    return json.loads(raw)
+
+
+def decode_results(payload):
+    """Turn a msgpack search response into SDK-style result dicts."""
+    results = []
+    for similarity, vector_id, meta, filter_json, norm, vector in msgpack.unpackb(payload, raw=False):
+        result = {
+            "id": vector_id,
+            "similarity": similarity,
+            "meta": decode_meta(meta),
+            "filter": json.loads(filter_json) if filter_json else {},
+            "norm": norm,
+        }
+        if vector:
+            result["vector"] = vector
+        results.append(result)
+    return results
+
+
+def search_body(space_type, vector=None, top_k=10, filter=None, ef=0, include_vectors=False,
+                sparse_indices=None, sparse_values=None):
+    """JSON body for POST /index/<name>/search."""
+    body = {"k": top_k, "include_vectors": include_vectors}
+    if vector is not None:
+        body["vector"] = normalize(vector)[0] if space_type == "cosine" else list(vector)
+    if sparse_indices:
+        body["sparse_indices"] = list(sparse_indices)
+        body["sparse_values"] = list(sparse_values)
+    if filter:
+        body["filter"] = json.dumps(filter)
+    if ef:
+        body["ef"] = ef
+    return body
+
+
+def normalize(vector):
+    """Return (unit vector as list, original norm) for cosine indexes."""
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    if norm > 0:
+        v = v / norm
+    return v.tolist(), norm
+
+
+# ==============================
+# Client
+# ==============================
+class EndeeClient:
+    def __init__(self, base_url=ENDEE_BASE_URL, pool_size=ENDEE_POOL_SIZE, timeout=ENDEE_TIMEOUT,
+                 retries=ENDEE_RETRIES, breaker=None, auth_token=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(ENDEE_BREAKER_THRESHOLD, ENDEE_BREAKER_RESET)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST", "DELETE"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry,
+                              pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if auth_token:
+            self.session.headers["Authorization"] = auth_token
+
+        self._indexes = {}
+
+    def request(self, method, path, **kwargs):
+        if not self.breaker.allow():
+            count_endee_error("circuit_open")
+            raise EndeeUnavailable("Endee circuit breaker is open")
+
+        trial = self.breaker.is_open  # let through as the half-open trial
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            resp = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            count_endee_error("unavailable")
+            raise EndeeUnavailable(str(e)) from e
+        except BaseException:
+            # Interrupted before Endee answered: no verdict on the server
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+        if resp.status_code >= 500:
+            self.breaker.record_failure()
+            count_endee_error("unavailable")
+            raise EndeeUnavailable(f"{resp.status_code}: {resp.text}")
+
+        self.breaker.record_success()
+        if resp.status_code >= 400:
+            count_endee_error("request")
+            raise EndeeError(f"{resp.status_code}: {resp.text}")
+        return resp
+
+    # ------------------------------
+    # Index administration
+    # ------------------------------
+    def create_index(self, name, dimension, space_type="cosine", precision="int8d",
+                     M=None, ef_con=None, sparse_dim=0):
+        body = {"index_name": name, "dim": dimension, "space_type": space_type,
+                "precision": precision}
+        if M is not None:
+            body["M"] = M
+        if ef_con is not None:
+            body["ef_con"] = ef_con
+        if sparse_dim:
+            body["sparse_dim"] = sparse_dim
+        self.request("POST", "/index/create", json=body)
+
+    def list_indexes(self):
+        return self.request("GET", "/index/list").json().get("indexes", [])
+
+    def delete_index(self, name):
+        self._indexes.pop(name, None)
+        self.request("DELETE", f"/index/{name}/delete")
+
+    def index_info(self, name):
+        return self.request("GET", f"/index/{name}/info").json()
+
+    def get_index(self, name=INDEX_NAME):
+        """Return an EndeeIndex handle; raises EndeeError if it doesn't exist."""
+        index = self._indexes.get(name)
+        if index is None:
+            info = self.index_info(name)
+            index = self._indexes[name] = EndeeIndex(self, name, info.get("space_type", "cosine"))
+        return index
+
+
+class EndeeIndex:
+    def __init__(self, client, name, space_type="cosine"):
+        self.client = client
+        self.name = name
+        self.space_type = space_type
+
+    def describe(self):
+        return self.client.index_info(self.name)
+
+    def query(self, vector=None, top_k=10, filter=None, ef=0, include_vectors=False,
+              sparse_indices=None, sparse_values=None):
+        body = search_body(self.space_type, vector, top_k, filter, ef, include_vectors,
+                           sparse_indices, sparse_values)
+        resp = self.client.request("POST", f"/index/{self.name}/search", json=body)
+        return decode_results(resp.content)
+
+    def upsert(self, vectors):
+        objects = []
+        for item in vectors:
+            vector, norm = item["vector"], 1.0
+            if self.space_type == "cosine":
+                vector, norm = normalize(vector)
+            objects.append([
+                str(item["id"]),
+                encode_meta(item.get("meta")),
+                json.dumps(item.get("filter") or {}),
+                norm,
+                list(vector),
+                list(item.get("sparse_indices") or []),
+                list(item.get("sparse_values") or []),
+            ])
+
+        self.client.request(
+            "POST", f"/index/{self.name}/vector/insert",
+            data=msgpack.packb(objects, use_bin_type=True),
+            headers={"Content-Type": "application/msgpack"},
+        )
+
+    def delete_vector(self, vector_id):
+        self.client.request("DELETE", f"/index/{self.name}/vector/{vector_id}/delete")
+
+
+# ==============================
+# Shared instances
+# ==============================
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """Return this process's shared EndeeClient (a new one after fork)."""
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                _client = EndeeClient()
+                _client_pid = pid
+    return _client
+
+
+def get_index(name=INDEX_NAME):
+    return get_client().get_index(name)
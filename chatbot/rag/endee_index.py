@@ -0,0 +1,63 @@
+"""
+endee_index.py
+
+Lazy access to the Endee index used by the chatbot.
+
+Connecting happens on first use rather than at import time, through the
+shared pooled client (see endee_client.py). A missing index or unreachable
+server is reported as None and retried on the next call instead of
+disabling search for the lifetime of the process.
+
+With VECTOR_BACKEND=memory no server is used at all: get_index() returns
+the in-process store written by ingestion (see memory_index.py).
+
+When Endee can't answer, search_with_fallback() searches the memory-mapped
+local index instead (see local_index.py), if one has been built.
+"""
+
+from .config import INDEX_NAME, LOCAL_FALLBACK, VECTOR_BACKEND
+from .crops import query_for_crop
+from .endee_client import EndeeError, EndeeUnavailable, get_client
+from .local_index import get_local_index
+from .memory_index import get_memory_index
+
+
+def get_index(name=INDEX_NAME):
+    """Return the Endee index `name`, or None if it is not available."""
+    if VECTOR_BACKEND == "memory":
+        index = get_memory_index(name)
+        if index is None:
+            print(f"❌ In-memory index {name} not found; run ingest_embeddings.py --memory")
+        return index
+
+    try:
+        return get_client().get_index(name)
+    except EndeeError as e:
+        print(f"❌ Endee index {name} not available: {e}")
+        return None
+
+
+def get_fallback_index():
+    """Return the local index to use while Endee is down, or None."""
+    return get_local_index() if LOCAL_FALLBACK else None
+
+
+def search_with_fallback(index, query_vector, top_k, crop=None, sparse_query=None):
+    """
+    query_for_crop() on the Endee `index`, or on the local index when
+    `index` is None or Endee is unreachable. Raises EndeeError if neither
+    can answer.
+    """
+    if index is not None:
+        try:
+            return query_for_crop(index, query_vector, top_k, crop=crop, sparse_query=sparse_query)
+        except EndeeUnavailable as e:
+            print(f"❌ Endee search failed: {e}")
+
+    local = get_fallback_index()
+    if local is None:
+        raise EndeeUnavailable("Endee is unavailable and no local index is built")
+    # The local index is dense only. Results are marked so degraded answers
+    # are not cached past Endee's recovery (see service.py).
+    results = query_for_crop(local, query_vector, top_k, crop=crop)
+    return [dict(r, fallback=True) for r in results]
@@ -1,54 +1,20 @@
-from sentence_transformers import SentenceTransformer
-from endee import Endee
-
-INDEX_NAME = "crop_diseases"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-SIM_THRESHOLD = 0.45
-
-print("Loading Endee model...")
-embed_model = SentenceTransformer(MODEL_NAME)
-
-print("Connecting to Endee...")
-client = Endee()
-client.set_base_url("http://localhost:8080/api/v1")
-
-index = client.get_index(name=INDEX_NAME)
-
-print("Endee Ready")
-
-
-def get_endee_response(question):
-    if not question or len(question.split()) < 3:
-        return {
-            "reply": "Please describe symptoms clearly (example: rice leaves brown spots)."
-        }
-
-    query_vector = embed_model.encode(question).tolist()
-    results = index.query(vector=query_vector, top_k=1)
-
-    if not results:
-        return {"reply": "No disease information found."}
-
-    best = results[0]
-    score = best["similarity"]
-
-    if score < SIM_THRESHOLD:
-        return {
-            "reply": "I’m not confident. Please provide more detailed symptoms.",
-            "confidence": round(score, 2)
-        }
+"""
+endee_service.py
 
-    meta = best["meta"]
+Function-style entry point to the chat pipeline, kept for scripts that
+call get_endee_response() directly (see service.py for the pipeline).
+"""
 
-    reply = f"""
-Crop: {meta.get('crop')}
-Disease: {meta.get('disease')}
+from .service import RAGService, UNAVAILABLE_REPLY, get_rag_service  # noqa: F401
 
-Details:
-{meta.get('text')}
-"""
 
-    return {
-        "reply": reply,
-        "confidence": round(score, 2)
-    }
+def get_endee_response(question, crop=None, index=None):
+    """
+    Answer `question` from the crop disease index. If `crop` is given, or
+    the question names exactly one known crop, only that crop's vectors
+    are searched. `index` overrides the shared Endee index (e.g. with a
+    LocalIndex in benchmarks); such answers bypass the response cache.
+    """
+    if index is not None:
+        return RAGService(index=index, reranker=get_rag_service().reranker).answer(question, crop)
+    return get_rag_service().answer(question, crop)
@@ -1,41 +1,75 @@
 """
 generate_embeddings.py
 
-Generate embeddings for knowledge base chunks using OpenAI's API.
-Creates FAISS index and pickled knowledge base.
+Generate embeddings for knowledge base chunks.
+Creates a FAISS index and a memory-mapped local index (see local_index.py),
+which the chatbot searches when Endee is unreachable.
+
+Two embedding backends are available (EMBEDDING_BACKEND):
+    - local:  the SentenceTransformer the chatbot uses at query time
+              (MODEL_NAME, 384-dim). Runs offline, and the result is
+              compatible with live queries. This is the default.
+    - openai: OpenAI text-embedding-3-small (1536-dim, needs network)
+
+Embedding is resumable: progress is checkpointed every CHECKPOINT_EVERY
+batches into kb.checkpoint.npy/.json, and a rerun on the same chunks with
+the same backend and batch size continues after the last finished batch.
 
 Prerequisites:
-    - OPENAI_API_KEY environment variable set
     - chunks.txt file created by prepare_chunks.py
     - faiss-cpu installed
+    - for the openai backend: OPENAI_API_KEY environment variable set
 
 Usage (from Django shell):
     python manage.py shell
     exec(open('chatbot/rag/generate_embeddings.py').read())
 
-Or standalone:
-    python generate_embeddings.py
+Or standalone (from the repository root):
+    EMBEDDING_BACKEND=local python chatbot/rag/generate_embeddings.py
 
 Output:
-    - chatbot/rag/kb.index (FAISS index)
-    - chatbot/rag/kb.pkl (pickled knowledge base chunks)
+    - chatbot/rag/kb.index (FAISS index: flat, HNSW or IVF-PQ by corpus
+      size, see FAISS_INDEX_TYPE) and kb.index.report.json (its recall and
+      latency against exact search)
+    - chatbot/rag/kb.vectors.npy, kb.texts.bin, kb.offsets.npy, kb.json
+      (local index: vectors plus chunk records, loaded with mmap)
 """
 
 import os
+import sys
 import json
-import pickle
+import hashlib
+import time
 import numpy as np
-from openai import OpenAI
 import faiss
 
+# Allow importing the chatbot package when run standalone from chatbot/rag/
+sys.path.insert(0, os.getcwd())
+from chatbot.rag.config import MODEL_NAME  # noqa: E402
+from chatbot.rag.local_index import write_local_index  # noqa: E402
+
 # Configuration
 CHUNKS_FILE = 'chatbot/rag/chunks.txt'
 OUTPUT_DIR = 'chatbot/rag'
 KB_INDEX_PATH = os.path.join(OUTPUT_DIR, 'kb.index')
-KB_PKL_PATH = os.path.join(OUTPUT_DIR, 'kb.pkl')
+KB_LOCAL_PATH = os.path.join(OUTPUT_DIR, 'kb')  # local index path prefix
+KB_LOCAL_DTYPE = 'float32'  # or 'float16' to halve the vector file
 
-EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIM = 1536  # Dimension of text-embedding-3-small
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'local')  # 'local' or 'openai'
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"  # 1536-dim
+BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+CHECKPOINT_EVERY = int(os.getenv('CHECKPOINT_EVERY', '10'))  # batches between checkpoints
+CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, 'kb.checkpoint')  # .npy + .json
+
+# FAISS index type: 'auto' (by corpus size), 'flat', 'hnsw' or 'ivfpq'
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'auto')
+FLAT_MAX_VECTORS = 10_000     # auto: exact search below this size
+HNSW_MAX_VECTORS = 1_000_000  # auto: HNSW below this size, IVF-PQ above
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+KB_REPORT_PATH = os.path.join(OUTPUT_DIR, 'kb.index.report.json')
 
 
 def load_chunks():
@@ -48,82 +82,258 @@ def load_chunks():
         for line in f:
             if line.strip():
                 chunk = json.loads(line.strip())
+                # Older chunk files hold plain strings
+                if isinstance(chunk, str):
+                    chunk = {'text': chunk, 'source': None, 'section': None}
                 chunks.append(chunk)
     
     print(f"✓ Loaded {len(chunks)} chunks")
     return chunks
 
 
-def generate_embeddings(chunks):
+def chunks_fingerprint():
+    """Hash of the chunks file, so a checkpoint is only reused for the same input."""
+    digest = hashlib.sha1(usedforsecurity=False)
+    with open(CHUNKS_FILE, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_backend(backend=EMBEDDING_BACKEND):
     """
-    Generate embeddings for all chunks using OpenAI API.
-    Handles batch processing for efficiency.
+    Return (model name, dimension, embed function). The embed function maps
+    a list of texts to a float32 array with one row per text.
     """
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY environment variable not set")
-    
-    client = OpenAI(api_key=api_key)
-    
-    print(f"\nGenerating embeddings for {len(chunks)} chunks...")
-    embeddings = []
-    batch_size = 100  # Process 100 chunks per API call
-    
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (len(chunks) + batch_size - 1) // batch_size
-        
-        print(f"  Batch {batch_num}/{total_batches}...", end='', flush=True)
-        
-        try:
-            response = client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=batch
-            )
-            
+    if backend == 'local':
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(MODEL_NAME)
+
+        def embed(texts):
+            return model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+
+        return MODEL_NAME, model.get_sentence_embedding_dimension(), embed
+
+    if backend == 'openai':
+        from openai import OpenAI
+
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set")
+        client = OpenAI(api_key=api_key)
+
+        def embed(texts):
+            response = client.embeddings.create(model=OPENAI_EMBEDDING_MODEL, input=texts)
             # Extract embeddings in order
-            batch_embeddings = [item.embedding for item in response.data]
-            embeddings.extend(batch_embeddings)
+            return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+        return OPENAI_EMBEDDING_MODEL, 1536, embed
+
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def open_checkpoint(model_name, n, dim, fingerprint, batch_size):
+    """
+    Return (embeddings memmap, state) for this run, resuming a matching
+    checkpoint if there is one.
+    """
+    state = {
+        'model': model_name, 'count': n, 'dim': dim,
+        'chunks': fingerprint, 'batch_size': batch_size, 'done_batches': 0,
+    }
+    vectors_path = CHECKPOINT_PATH + '.npy'
+    state_path = CHECKPOINT_PATH + '.json'
+
+    if os.path.exists(state_path) and os.path.exists(vectors_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if {k: v for k, v in saved.items() if k != 'done_batches'} == \
+                {k: v for k, v in state.items() if k != 'done_batches'}:
+            print(f"↻ Resuming from checkpoint: {saved['done_batches']} batches already done")
+            return np.load(vectors_path, mmap_mode='r+'), saved
+        print("⚠ Checkpoint is for different chunks or settings; starting over")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    vectors = np.lib.format.open_memmap(vectors_path, mode='w+', dtype=np.float32, shape=(n, dim))
+    return vectors, state
+
+
+def save_checkpoint(vectors, state):
+    vectors.flush()
+    tmp_path = CHECKPOINT_PATH + '.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, CHECKPOINT_PATH + '.json')
+
+
+def remove_checkpoint():
+    for suffix in ('.npy', '.json'):
+        if os.path.exists(CHECKPOINT_PATH + suffix):
+            os.remove(CHECKPOINT_PATH + suffix)
+
+
+def generate_embeddings(chunks, backend=EMBEDDING_BACKEND, batch_size=BATCH_SIZE,
+                        checkpoint_every=CHECKPOINT_EVERY):
+    """
+    Generate embeddings for all chunks in batches, checkpointing progress
+    so an interrupted run can continue where it stopped.
+    Returns (model name, embeddings array).
+    """
+    model_name, dim, embed = load_backend(backend)
+    total_batches = (len(chunks) + batch_size - 1) // batch_size
+
+    vectors, state = open_checkpoint(model_name, len(chunks), dim, chunks_fingerprint(), batch_size)
+
+    print(f"\nGenerating {backend} embeddings ({model_name}) for {len(chunks)} chunks...")
+    for batch_num in range(state['done_batches'], total_batches):
+        i = batch_num * batch_size
+        batch = [chunk['text'] for chunk in chunks[i:i + batch_size]]
+
+        print(f"  Batch {batch_num + 1}/{total_batches}...", end='', flush=True)
+        try:
+            vectors[i:i + len(batch)] = embed(batch)
             print(" ✓")
         except Exception as e:
             print(f" ✗ Error: {e}")
+            save_checkpoint(vectors, state)
             raise
-    
-    # Convert to numpy array
-    embeddings_array = np.array(embeddings, dtype=np.float32)
-    print(f"\n✓ Generated {len(embeddings)} embeddings")
+
+        state['done_batches'] = batch_num + 1
+        if state['done_batches'] % checkpoint_every == 0:
+            save_checkpoint(vectors, state)
+
+    save_checkpoint(vectors, state)
+
+    # Load into memory; the checkpoint files are removed once everything is saved
+    embeddings_array = np.array(vectors, dtype=np.float32)
+    del vectors
+    print(f"\n✓ Generated {len(embeddings_array)} embeddings")
     print(f"  Embedding shape: {embeddings_array.shape}")
-    
-    return embeddings_array
 
+    return model_name, embeddings_array
+
+
+def choose_index_type(n):
+    """Exact search is fast enough for small corpora; go approximate as they grow."""
+    if n < FLAT_MAX_VECTORS:
+        return 'flat'
+    if n < HNSW_MAX_VECTORS:
+        return 'hnsw'
+    return 'ivfpq'
+
+
+def pq_subquantizers(dim):
+    """Largest PQ code size (sub-quantizers) dividing `dim` with >= 8 dims each."""
+    for m in range(dim // 8, 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def create_faiss_index(embeddings, index_type=FAISS_INDEX_TYPE):
+    """
+    Create (and, for IVF-PQ, train) a FAISS index over unit-normalized
+    embeddings scored by inner product, i.e. cosine similarity as used
+    online by Endee.
+    """
+    n, dim = embeddings.shape
+    if index_type == 'auto':
+        index_type = choose_index_type(n)
+    print(f"\nCreating FAISS {index_type} index...")
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).copy()
+    faiss.normalize_L2(embeddings)
+
+    if index_type == 'flat':
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == 'ivfpq':
+        # ~4 * sqrt(n) lists, keeping >= 39 training points per list
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_subquantizers(dim), 8,
+                                 faiss.METRIC_INNER_PRODUCT)
+        print(f"  Training IVF-PQ ({nlist} lists)...")
+        index.train(embeddings)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type}")
 
-def create_faiss_index(embeddings):
-    """Create and train FAISS index."""
-    print(f"\nCreating FAISS index...")
-    
-    # Create L2 index (Euclidean distance)
-    index = faiss.IndexFlatL2(EMBEDDING_DIM)
-    
     # Add embeddings to index
     index.add(embeddings)
-    
+
     print(f"✓ FAISS index created with {index.ntotal} vectors")
     return index
 
 
-def save_index_and_kb(index, chunks):
-    """Save FAISS index and knowledge base to disk."""
+def evaluate_faiss_index(index, embeddings, k=10, n_queries=200, seed=0):
+    """
+    Compare `index` with exact (flat) inner-product search: recall@k and
+    per-query latency of both, using perturbed corpus vectors as queries.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).copy()
+    faiss.normalize_L2(embeddings)
+    n, dim = embeddings.shape
+    k = min(k, n)
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(n_queries, n), replace=False)
+    queries = embeddings[picks] + rng.normal(scale=0.05, size=(len(picks), dim)).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    flat = faiss.IndexFlatIP(dim)
+    flat.add(embeddings)
+
+    def timed_search(idx):
+        latencies, found = [], []
+        for q in queries:
+            started = time.perf_counter()
+            _, ids = idx.search(q[None, :], k)
+            latencies.append(time.perf_counter() - started)
+            found.append(ids[0])
+        return 1000.0 * np.array(latencies), found
+
+    flat_ms, truth = timed_search(flat)
+    index_ms, found = timed_search(index)
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+
+    report = {
+        'index': type(index).__name__,
+        'vectors': n,
+        'queries': len(queries),
+        f'recall@{k}': float(recall),
+        'flat_p50_ms': float(np.percentile(flat_ms, 50)),
+        'flat_p99_ms': float(np.percentile(flat_ms, 99)),
+        'index_p50_ms': float(np.percentile(index_ms, 50)),
+        'index_p99_ms': float(np.percentile(index_ms, 99)),
+    }
+
+    print(f"\nFAISS {report['index']} vs flat baseline ({len(queries)} queries):")
+    print(f"  recall@{k}: {recall:.3f}")
+    print(f"  latency p50/p99: {report['index_p50_ms']:.3f}/{report['index_p99_ms']:.3f} ms "
+          f"(flat {report['flat_p50_ms']:.3f}/{report['flat_p99_ms']:.3f} ms)")
+    return report
+
+
+def save_index_and_kb(index, embeddings, chunks, model_name, report=None):
+    """Save FAISS index and the local index (vectors + chunk records) to disk."""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     # Save FAISS index
     faiss.write_index(index, KB_INDEX_PATH)
     print(f"✓ Saved FAISS index to {KB_INDEX_PATH}")
+    if report is not None:
+        with open(KB_REPORT_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Saved FAISS recall/latency report to {KB_REPORT_PATH}")
     
-    # Save knowledge base (chunks) as pickle
-    with open(KB_PKL_PATH, 'wb') as f:
-        pickle.dump(chunks, f)
-    print(f"✓ Saved knowledge base to {KB_PKL_PATH}")
+    # Save knowledge base as a memory-mappable local index
+    write_local_index(KB_LOCAL_PATH, embeddings, chunks, dtype=KB_LOCAL_DTYPE, model=model_name)
+    print(f"✓ Saved knowledge base to {KB_LOCAL_PATH}.*")
 
 
 def main():
@@ -135,17 +345,19 @@ def main():
         chunks = load_chunks()
         
         # Step 2: Generate embeddings
-        embeddings = generate_embeddings(chunks)
+        model_name, embeddings = generate_embeddings(chunks)
         
-        # Step 3: Create FAISS index
+        # Step 3: Create FAISS index and compare it with exact search
         index = create_faiss_index(embeddings)
+        report = evaluate_faiss_index(index, embeddings)
         
         # Step 4: Save files
-        save_index_and_kb(index, chunks)
+        save_index_and_kb(index, embeddings, chunks, model_name, report)
+        remove_checkpoint()
         
         print("\n✓ Embedding generation complete!")
         print(f"  Index: {KB_INDEX_PATH}")
-        print(f"  Knowledge Base: {KB_PKL_PATH}")
+        print(f"  Knowledge Base: {KB_LOCAL_PATH}.*")
         print("\nYou can now use the chatbot!")
         return True
     
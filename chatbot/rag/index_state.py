@@ -0,0 +1,69 @@
+"""
+index_state.py
+
+Generation counter for each Endee index.
+
+Ingestion bumps the counter after every successful upsert. Caches that
+depend on the index contents (see response_cache.py) include the current
+generation in their keys, so they are invalidated automatically when the
+knowledge base changes, even across processes.
+
+The counters live in a small JSON file; readers only re-read it when its
+modification time changes.
+"""
+
+import json
+import os
+import tempfile
+import threading
+
+from .config import INDEX_NAME, INDEX_STATE_FILE
+
+_lock = threading.Lock()
+_cached_mtime = None
+_cached_state = {}
+
+
+def _read_state():
+    global _cached_mtime, _cached_state
+
+    try:
+        mtime = os.stat(INDEX_STATE_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    if mtime != _cached_mtime:
+        with _lock:
+            try:
+                with open(INDEX_STATE_FILE, "r", encoding="utf-8") as f:
+                    _cached_state = json.load(f)
+            except (OSError, ValueError):
+                _cached_state = {}
+            _cached_mtime = mtime
+    return _cached_state
+
+
+def get_generation(index_name=INDEX_NAME):
+    """Return the current generation of `index_name` (0 if never ingested)."""
+    return _read_state().get(index_name, 0)
+
+
+def bump_generation(index_name=INDEX_NAME):
+    """Increment the generation of `index_name` and return the new value."""
+    with _lock:
+        state = {}
+        if os.path.exists(INDEX_STATE_FILE):
+            with open(INDEX_STATE_FILE, "r", encoding="utf-8") as f:
+                state = json.load(f)
+
+        state[index_name] = state.get(index_name, 0) + 1
+
+        # Write to a temp file and rename, so readers never see half a file
+        directory = os.path.dirname(INDEX_STATE_FILE) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, INDEX_STATE_FILE)
+
+    return state[index_name]
@@ -0,0 +1,72 @@
+"""
+llm.py
+
+Streaming access to the answer-generating LLM.
+
+Every backend exposes stream(prompt), a generator yielding text pieces as
+the model produces them, so callers can forward the first tokens to the
+user instead of waiting for the whole completion.
+
+    OllamaLLM   a local model served by Ollama (tinyllama, phi, ...)
+    FakeLLM     canned, deterministic output with no model at all, for
+                tests and for running the chat paths without Ollama
+
+Select the backend with LLM_BACKEND ("ollama" or "fake").
+"""
+
+import time
+
+from .config import LLM_BACKEND, LLM_MODEL
+
+
+class OllamaLLM:
+    def __init__(self, model=LLM_MODEL):
+        self.model = model
+
+    def stream(self, prompt):
+        import ollama
+
+        chunks = ollama.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        )
+        for chunk in chunks:
+            content = chunk["message"]["content"]
+            if content:
+                yield content
+
+    def complete(self, prompt):
+        return "".join(self.stream(prompt))
+
+
+class FakeLLM:
+    """Streams `reply` word by word, `delay` seconds apart."""
+
+    def __init__(self, model="fake", reply=None, delay=0.0):
+        self.model = model
+        self.reply = reply
+        self.delay = delay
+        self.prompts = []
+
+    def stream(self, prompt):
+        self.prompts.append(prompt)
+        reply = self.reply
+        if reply is None:
+            reply = f"Answer based on {len(prompt.split())} prompt words."
+
+        for i, word in enumerate(reply.split(" ")):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+    def complete(self, prompt):
+        return "".join(self.stream(prompt))
+
+
+def get_llm(backend=LLM_BACKEND, model=LLM_MODEL):
+    if backend == "ollama":
+        return OllamaLLM(model)
+    if backend == "fake":
+        return FakeLLM(model)
+    raise ValueError(f"Unknown LLM backend: {backend}")
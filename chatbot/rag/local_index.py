@@ -0,0 +1,235 @@
+"""
+local_index.py
+
+Memory-mapped local vector index, used when Endee can't be reached.
+
+An index is four files sharing a path prefix:
+
+    <prefix>.vectors.npy   (n, dim) float32 or float16, rows unit-normalized
+    <prefix>.texts.bin     UTF-8 JSON records, concatenated
+    <prefix>.offsets.npy   (n + 1,) int64 byte offsets into texts.bin
+    <prefix>.json          model name, dimension, dtype and count
+
+Loading only maps the files, so it takes milliseconds regardless of corpus
+size and allocates nothing up front. Every worker process maps the same
+files and shares one copy through the OS page cache. Records are decoded
+only for the rows a query returns.
+
+LocalIndex.query() takes the same arguments as EndeeIndex.query() and
+returns results in the same shape, so it can stand in for Endee (see
+endee_index.search_with_fallback()). Search is exact cosine similarity,
+unless faiss is installed and generate_embeddings.py left an
+inner-product FAISS index (HNSW or IVF-PQ for large corpora) at
+<prefix>.index; then unfiltered queries use it for candidates and the
+candidates are rescored exactly from the memory-mapped vectors.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from .config import LOCAL_INDEX_PATH, MODEL_NAME
+
+BLOCK_ROWS = 65536  # rows scored per step, bounds temporary memory
+
+
+class LocalIndex:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(f"{prefix}.json", "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+
+        self.vectors = np.load(f"{prefix}.vectors.npy", mmap_mode="r")
+        self.offsets = np.load(f"{prefix}.offsets.npy", mmap_mode="r")
+        with open(f"{prefix}.texts.bin", "rb") as f:
+            # mmap can't map an empty file
+            self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        self.ann = _load_faiss_index(f"{prefix}.index", len(self))
+
+    @property
+    def model(self):
+        return self.info.get("model")
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def record(self, i):
+        return json.loads(self._texts[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def scores(self, vector):
+        """Cosine similarity of `vector` to every row."""
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32, copy=False) @ q
+        return out
+
+    def query(self, vector=None, top_k=10, filter=None, ef=0, include_vectors=False,
+              sparse_indices=None, sparse_values=None):
+        # Dense only: sparse-only queries find nothing here
+        if vector is None or not len(self):
+            return []
+
+        if self.ann is not None and not filter:
+            ranked, scores = self._ann_search(vector, top_k)
+        else:
+            scores = self.scores(vector)
+            ranked = _ranked(scores, top_k if not filter else len(scores))
+
+        results = []
+        for i in ranked:
+            record = self.record(i)
+            if filter and not matches_filter(record.get("filter") or record, filter):
+                continue
+
+            result = {
+                "id": str(record.get("id", i)),
+                "similarity": float(scores[i]),
+                "meta": record,
+                "filter": record.get("filter") or {},
+            }
+            if include_vectors:
+                result["vector"] = self.vectors[i].astype(np.float32).tolist()
+            results.append(result)
+            if len(results) == top_k:
+                break
+        return results
+
+    def _ann_search(self, vector, top_k):
+        """Candidates from the FAISS index, rescored exactly."""
+        q = np.array(vector, dtype=np.float32).reshape(1, -1)  # a copy: normalized in place
+        q /= np.linalg.norm(q) or 1.0
+        _, ids = self.ann.search(q, top_k)
+        ids = ids[0][ids[0] >= 0]
+
+        scores = {}
+        for i in ids:
+            scores[int(i)] = float(self.vectors[i].astype(np.float32) @ q[0])
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return ranked, scores
+
+
+def _load_faiss_index(path, count):
+    """The FAISS index at `path` if it can be used for cosine search, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        import faiss
+    except ImportError:
+        return None
+
+    index = faiss.read_index(path)
+    # Older kb.index files are L2 over unnormalized vectors
+    if index.metric_type != faiss.METRIC_INNER_PRODUCT or index.ntotal != count:
+        return None
+    return index
+
+
+def _ranked(scores, k):
+    """Indices of the `k` highest scores, best first."""
+    k = min(k, len(scores))
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def matches_filter(fields, filter):
+    """Evaluate an Endee-style filter: [{"field": {"$eq": v}}, {"field": {"$in": [...]}}]."""
+    for clause in filter:
+        for field, condition in clause.items():
+            value = fields.get(field)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+    return True
+
+
+# ==============================
+# Writing
+# ==============================
+def record_id(record):
+    """Content hash of a record without an id (e.g. a prepare_chunks.py chunk)."""
+    key = "\x1f".join(str(record.get(k) or "") for k in ("source", "section", "text"))
+    return hashlib.sha1(key.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def write_local_index(prefix, vectors, records, dtype="float32", model=MODEL_NAME):
+    """
+    Write `vectors` (n, dim) and one JSON-serializable record per row as a
+    local index at `prefix`. Files are replaced atomically, metadata last,
+    so readers never see a half-written index.
+    """
+    vectors = np.asarray(vectors)
+    n, dim = vectors.shape
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+
+    tmp_vectors = f"{prefix}.vectors.tmp.npy"
+    out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=dtype, shape=(n, dim))
+    for start in range(0, n, BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        out[start:start + len(block)] = block / np.where(norms > 0, norms, 1.0)
+    out.flush()
+    del out
+
+    offsets = [0]
+    with open(f"{prefix}.texts.tmp", "wb") as f:
+        for record in records:
+            if "id" not in record:
+                # Ids name content (see answer_cache.py), never row positions
+                record = dict(record, id=record_id(record))
+            raw = json.dumps(record, ensure_ascii=False).encode("utf-8")
+            f.write(raw)
+            offsets.append(offsets[-1] + len(raw))
+    if len(offsets) != n + 1:
+        raise ValueError(f"{n} vectors but {len(offsets) - 1} records")
+    np.save(f"{prefix}.offsets.tmp.npy", np.asarray(offsets, dtype=np.int64))
+
+    os.replace(tmp_vectors, f"{prefix}.vectors.npy")
+    os.replace(f"{prefix}.texts.tmp", f"{prefix}.texts.bin")
+    os.replace(f"{prefix}.offsets.tmp.npy", f"{prefix}.offsets.npy")
+
+    info = {"model": model, "dim": dim, "dtype": np.dtype(dtype).name, "count": n}
+    with open(f"{prefix}.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    os.replace(f"{prefix}.json.tmp", f"{prefix}.json")
+
+
+# ==============================
+# Shared instance
+# ==============================
+_index = None
+_index_mtime = None
+
+
+def get_local_index(prefix=LOCAL_INDEX_PATH, model=MODEL_NAME):
+    """
+    Return the local index at `prefix` (re-mapped after it is rebuilt), or
+    None if there is none or it was built with a different embedding model.
+    """
+    global _index, _index_mtime
+
+    try:
+        mtime = os.stat(f"{prefix}.json").st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if _index is None or mtime != _index_mtime:
+        index = LocalIndex(prefix)
+        if index.model != model:
+            print(f"⚠ Local index {prefix} was built with {index.model}, not {model}; ignoring it")
+            index = None
+        _index, _index_mtime = index, mtime
+    return _index
@@ -0,0 +1,225 @@
+"""
+memory_index.py
+
+In-process exact-search vector store implementing the part of the Endee
+index API the project uses (upsert, query, delete_vector, describe).
+
+Vectors live in one contiguous float32 matrix, unit-normalized for cosine
+indexes, so a query is a single matrix-vector product followed by an
+argpartition top-k: well under a millisecond for thousands of chunks.
+Results have the same shape as EndeeIndex.query() results.
+
+Run the chatbot with VECTOR_BACKEND=memory to use it instead of an Endee
+server (tests, small single-machine farms). The store is persisted under
+MEMORY_INDEX_DIR by project/ingest_embeddings.py --memory and reloaded by
+get_memory_index() when it changes.
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from .config import MEMORY_INDEX_DIR
+from .local_index import matches_filter
+
+
+class InMemoryIndex:
+    def __init__(self, name="memory", dim=None, space_type="cosine"):
+        if space_type not in ("cosine", "ip"):
+            raise ValueError(f"Unsupported space type for the in-memory index: {space_type}")
+        self.name = name
+        self.dim = dim
+        self.space_type = space_type
+
+        self._vectors = np.empty((0, dim or 0), dtype=np.float32)
+        self._count = 0
+        self._ids = []
+        self._rows = {}  # id -> row
+        self._meta = []
+        self._filters = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def describe(self):
+        return {"name": self.name, "dimension": self.dim, "space_type": self.space_type,
+                "total_elements": self._count}
+
+    # ------------------------------
+    # Writes
+    # ------------------------------
+    def upsert(self, vectors):
+        with self._lock:
+            for item in vectors:
+                vector = np.asarray(item["vector"], dtype=np.float32).ravel()
+                if self.dim is None:
+                    self.dim = len(vector)
+                    self._vectors = np.empty((0, self.dim), dtype=np.float32)
+                if len(vector) != self.dim:
+                    raise ValueError(f"Expected {self.dim}-dim vector, got {len(vector)}")
+                if self.space_type == "cosine":
+                    vector = _unit(vector)
+
+                vector_id = str(item["id"])
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = self._append_row()
+                    self._rows[vector_id] = row
+                    self._ids.append(vector_id)
+                    self._meta.append(None)
+                    self._filters.append(None)
+
+                self._vectors[row] = vector
+                self._meta[row] = item.get("meta") or {}
+                self._filters[row] = item.get("filter") or {}
+
+    def delete_vector(self, vector_id):
+        with self._lock:
+            row = self._rows.pop(str(vector_id), None)
+            if row is None:
+                return
+            # Move the last row into the hole to keep the matrix dense
+            last = self._count - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._meta[row] = self._meta[last]
+                self._filters[row] = self._filters[last]
+                self._rows[self._ids[row]] = row
+            self._ids.pop()
+            self._meta.pop()
+            self._filters.pop()
+            self._count -= 1
+
+    def _append_row(self):
+        if self._count == len(self._vectors):
+            grown = np.empty((max(64, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+        self._count += 1
+        return self._count - 1
+
+    # ------------------------------
+    # Search
+    # ------------------------------
+    def query(self, vector=None, top_k=10, filter=None, ef=0, include_vectors=False,
+              sparse_indices=None, sparse_values=None):
+        # Dense only: sparse-only queries find nothing here
+        if vector is None:
+            return []
+
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        if self.space_type == "cosine":
+            q = _unit(q)
+
+        with self._lock:
+            n = self._count
+            if not n:
+                return []
+            scores = self._vectors[:n] @ q
+
+            candidates = n
+            if filter:
+                mask = np.fromiter((matches_filter(f, filter) for f in self._filters), bool, n)
+                candidates = int(mask.sum())
+                scores = np.where(mask, scores, -np.inf)
+
+            k = min(top_k, candidates)
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+            top = top[np.argsort(-scores[top], kind="stable")][:k]
+
+            results = []
+            for row in top:
+                result = {
+                    "id": self._ids[row],
+                    "similarity": float(scores[row]),
+                    "meta": self._meta[row],
+                    "filter": self._filters[row],
+                }
+                if include_vectors:
+                    result["vector"] = self._vectors[row].tolist()
+                results.append(result)
+            return results
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def save(self, prefix):
+        """Write <prefix>.vectors.npy and <prefix>.records.json atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        with self._lock:
+            vectors = self._vectors[:self._count].copy()
+            records = {
+                "name": self.name, "dim": self.dim, "space_type": self.space_type,
+                "ids": list(self._ids), "meta": list(self._meta), "filters": list(self._filters),
+            }
+
+        with open(f"{prefix}.vectors.tmp.npy", "wb") as f:
+            np.save(f, vectors)
+        with open(f"{prefix}.records.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        os.replace(f"{prefix}.vectors.tmp.npy", f"{prefix}.vectors.npy")
+        # Records last: readers reload when this file changes
+        os.replace(f"{prefix}.records.json.tmp", f"{prefix}.records.json")
+
+    @classmethod
+    def load(cls, prefix, name=None, dim=None, space_type="cosine"):
+        """Load a saved store, or return an empty one if there is none."""
+        if not os.path.exists(f"{prefix}.records.json"):
+            return cls(name or os.path.basename(prefix), dim, space_type)
+
+        with open(f"{prefix}.records.json", "r", encoding="utf-8") as f:
+            records = json.load(f)
+        index = cls(records["name"], records["dim"], records["space_type"])
+        vectors = np.load(f"{prefix}.vectors.npy")
+        if len(vectors) != len(records["ids"]):
+            raise ValueError(f"{prefix}: {len(vectors)} vectors but {len(records['ids'])} records")
+
+        index._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index._count = len(vectors)
+        index._ids = records["ids"]
+        index._rows = {vector_id: row for row, vector_id in enumerate(index._ids)}
+        index._meta = records["meta"]
+        index._filters = records["filters"]
+        return index
+
+
+def _unit(v):
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
+
+
+# ==============================
+# Shared instances
+# ==============================
+_indexes = {}  # name -> (index, mtime)
+_indexes_lock = threading.Lock()
+
+
+def memory_index_path(name):
+    return os.path.join(MEMORY_INDEX_DIR, name)
+
+
+def get_memory_index(name):
+    """
+    Return the persisted in-memory index `name` (reloaded after ingestion
+    rewrites it), or None if it has not been created.
+    """
+    prefix = memory_index_path(name)
+    try:
+        mtime = os.stat(f"{prefix}.records.json").st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _indexes.get(name)
+    if cached is None or cached[1] != mtime:
+        with _indexes_lock:
+            cached = _indexes.get(name)
+            if cached is None or cached[1] != mtime:
+                cached = _indexes[name] = (InMemoryIndex.load(prefix), mtime)
+    return cached[0]
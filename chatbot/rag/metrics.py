@@ -0,0 +1,144 @@
+"""
+metrics.py
+
+Per-stage timings and error counts for the chat pipeline, rendered in the
+Prometheus text exposition format (served at /chat/metrics/).
+
+RAGService times each stage of a request with timed():
+
+    check    question validation and the sparse (BM25) query terms
+    encode   query embedding end to end: embedding cache lookup, wait
+             for a batch, tokenization and the forward pass
+    search   Endee search, or the fallback index while Endee is down
+    rerank   cross-encoder rerank (RERANK=1)
+    format   ranking and reply formatting
+    total    the whole answer, response cache hits included
+
+The embedding model adds the parts of "encode" that run the model:
+
+    batch_queue  time a question waited for its batch (EMBEDDING_BATCHING=1)
+    tokenize     model tokenization of the batch
+    forward      the forward pass
+
+Each stage keeps a count, a sum and the last METRICS_WINDOW samples, from
+which p50/p95/p99 are computed at scrape time and exported as a summary.
+Endee client errors are counted by kind as they are raised.
+
+Everything here is per process: with several gunicorn workers each one
+reports its own numbers, so scrape them individually or read them as a
+sample of the whole.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .config import METRICS_WINDOW
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencySummary:
+    """Count, sum and a sliding window of recent samples, in seconds."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            self._samples.append(seconds)
+
+    def snapshot(self):
+        """Return (count, sum, {quantile: seconds}) over the recent window."""
+        with self._lock:
+            count, total, samples = self.count, self.sum, sorted(self._samples)
+        quantiles = {}
+        if samples:
+            for q in QUANTILES:
+                quantiles[q] = samples[min(len(samples) - 1, int(q * len(samples)))]
+        return count, total, quantiles
+
+
+_stages = {}  # stage -> LatencySummary
+_errors = {}  # kind -> count
+_lock = threading.Lock()
+
+
+def observe(stage, seconds):
+    summary = _stages.get(stage)
+    if summary is None:
+        with _lock:
+            summary = _stages.setdefault(stage, LatencySummary())
+    summary.observe(seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Record the time spent in the `with` block under `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def count_endee_error(kind):
+    """Count one Endee client error: "unavailable", "circuit_open" or "request"."""
+    with _lock:
+        _errors[kind] = _errors.get(kind, 0) + 1
+
+
+# ==============================
+# Exposition
+# ==============================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(caches=None):
+    """
+    All metrics in the Prometheus text format. `caches` maps a cache name
+    to an object with stats() returning hits, misses and hit_ratio (the
+    embedding cache's shared_hits count as hits).
+    """
+    lines = [
+        "# HELP chatbot_stage_seconds Time spent in each stage of a chat request.",
+        "# TYPE chatbot_stage_seconds summary",
+    ]
+    for stage, summary in sorted(_stages.items()):
+        count, total, quantiles = summary.snapshot()
+        label = f'stage="{_escape(stage)}"'
+        for q, seconds in quantiles.items():
+            lines.append(f'chatbot_stage_seconds{{{label},quantile="{q}"}} {seconds:.6f}')
+        lines.append(f"chatbot_stage_seconds_sum{{{label}}} {total:.6f}")
+        lines.append(f"chatbot_stage_seconds_count{{{label}}} {count}")
+
+    cache_stats = {name: cache.stats() for name, cache in (caches or {}).items()
+                   if cache is not None}
+    for metric, kind, help_text, value in (
+        ("chatbot_cache_hits_total", "counter", "Cache lookups answered from the cache.",
+         lambda s: s["hits"] + s.get("shared_hits", 0)),
+        ("chatbot_cache_misses_total", "counter", "Cache lookups that missed.",
+         lambda s: s["misses"]),
+        ("chatbot_cache_hit_ratio", "gauge", "Share of cache lookups that hit.",
+         lambda s: round(s["hit_ratio"], 6)),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, stats in sorted(cache_stats.items()):
+            lines.append(f'{metric}{{cache="{_escape(name)}"}} {value(stats)}')
+
+    lines.append("# HELP chatbot_endee_errors_total Endee client errors by kind.")
+    lines.append("# TYPE chatbot_endee_errors_total counter")
+    with _lock:
+        errors = sorted(_errors.items())
+    for kind, count in errors:
+        lines.append(f'chatbot_endee_errors_total{{kind="{_escape(kind)}"}} {count}')
+
+    return "\n".join(lines) + "\n"
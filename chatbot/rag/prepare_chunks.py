@@ -2,101 +2,175 @@
 prepare_chunks.py
 
 Prepare knowledge base chunks from source documents.
-This script reads source files and creates text chunks with overlap.
+This script streams source files and splits them into chunks along
+heading and sentence boundaries, sized in tokens of the embedding model.
 
-Usage:
-    python manage.py shell < prepare_chunks.py
+    - a Markdown heading always starts a new chunk, and every chunk records
+      the source name and its section path ("Guide > Setup > Install")
+    - sentences (and list items) are never cut in half; a sentence longer
+      than the whole budget is split on word boundaries
+    - chunks are at most CHUNK_TOKENS tokens of the embedding model's own
+      tokenizer, so nothing is silently truncated when embedded
+    - files are read line by line and chunks are written as they are
+      produced, so source size is not limited by memory
+
+Usage (from the repository root):
+    python -m chatbot.rag.prepare_chunks
 
 Output:
-    Saves chunks to chatbot/rag/chunks.txt (one chunk per line)
+    Saves chunks to chatbot/rag/chunks.txt, one JSON object per line:
+    {"text": ..., "source": ..., "section": ..., "chunk": n}
 """
 
 import os
+import re
 import json
 
+from chatbot.rag.config import MODEL_NAME
+from chatbot.rag.embeddings import get_embedding_provider
+
 # Configure these paths
 SOURCE_FILES = {
     'project_docs': 'chatbot/rag/source_docs.txt',  # Your project documentation
     # Add more sources as needed
 }
+OUTPUT_PATH = 'chatbot/rag/chunks.txt'
 
-CHUNK_SIZE = 500  # Characters per chunk
-CHUNK_OVERLAP = 100  # Overlap between chunks
+CHUNK_TOKENS = 200  # Max tokens per chunk (MiniLM truncates input at 256)
+OVERLAP_SENTENCES = 0  # Sentences repeated at the start of the next chunk in a section
+MIN_CHUNK_TOKENS = 8  # Drop fragments too short to be useful on their own
 
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(*`])')
 
-def load_documents():
-    """Load all source documents."""
-    documents = {}
-    for name, path in SOURCE_FILES.items():
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                documents[name] = f.read()
-                print(f"✓ Loaded {name}: {len(documents[name])} characters")
-        else:
-            print(f"⚠ Warning: {name} not found at {path}")
-    return documents
 
+def load_token_counter(model_name=MODEL_NAME):
+    """
+    Return a function counting tokens the way the embedding model does,
+    with the tokenizer of the shared embedding model (see embeddings.py).
+    """
+    try:
+        tokenizer = get_embedding_provider(model_name).model.tokenizer
+    except Exception as e:
+        print(f"⚠ Warning: tokenizer for {model_name} not available ({e}); estimating tokens")
+        return lambda text: int(len(text.split()) * 1.3) + 1
 
-def create_chunks(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def iter_units(path):
+    """
+    Stream `path` and yield (section, unit) pairs, where a unit is one
+    sentence or one list item and `section` is the heading path above it.
     """
-    Split text into overlapping chunks.
-    Returns: list of chunk strings
+    headings = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+
+            heading = HEADING_RE.match(line)
+            if heading:
+                level = len(heading.group(1))
+                headings = headings[:level - 1] + [heading.group(2)]
+                continue
+
+            section = ' > '.join(headings)
+            for sentence in SENTENCE_END_RE.split(line):
+                if sentence.strip():
+                    yield section, sentence.strip()
+
+
+def split_long(unit, count_tokens, max_tokens):
+    """Split a unit longer than `max_tokens` on word boundaries."""
+    words = unit.split()
+    piece = []
+    for word in words:
+        if piece and count_tokens(' '.join(piece + [word])) > max_tokens:
+            yield ' '.join(piece)
+            piece = []
+        piece.append(word)
+    if piece:
+        yield ' '.join(piece)
+
+
+def create_chunks(units, count_tokens, max_tokens=CHUNK_TOKENS, overlap=OVERLAP_SENTENCES):
     """
-    chunks = []
-    step = chunk_size - overlap
-    
-    for i in range(0, len(text), step):
-        chunk = text[i:i + chunk_size]
-        if len(chunk) > 50:  # Only keep chunks with meaningful content
-            chunks.append(chunk.strip())
-    
-    return chunks
-
-
-def process_documents(documents):
-    """Process documents into chunks."""
-    all_chunks = []
-    
-    for doc_name, content in documents.items():
+    Group (section, unit) pairs into chunks of at most `max_tokens` tokens.
+    Yields (section, text) pairs; chunks never span two sections.
+    """
+    section, current, current_tokens = None, [], 0
+
+    for unit_section, unit in units:
+        if unit_section != section:
+            if current:
+                yield section, '\n'.join(current)
+            section, current, current_tokens = unit_section, [], 0
+
+        tokens = count_tokens(unit)
+        pieces = [(unit, tokens)]
+        if tokens > max_tokens:
+            pieces = [(p, count_tokens(p)) for p in split_long(unit, count_tokens, max_tokens)]
+
+        for piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                yield section, '\n'.join(current)
+                current = current[-overlap:] if overlap else []
+                current_tokens = sum(count_tokens(u) for u in current)
+                # The overlap itself may leave no room for the next piece
+                if current_tokens + piece_tokens > max_tokens:
+                    current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        yield section, '\n'.join(current)
+
+
+def process_documents(count_tokens):
+    """Yield chunk records for every configured source file."""
+    for doc_name, path in SOURCE_FILES.items():
+        if not os.path.exists(path):
+            print(f"⚠ Warning: {doc_name} not found at {path}")
+            continue
+
         print(f"\nProcessing {doc_name}...")
-        chunks = create_chunks(content)
-        all_chunks.extend(chunks)
-        print(f"  Created {len(chunks)} chunks")
-    
-    return all_chunks
+        n = 0
+        for section, text in create_chunks(iter_units(path), count_tokens):
+            if count_tokens(text) < MIN_CHUNK_TOKENS:
+                continue
+            yield {'text': text, 'source': doc_name, 'section': section, 'chunk': n}
+            n += 1
+        print(f"  Created {n} chunks")
 
 
-def save_chunks(chunks):
-    """Save chunks to file (one per line, JSON encoded)."""
-    output_path = 'chatbot/rag/chunks.txt'
+def save_chunks(chunks, output_path=OUTPUT_PATH):
+    """Write chunk records as they are produced (one JSON object per line)."""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    with open(output_path, 'w', encoding='utf-8') as f:
+
+    count = 0
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         for chunk in chunks:
-            # Store as JSON for safe encoding/decoding
             f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
-    
-    print(f"\n✓ Saved {len(chunks)} chunks to {output_path}")
-    return output_path
+            count += 1
+    os.replace(tmp_path, output_path)
+
+    print(f"\n✓ Saved {count} chunks to {output_path}")
+    return count
 
 
 def main():
-    """Main pipeline: load → chunk → save."""
+    """Main pipeline: stream → chunk → save."""
     print("=== Smart Farm Knowledge Base Preparation ===\n")
-    
-    # Step 1: Load documents
-    documents = load_documents()
-    if not documents:
-        print("✗ No documents loaded. Please add source files.")
+
+    count_tokens = load_token_counter()
+    count = save_chunks(process_documents(count_tokens))
+    if not count:
+        print("✗ No chunks created. Please add source files.")
         return False
-    
-    # Step 2: Create chunks
-    chunks = process_documents(documents)
-    print(f"\nTotal chunks created: {len(chunks)}")
-    
-    # Step 3: Save chunks
-    save_chunks(chunks)
-    
+
     print("\n✓ Knowledge base preparation complete!")
     print("Next step: Run generate_embeddings.py to create embeddings")
     return True
@@ -0,0 +1,148 @@
+"""
+prompt.py
+
+Prompt assembly for the LLM answer path.
+
+Retrieved chunks are not pasted in as-is. assemble_context():
+
+    - orders chunks by retrieval score (the rerank score if reranked), best first
+    - drops repeats: a second chunk for the same crop/disease, or one whose
+      text is nearly identical to a chunk already chosen
+    - stops adding chunks once the model's token budget is used up
+
+Small local models such as tinyllama have a 2k-token window and spend
+most of their latency reading the prompt, so every redundant chunk left
+out makes the answer start sooner.
+
+Token counts are an estimate, not the LLM's own tokenizer: the model runs
+behind Ollama, which doesn't expose it. Llama-family tokenizers average
+about 4 characters per token on English text, and at least one token per
+character in other scripts (Hindi, Tamil, ...), which is what
+count_tokens() assumes. Because the estimate can still be short, prompts
+are built to fill only TOKEN_ESTIMATE_MARGIN of the context window.
+"""
+
+import math
+import re
+
+from .config import LLM_ANSWER_TOKENS, LLM_CONTEXT_TOKENS, LLM_MODEL
+from .ranking import ranking_key
+
+PROMPT_TEMPLATE = """
+You are an agricultural expert helping farmers.
+
+User Query:
+{question}
+
+Relevant Information:
+{context}
+
+Provide:
+1. Most likely disease
+2. Cause
+3. Immediate solution
+4. Permanent treatment
+5. Prevention tips
+
+Give a clear and farmer-friendly answer.
+"""
+
+# Context window (tokens) of the models the project is used with
+CONTEXT_WINDOWS = {
+    "tinyllama": 2048,
+    "phi": 2048,
+    "phi3": 4096,
+    "gemma": 8192,
+    "llama2": 4096,
+    "llama3": 8192,
+    "mistral": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 2048
+TOKEN_ESTIMATE_MARGIN = 0.9  # share of the context window a prompt may fill
+
+NEAR_DUPLICATE = 0.8  # word-set Jaccard similarity above which chunks count as the same
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def count_tokens(text):
+    """Estimated token count for Llama-style tokenizers (see the module docstring)."""
+    ascii_chars = sum(1 for c in text if c < "\x80")
+    return math.ceil(ascii_chars / 4) + len(text) - ascii_chars
+
+
+def _truncate(text, max_tokens):
+    """The longest prefix of `text` estimated at no more than `max_tokens` tokens."""
+    end = len(text)
+    while end and count_tokens(text[:end]) > max_tokens:
+        end = min(end - 1, end * max_tokens // count_tokens(text[:end]))
+    return text[:end]
+
+
+def context_window(model=LLM_MODEL):
+    if LLM_CONTEXT_TOKENS:
+        return LLM_CONTEXT_TOKENS
+    # "tinyllama:1.1b-chat" -> "tinyllama"
+    return CONTEXT_WINDOWS.get(model.split(":")[0].lower(), DEFAULT_CONTEXT_WINDOW)
+
+
+def _words(text):
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _is_near_duplicate(words, chosen_words):
+    for other in chosen_words:
+        union = words | other
+        if union and len(words & other) / len(union) >= NEAR_DUPLICATE:
+            return True
+    return False
+
+
+def assemble_context(results, max_tokens):
+    """Return the texts of the best non-redundant `results` fitting in `max_tokens`."""
+    chosen, chosen_words, seen_diseases = [], [], set()
+    used = 0
+    if max_tokens <= 0:
+        return chosen
+
+    for r in sorted(results, key=ranking_key, reverse=True):
+        meta = r["meta"]
+        text = (meta.get("text") or "").strip()
+        if not text:
+            continue
+
+        disease = ((meta.get("crop") or "").lower(), (meta.get("disease") or "").lower())
+        if all(disease) and disease in seen_diseases:
+            continue
+        words = _words(text)
+        if _is_near_duplicate(words, chosen_words):
+            continue
+
+        cost = count_tokens(text) + 1  # + separating newline
+        if used + cost > max_tokens:
+            if chosen:
+                # A lower-scored chunk may still fit; keep looking
+                continue
+            # Always give the model the best chunk, cut to fit
+            text, cost = _truncate(text, max_tokens - 1), max_tokens
+
+        chosen.append(text)
+        chosen_words.append(words)
+        seen_diseases.add(disease)
+        used += cost
+
+    return chosen
+
+
+def build_prompt(question, results, model=LLM_MODEL, max_context_tokens=None):
+    """
+    Prompt for `question` using the retrieved `results`, sized so prompt
+    plus answer fit in TOKEN_ESTIMATE_MARGIN of `model`'s context window.
+    """
+    if max_context_tokens is None:
+        fixed = count_tokens(PROMPT_TEMPLATE.format(question=question, context=""))
+        usable = int(context_window(model) * TOKEN_ESTIMATE_MARGIN)
+        max_context_tokens = usable - LLM_ANSWER_TOKENS - fixed
+
+    context = "\n".join(assemble_context(results, max_context_tokens))
+    return PROMPT_TEMPLATE.format(question=question, context=context)
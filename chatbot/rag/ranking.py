@@ -0,0 +1,195 @@
+"""
+ranking.py
+
+Turn a list of search results into a ranked answer with a confidence.
+
+A single similarity score says little on its own: 0.6 is a clear answer
+when the next disease scores 0.3 and a coin toss when it scores 0.59. So
+the search asks for ANSWER_CANDIDATES results, chunks of the same
+disease are collapsed into one candidate, and the confidence of each
+candidate is a softmax over the candidate scores (temperature
+ANSWER_TEMPERATURE). The top-1 vs top-2 margin drives it directly, and a
+"none of these" entry scored at SIM_THRESHOLD keeps a lone weak match
+from reporting full confidence.
+
+format_answer() returns the best disease together with up to
+ANSWER_ALTERNATIVES runners-up, so an ambiguous question is answered
+once with the likely options instead of a request to describe the
+symptoms again.
+
+Results reranked by rerank.py are ranked by their cross-encoder logit,
+with RERANK_TEMPERATURE and RERANK_MIN_MARGIN in place of the dense
+settings; SIM_THRESHOLD still applies to the dense similarity.
+
+Hybrid results (see sparse.fuse_results) are ordered by their fused
+score, but that score is on another scale than the thresholds, so their
+confidence and margin come from the cosine similarity.
+"""
+
+import math
+
+from .config import (
+    ANSWER_ALTERNATIVES,
+    ANSWER_MIN_MARGIN,
+    ANSWER_TEMPERATURE,
+    RERANK_MIN_MARGIN,
+    RERANK_TEMPERATURE,
+    SIM_THRESHOLD,
+)
+
+
+RERANK_NONE_LOGIT = 0.0  # cross-encoder logit of an even-odds match
+
+
+def is_reranked(results):
+    return any("rerank_score" in r for r in results)
+
+
+def ranking_score(r):
+    """The score results are ranked by: the rerank logit if any, else the similarity."""
+    return r.get("rerank_score", r["similarity"])
+
+
+def dense_similarity(r):
+    """Cosine similarity of a result, also for hybrid results (see sparse.fuse_results)."""
+    return r.get("dense_similarity", r["similarity"])
+
+
+def confidence_score(r):
+    """Score behind confidence and margin: the rerank logit, else the cosine similarity."""
+    return r["rerank_score"] if "rerank_score" in r else dense_similarity(r)
+
+
+def ranking_key(r):
+    """Sort key: reranked results above the rest, each group by its own score."""
+    return ("rerank_score" in r, ranking_score(r))
+
+
+def rank_candidates(results, temperature=None, none_score=None):
+    """
+    Collapse `results` to one entry per (crop, disease), best score first,
+    each with a "confidence": its softmax share of the candidate scores
+    plus a "none of these" score (SIM_THRESHOLD, or RERANK_NONE_LOGIT for
+    reranked results).
+    Knowledge base chunks without a crop or disease each stay separate.
+    """
+    if is_reranked(results):
+        # Results beyond the reranked head have no comparable score
+        results = [r for r in results if "rerank_score" in r]
+        temperature = temperature or RERANK_TEMPERATURE
+        none_score = RERANK_NONE_LOGIT if none_score is None else none_score
+    temperature = temperature or ANSWER_TEMPERATURE
+    none_score = SIM_THRESHOLD if none_score is None else none_score
+
+    candidates = {}
+    for r in results:
+        key = _candidate_key(r)
+        if key not in candidates or ranking_score(r) > ranking_score(candidates[key]):
+            candidates[key] = r
+
+    ranked = sorted(candidates.values(), key=ranking_score, reverse=True)
+    if not ranked:
+        return []
+
+    # "None of these" competes as one more candidate scoring at the
+    # threshold, so a lone weak match doesn't get all the confidence
+    top = max(max(confidence_score(r) for r in ranked), none_score)
+    weights = [math.exp((confidence_score(r) - top) / temperature) for r in ranked]
+    total = sum(weights) + math.exp((none_score - top) / temperature)
+    return [dict(r, confidence=w / total) for r, w in zip(ranked, weights)]
+
+
+def score_margin(ranked):
+    """Top-1 minus top-2 confidence score (the top-1 score if there is only one)."""
+    if len(ranked) < 2:
+        return confidence_score(ranked[0]) if ranked else 0.0
+    return confidence_score(ranked[0]) - confidence_score(ranked[1])
+
+
+def _is_chunk(meta):
+    """Knowledge base chunks (the local fallback index) have no crop or disease."""
+    return not (meta.get("crop") or meta.get("disease"))
+
+
+def _candidate_key(r):
+    meta = r.get("meta") or {}
+    if _is_chunk(meta):
+        return ("chunk", r["id"])
+    return (str(meta.get("crop", "")).lower(), str(meta.get("disease", "")).lower())
+
+
+def _title(meta):
+    if _is_chunk(meta):
+        return " > ".join(p for p in (meta.get("source"), meta.get("section")) if p) or "Knowledge base"
+    return f"{meta.get('crop', 'Unknown')}: {meta.get('disease', 'Unknown')}"
+
+
+def _summary(r):
+    meta = r["meta"]
+    if _is_chunk(meta):
+        names = {"source": meta.get("source"), "section": meta.get("section")}
+    else:
+        names = {"crop": meta.get("crop", "Unknown"), "disease": meta.get("disease", "Unknown")}
+    return dict(names, score=round(dense_similarity(r), 2), confidence=round(r["confidence"], 2))
+
+
+def format_answer(results, alternatives=ANSWER_ALTERNATIVES, threshold=SIM_THRESHOLD,
+                  min_margin=None):
+    """
+    Build the chat reply for `results`:
+
+        reply         the best match, or the likely options if it is unclear
+        confidence    calibrated confidence of the best match (0-1)
+        score         its cosine similarity (the threshold applies to this)
+        margin        top-1 minus top-2 similarity (rerank logit if reranked)
+        alternatives  the runners-up, best first
+    """
+    ranked = rank_candidates(results)
+    if not ranked:
+        return {"reply": "No disease information found."}
+    if min_margin is None:
+        min_margin = RERANK_MIN_MARGIN if is_reranked(ranked) else ANSWER_MIN_MARGIN
+
+    best = ranked[0]
+    margin = score_margin(ranked)
+    others = [_summary(r) for r in ranked[1:alternatives + 1]]
+    answer = {
+        "confidence": round(best["confidence"], 2),
+        "score": round(dense_similarity(best), 2),
+        "margin": round(margin, 2),
+        "alternatives": others,
+    }
+
+    if dense_similarity(best) < threshold:
+        options = "\n".join(f"- {_title(r['meta'])}" for r in ranked[:alternatives + 1])
+        answer["reply"] = (
+            "I’m not confident. The closest matches are:\n"
+            f"{options}\n\n"
+            "More detailed symptoms would help narrow it down."
+        )
+        return answer
+
+    meta = best["meta"]
+    if _is_chunk(meta):
+        reply = f"""
+Source: {_title(meta)}
+
+Details:
+{meta.get('text', '')}
+"""
+    else:
+        reply = f"""
+Crop: {meta.get('crop', 'Unknown')}
+Disease: {meta.get('disease', 'Unknown')}
+
+Details:
+{meta.get('text', '')}
+"""
+    close = [r for r in ranked[1:alternatives + 1]
+             if confidence_score(best) - confidence_score(r) < min_margin]
+    if close:
+        options = "\n".join(f"- {_title(r['meta'])} ({r['confidence']:.0%})" for r in close)
+        reply += f"\nIt could also be:\n{options}\n"
+
+    answer["reply"] = reply
+    return answer
@@ -0,0 +1,185 @@
+"""
+rerank.py
+
+Optional cross-encoder rerank of search results (RERANK=1).
+
+MiniLM bi-encoder scores on short symptom text are noisy. A cross-encoder
+reads the question and each candidate chunk together and orders them far
+better, at the cost of one forward pass over (question, chunk) pairs.
+The top RERANK_CANDIDATES results are scored in a single batch; each
+result keeps its dense "similarity" and gains a "rerank_score" (a logit),
+which ranking.py then ranks by.
+
+Reranking has a hard per-request budget of RERANK_BUDGET_MS, counted from
+when the request started. The cost of a pass is predicted from a moving
+average of past passes (model loading excluded), and the rerank is
+skipped (results keep their dense order) whenever it would not finish in
+the time that is left. Every PROBE_INTERVAL skips in a row one pass runs
+anyway, so a single slow pass can't switch reranking off for good.
+
+The cross-encoder is shared by the whole process. warm_up() loads it up
+front; otherwise the first rerank() loads it in the background and the
+requests that arrive meanwhile are not reranked.
+"""
+
+import threading
+import time
+
+from .config import RERANK, RERANK_BUDGET_MS, RERANK_CANDIDATES, RERANK_MODEL
+
+EWMA_WEIGHT = 0.2  # weight of the newest pass in the per-pair cost estimate
+PROBE_INTERVAL = 50  # skips in a row before a pass re-measures the cost anyway
+
+
+class CrossEncoderReranker:
+    """Loads a CrossEncoder on first use and reorders results with it."""
+
+    def __init__(self, model_name=RERANK_MODEL, candidates=RERANK_CANDIDATES,
+                 budget_ms=RERANK_BUDGET_MS, device=None):
+        self.model_name = model_name
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()  # held while the model loads
+
+        # Estimate and counters, shared by every request thread
+        self._state_lock = threading.Lock()
+        self.pair_ms = None  # moving average cost of one pair, learned from passes
+        self.reranked = 0
+        self.skipped = 0
+        self._skips_in_row = 0
+        self._loader = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    print(f"Loading rerank model {self.model_name}...")
+                    self._model = CrossEncoder(self.model_name, device=self.device)
+        return self._model
+
+    def warm_up(self):
+        """Load the model and measure one pass, so the first budget check is informed."""
+        pairs = ["warm up"] * self.candidates
+        # The first pass pays one-off initialization; only the second is measured
+        self.model.predict([(t, t) for t in pairs], batch_size=len(pairs))
+        self.score("warm up", pairs)
+        return self
+
+    def _load_in_background(self):
+        with self._state_lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._warm_up_in_background,
+                                                name="rerank-loader", daemon=True)
+                self._loader.start()
+
+    def _warm_up_in_background(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            print(f"❌ Rerank model failed to load: {e}")
+            with self._state_lock:
+                self._loader = None  # the next rerank() tries again
+
+    def score(self, question, texts, restart=False):
+        """
+        Cross-encoder logits for (question, text) pairs, in one batch. The
+        pass updates the cost estimate, or replaces it if `restart`.
+        """
+        model = self.model  # loading is not part of the measured cost
+        started = time.perf_counter()
+        scores = model.predict([(question, t) for t in texts], batch_size=len(texts))
+        elapsed_ms = 1000.0 * (time.perf_counter() - started)
+
+        per_pair = elapsed_ms / len(texts)
+        with self._state_lock:
+            if restart or self.pair_ms is None:
+                self.pair_ms = per_pair
+            else:
+                self.pair_ms += EWMA_WEIGHT * (per_pair - self.pair_ms)
+        return [float(s) for s in scores]
+
+    def rerank(self, question, results, started=None):
+        """
+        Return `results` ordered by cross-encoder score, or in their dense
+        order, marked "rerank_skipped", if reranking would overrun the
+        budget or the model is still loading. `started` is the request's
+        time.perf_counter() start, so encoding and search count against
+        the budget too.
+        """
+        head = [r for r in results[:self.candidates] if (r.get("meta") or {}).get("text")]
+        if len(head) < 2:
+            return results
+
+        pair_ms = self.pair_ms  # one snapshot; other threads update the estimate
+        if not self.loaded or pair_ms is None:
+            # Loading takes seconds; don't spend this request's budget on it
+            self._load_in_background()
+            with self._state_lock:
+                self.skipped += 1
+            return _skipped(results)
+
+        spent_ms = 1000.0 * (time.perf_counter() - started) if started is not None else 0.0
+        probe = False
+        if spent_ms + pair_ms * len(head) > self.budget_ms:
+            with self._state_lock:
+                # Only one request claims the probe; the others keep skipping
+                probe = self._skips_in_row >= PROBE_INTERVAL and spent_ms < self.budget_ms
+                if probe:
+                    self._skips_in_row = 0
+                else:
+                    self.skipped += 1
+                    self._skips_in_row += 1
+            if not probe:
+                return _skipped(results)
+
+        # A probe starts the estimate over from its own pass
+        scores = self.score(question, [r["meta"]["text"] for r in head], restart=probe)
+        with self._state_lock:
+            self.reranked += 1
+            self._skips_in_row = 0
+
+        reranked = [dict(r, rerank_score=s) for r, s in zip(head, scores)]
+        reranked.sort(key=lambda r: r["rerank_score"], reverse=True)
+        rest = [r for r in results if not any(r is h for h in head)]
+        return reranked + rest
+
+    def stats(self):
+        with self._state_lock:
+            return {
+                "reranked": self.reranked,
+                "skipped": self.skipped,
+                "pair_ms": round(self.pair_ms, 3) if self.pair_ms is not None else None,
+            }
+
+
+def _skipped(results):
+    return [dict(r, rerank_skipped=True) for r in results]
+
+
+# ==============================
+# Shared instance
+# ==============================
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Return the process-wide reranker, or None when RERANK is off."""
+    global _reranker
+
+    if not RERANK:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
@@ -0,0 +1,82 @@
+"""
+response_cache.py
+
+Cache of complete chatbot answers.
+
+For a given question and index state the reply from get_endee_response is
+deterministic, so hot questions can be answered without embedding or
+searching at all. Keys are built from the normalized question and the
+index generation (see index_state.py); running ingestion bumps the
+generation, which makes every older entry unreachable.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .config import INDEX_NAME
+from .embedding_cache import normalize_text
+from .index_state import get_generation
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of question -> reply dict."""
+
+    def __init__(self, index_name=INDEX_NAME, max_entries=1024, ttl=3600):
+        self.index_name = index_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, question, crop=None):
+        text = normalize_text(question)
+        if crop:
+            text = f"{normalize_text(crop)}|{text}"
+        digest = hashlib.sha1(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+        return f"{self.index_name}:{get_generation(self.index_name)}:{digest}"
+
+    def get(self, question, crop=None):
+        """Return the cached reply for `question`, or None on a miss."""
+        key = self.key(question, crop)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, question, response, crop=None):
+        key = self.key(question, crop)
+
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
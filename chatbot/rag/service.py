@@ -0,0 +1,283 @@
+"""
+service.py
+
+The chat pipeline (question -> embed -> search -> rerank -> format) in
+one place, shared by every entry point: the Django views, the Flask app
+and the CLI in project/, and endee_service.get_endee_response().
+
+RAGService holds no heavy state of its own. The embedding model comes from
+the process-wide provider (see embeddings.py) and the index from the
+shared Endee client or its fallbacks (see endee_index.py), so Django and
+Flask running in one process load the model once. The stages that differ
+between deployments are pluggable:
+
+    cache        ResponseCache of final replies, or None
+    crop_filter  (question, crop) -> crop to restrict the search to, or None
+    reranker     object with rerank(question, results, started), or None
+    formatter    results -> reply dict (default ranking.format_answer)
+
+answer() returns the formatted reply. stream_answer() is the
+LLM-augmented path used by the Flask app and the CLI in project/: it
+yields the generated answer piece by piece (see llm.py), with the
+semantic answer cache in front of the model (see answer_cache.py).
+
+get_rag_service() returns the shared instance built from config.py.
+Every stage is timed for the metrics endpoint (see metrics.py).
+"""
+
+import asyncio
+import threading
+import time
+
+from .config import (
+    ANSWER_CANDIDATES,
+    HYBRID_SEARCH,
+    INDEX_NAME,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL,
+    SIM_THRESHOLD,
+)
+from .crops import canonical_crop, detect_crop
+from .embeddings import get_embedding_provider
+from .endee_client import EndeeError
+from .endee_index import get_index, search_with_fallback
+from .metrics import timed
+from .prompt import build_prompt
+from .ranking import dense_similarity, format_answer
+from .rerank import get_reranker
+from .response_cache import ResponseCache
+from .sparse import get_sparse_encoder
+
+UNAVAILABLE_REPLY = "Vector database not available."
+LLM_UNAVAILABLE_REPLY = "The language model is not available."
+LLM_CONTEXT_RESULTS = 3  # retrieved chunks offered to the LLM
+
+
+def resolve_crop(question, crop=None):
+    """The crop named by the caller, or else the one crop the question mentions."""
+    return canonical_crop(crop) or detect_crop(question)
+
+
+class RAGService:
+    def __init__(self, index_name=INDEX_NAME, index=None, provider=None, cache=None,
+                 crop_filter=resolve_crop, reranker=None, formatter=format_answer,
+                 top_k=ANSWER_CANDIDATES, hybrid=HYBRID_SEARCH):
+        self.index_name = index_name
+        self.index = index  # fixed index (e.g. a LocalIndex in benchmarks); else looked up per call
+        self.provider = provider or get_embedding_provider()
+        self.cache = cache
+        self.crop_filter = crop_filter
+        self.reranker = reranker
+        self.formatter = formatter
+        self.top_k = top_k
+        self.hybrid = hybrid
+
+    # ------------------------------
+    # Stages
+    # ------------------------------
+    def check(self, question):
+        """Return (early reply or None, sparse query or None) for `question`."""
+        if not question:
+            return {"reply": "Please ask a question."}, None
+
+        sparse_query = get_sparse_encoder().encode_query(question) if self.hybrid else None
+
+        # Short keyword queries ("blast rice") are fine when they hit known terms
+        has_keywords = sparse_query is not None and bool(sparse_query[0])
+        if len(question.split()) < 3 and not has_keywords:
+            return {
+                "reply": "Please describe symptoms clearly (example: rice leaves have brown spots)."
+            }, None
+
+        return None, sparse_query
+
+    def _crop(self, question, crop):
+        return self.crop_filter(question, crop) if self.crop_filter else None
+
+    def _rerank(self, question, results, started):
+        if self.reranker is None:
+            return results
+        with timed("rerank"):
+            return self.reranker.rerank(question, results, started)
+
+    def retrieve(self, question, crop=None, top_k=None, sparse_query=None, started=None):
+        """
+        Embed `question` and search for it. Returns (query vector, results),
+        reranked if the service has a reranker. Raises EndeeError if neither
+        Endee nor a fallback index can answer.
+        """
+        started = started if started is not None else time.perf_counter()
+        index = self.index if self.index is not None else get_index(self.index_name)
+
+        with timed("encode"):
+            query_vector = self.provider.encode_query(question).tolist()
+        with timed("search"):
+            results = search_with_fallback(index, query_vector, top_k=top_k or self.top_k,
+                                           crop=self._crop(question, crop),
+                                           sparse_query=sparse_query)
+        return query_vector, self._rerank(question, results, started)
+
+    async def aretrieve(self, question, crop=None, top_k=None, sparse_query=None, started=None):
+        """
+        retrieve() without blocking the event loop: encoding runs in the
+        embedding batcher (or a bounded thread pool), the search goes through
+        the async Endee client and reranking runs in a worker thread.
+        """
+        # httpx is only needed by the async path; Flask and the CLI never get here
+        from .async_client import get_async_index, search_with_fallback_async
+
+        started = started if started is not None else time.perf_counter()
+        index = self.index if self.index is not None else await get_async_index(self.index_name)
+
+        with timed("encode"):
+            query_vector = (await self.provider.aencode_query(question)).tolist()
+        with timed("search"):
+            results = await search_with_fallback_async(
+                index, query_vector, top_k or self.top_k,
+                crop=self._crop(question, crop), sparse_query=sparse_query,
+            )
+        if self.reranker is not None:
+            results = await asyncio.to_thread(self._rerank, question, results, started)
+        return query_vector, results
+
+    # ------------------------------
+    # Answers
+    # ------------------------------
+    def answer(self, question, crop=None):
+        """Reply dict for `question`, from the cache when possible."""
+        with timed("total"):
+            return self._answer(question, crop)
+
+    async def aanswer(self, question, crop=None):
+        """Async answer(), for ASGI views."""
+        with timed("total"):
+            return await self._aanswer(question, crop)
+
+    def _answer(self, question, crop):
+        started = time.perf_counter()
+        reply, sparse_query = self._prepare(question, crop)
+        if reply is not None:
+            return reply
+
+        try:
+            _, results = self.retrieve(question, crop, sparse_query=sparse_query, started=started)
+        except EndeeError as e:
+            return _unavailable(e)
+        return self._finish(question, crop, results)
+
+    async def _aanswer(self, question, crop):
+        started = time.perf_counter()
+        reply, sparse_query = self._prepare(question, crop)
+        if reply is not None:
+            return reply
+
+        try:
+            _, results = await self.aretrieve(question, crop, sparse_query=sparse_query,
+                                              started=started)
+        except EndeeError as e:
+            return _unavailable(e)
+        return self._finish(question, crop, results)
+
+    def _prepare(self, question, crop):
+        """(cached or early reply, None), or (None, sparse query) to go on searching."""
+        result = self.cache.get(question, crop) if self.cache is not None else None
+        if result is not None:
+            return result, None
+        with timed("check"):
+            return self.check(question)
+
+    def _finish(self, question, crop, results):
+        with timed("format"):
+            return self._remember(question, crop, self.formatter(results), results)
+
+    def _remember(self, question, crop, result, results):
+        # Degraded answers (from the local fallback, or not reranked because
+        # of the budget or a model still loading) are not cached: the next
+        # request should get the full answer once it is possible again
+        degraded = any(r.get("fallback") or r.get("rerank_skipped") for r in results)
+        if self.cache is not None and not degraded:
+            self.cache.put(question, result, crop)
+        return result
+
+    # ------------------------------
+    # LLM answers
+    # ------------------------------
+    def stream_answer(self, question, llm, answer_cache=None, crop=None,
+                      top_k=LLM_CONTEXT_RESULTS):
+        """
+        LLM-augmented answer to `question`, as (event, data) pairs:
+
+            ("token", text)           one per piece generated by `llm`
+            ("done", {...})           last; "confidence" (and "cached") after
+                                      an LLM answer, else the formatter's
+                                      reply dict (short question, no match,
+                                      low similarity, Endee unavailable)
+            ("error", {"reply": ..})  if the LLM fails midway
+
+        Answers found in `answer_cache` (an AnswerCache) arrive as one token;
+        new ones are stored there once complete.
+        """
+        early_reply, sparse_query = self.check(question)
+        if early_reply is not None:
+            yield "done", early_reply
+            return
+
+        try:
+            query_vector, results = self.retrieve(question, crop, top_k=top_k,
+                                                  sparse_query=sparse_query)
+        except EndeeError as e:
+            yield "done", _unavailable(e)
+            return
+
+        if not results or dense_similarity(results[0]) < SIM_THRESHOLD:
+            yield "done", self.formatter(results)
+            return
+        confidence = round(dense_similarity(results[0]), 2)
+
+        chunk_ids = [r["id"] for r in results]
+        cached = answer_cache.get(query_vector, chunk_ids) if answer_cache is not None else None
+        if cached is not None:
+            yield "token", cached
+            yield "done", {"confidence": confidence, "cached": True}
+            return
+
+        tokens = []
+        try:
+            for token in llm.stream(build_prompt(question, results)):
+                tokens.append(token)
+                yield "token", token
+        except Exception as e:
+            print(f"❌ LLM Error: {e}")
+            yield "error", {"reply": LLM_UNAVAILABLE_REPLY}
+            return
+
+        if answer_cache is not None:
+            answer_cache.put(question, query_vector, chunk_ids, "".join(tokens))
+        yield "done", {"confidence": confidence}
+
+
+def _unavailable(error):
+    print(f"❌ Endee search failed: {error}")
+    return {"reply": UNAVAILABLE_REPLY}
+
+
+# ==============================
+# Shared instance
+# ==============================
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service():
+    """Return the process-wide RAGService configured from config.py."""
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RAGService(
+                    # Final replies, invalidated whenever ingestion bumps the index generation
+                    cache=ResponseCache(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL),
+                    reranker=get_reranker(),
+                )
+    return _service
@@ -0,0 +1,220 @@
+"""
+sparse.py
+
+BM25-style sparse term vectors for hybrid (dense + keyword) search.
+
+Short keyword queries such as "blast rice" carry little context for a
+dense MiniLM embedding, but match exact disease and crop names very well.
+Endee can store a sparse vector next to each dense one and score them with
+block-max WAND (endee/src/sparse/), so ingestion writes both and the chat
+service can fuse the two result lists (see hybrid_query()).
+
+BM25 is split between the two sides so stored vectors never depend on
+corpus-wide statistics that change between ingests:
+
+    document side:  tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+    query side:     idf(term)
+
+The dot product of the two is the BM25 score. Term ids are a stable hash
+of the term into SPARSE_DIM buckets, so no vocabulary has to be shared;
+document frequencies for idf are saved by ingestion in SPARSE_STATS_FILE.
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from .config import SPARSE_STATS_FILE
+
+SPARSE_DIM = 2 ** 18
+K1 = 1.2
+B = 0.75
+DEFAULT_AVG_LEN = 50.0
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has",
+    "have", "in", "is", "it", "its", "my", "of", "on", "or", "the", "to",
+    "with", "crop", "disease", "symptoms", "solution", "temporary",
+    "permanent", "prevention", "advice",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def term_id(term):
+    return zlib.crc32(term.encode("utf-8")) % SPARSE_DIM
+
+
+class SparseEncoder:
+    """Encodes documents and queries as (indices, values) sparse vectors."""
+
+    def __init__(self, doc_freq=None, num_docs=0, avg_len=DEFAULT_AVG_LEN):
+        self.doc_freq = doc_freq or {}  # term id -> number of documents
+        self.num_docs = num_docs
+        self.avg_len = avg_len or DEFAULT_AVG_LEN
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    @classmethod
+    def load(cls, path=SPARSE_STATS_FILE):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        doc_freq = {int(k): v for k, v in stats["doc_freq"].items()}
+        return cls(doc_freq, stats["num_docs"], stats["avg_len"])
+
+    def save(self, path=SPARSE_STATS_FILE):
+        stats = {"num_docs": self.num_docs, "avg_len": self.avg_len, "doc_freq": self.doc_freq}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+
+    # ------------------------------
+    # Encoding
+    # ------------------------------
+    def encode_document(self, text):
+        tokens = tokenize(text)
+        norm = K1 * (1 - B + B * len(tokens) / self.avg_len)
+
+        weights = {}
+        for term, tf in Counter(tokens).items():
+            tid = term_id(term)
+            weights[tid] = weights.get(tid, 0.0) + tf * (K1 + 1) / (tf + norm)
+        return _to_sparse(weights)
+
+    def encode_query(self, text):
+        weights = {}
+        for term in set(tokenize(text)):
+            tid = term_id(term)
+            df = self.doc_freq.get(tid, 0)
+            if df:
+                weights[tid] = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+        return _to_sparse(weights)
+
+
+class SparseStatsBuilder:
+    """Collects document frequencies while ingestion streams the corpus."""
+
+    def __init__(self):
+        self.doc_freq = Counter()
+        self.num_docs = 0
+        self.total_len = 0
+
+    def add(self, text):
+        tokens = tokenize(text)
+        self.num_docs += 1
+        self.total_len += len(tokens)
+        self.doc_freq.update({term_id(t) for t in tokens})
+
+    def build(self):
+        avg_len = self.total_len / self.num_docs if self.num_docs else DEFAULT_AVG_LEN
+        return SparseEncoder(dict(self.doc_freq), self.num_docs, avg_len)
+
+
+def _to_sparse(weights):
+    indices = sorted(weights)
+    return indices, [float(weights[i]) for i in indices]
+
+
+_encoder = None
+_encoder_mtime = None
+
+
+def get_sparse_encoder(path=SPARSE_STATS_FILE):
+    """Return the shared SparseEncoder, reloaded when ingestion rewrites its stats."""
+    global _encoder, _encoder_mtime
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if _encoder is None or mtime != _encoder_mtime:
+        _encoder, _encoder_mtime = SparseEncoder.load(path), mtime
+    return _encoder
+
+
+# ==============================
+# Hybrid search
+# ==============================
+def hybrid_query(index, query_vector, sparse_query, top_k, filter=None, alpha=0.7,
+                 candidates=10):
+    """
+    Run a dense and a sparse search and fuse them:
+
+        score = alpha * cosine + (1 - alpha) * sparse / max(sparse)
+
+    Results keep Endee's result shape. "similarity" holds the fused score,
+    which orders the results; the plain cosine is kept as
+    "dense_similarity", and confidence thresholds (tuned for cosine) must
+    use that (see ranking.dense_similarity()).
+    """
+    sparse_indices, sparse_values = sparse_query
+    n = max(top_k, candidates)
+    query_kwargs = {"filter": filter} if filter else {}
+
+    dense = index.query(vector=query_vector, top_k=n, **query_kwargs)
+    if not sparse_indices:
+        return dense[:top_k]
+
+    # Sparse hits may be missing from the dense list; fetch their vectors so
+    # their cosine similarity can be computed locally.
+    sparse = index.query(
+        sparse_indices=sparse_indices, sparse_values=sparse_values,
+        top_k=n, include_vectors=True, **query_kwargs
+    )
+    return fuse_results(dense, sparse, query_vector, top_k, alpha)
+
+
+async def hybrid_query_async(index, query_vector, sparse_query, top_k, filter=None, alpha=0.7,
+                             candidates=10):
+    """hybrid_query() for an AsyncEndeeIndex; both searches run concurrently."""
+    sparse_indices, sparse_values = sparse_query
+    n = max(top_k, candidates)
+    query_kwargs = {"filter": filter} if filter else {}
+
+    if not sparse_indices:
+        return (await index.query(vector=query_vector, top_k=n, **query_kwargs))[:top_k]
+
+    dense, sparse = await asyncio.gather(
+        index.query(vector=query_vector, top_k=n, **query_kwargs),
+        index.query(sparse_indices=sparse_indices, sparse_values=sparse_values,
+                    top_k=n, include_vectors=True, **query_kwargs),
+    )
+    return fuse_results(dense, sparse, query_vector, top_k, alpha)
+
+
+def fuse_results(dense, sparse, query_vector, top_k, alpha=0.7):
+    """Merge dense and sparse result lists into the top_k by fused score."""
+    if not sparse:
+        # No keyword hits: keep the plain cosine scores
+        return dense[:top_k]
+    by_id = {r["id"]: dict(r, dense_similarity=r["similarity"], sparse_score=0.0) for r in dense}
+    q = np.asarray(query_vector, dtype=np.float32)
+    q_norm = np.linalg.norm(q) or 1.0
+    for r in sparse:
+        entry = by_id.get(r["id"])
+        if entry is None:
+            v = r.get("vector")
+            v = np.asarray(v if v is not None else [], dtype=np.float32)
+            cosine = float(q @ v / (q_norm * (np.linalg.norm(v) or 1.0))) if v.size else 0.0
+            entry = by_id[r["id"]] = dict(r, dense_similarity=cosine)
+            entry.pop("vector", None)
+        entry["sparse_score"] = r["similarity"]
+
+    max_sparse = max(r["sparse_score"] for r in by_id.values()) or 1.0
+    for r in by_id.values():
+        r["similarity"] = alpha * r["dense_similarity"] + (1 - alpha) * r["sparse_score"] / max_sparse
+
+    return sorted(by_id.values(), key=lambda r: r["similarity"], reverse=True)[:top_k]
@@ -0,0 +1,1329 @@
+import asyncio
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import CancelledError
+from unittest import mock, skipUnless
+
+import msgpack
+import numpy as np
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from chatbot.rag import prepare_chunks
+from chatbot.rag.answer_cache import AnswerCache
+from chatbot.rag.async_client import AsyncEndeeClient
+from chatbot.rag.batching import EmbeddingBatcher
+from chatbot.rag.config import ENDEE_BASE_URL, LLM_ANSWER_TOKENS
+from chatbot.rag.crops import (
+    canonical_crop, crop_filter, detect_crop, query_for_crop, query_for_crop_async, save_vocabulary,
+)
+from chatbot.rag.embedding_cache import EmbeddingCache
+from chatbot.rag.endee_client import (
+    CircuitBreaker, EndeeClient, EndeeIndex, EndeeUnavailable, decode_meta, decode_results, encode_meta,
+    search_body,
+)
+from chatbot.rag.endee_index import search_with_fallback
+from chatbot.rag.index_state import bump_generation
+from chatbot.rag.llm import FakeLLM
+from chatbot.rag.local_index import LocalIndex, record_id, write_local_index
+from chatbot.rag.memory_index import InMemoryIndex
+from chatbot.rag.metrics import LatencySummary, count_endee_error, observe, render_prometheus
+from chatbot.rag.prompt import TOKEN_ESTIMATE_MARGIN, assemble_context, build_prompt, count_tokens
+from chatbot.rag.ranking import format_answer, rank_candidates
+from chatbot.rag.rerank import PROBE_INTERVAL, CrossEncoderReranker
+from chatbot.rag.response_cache import ResponseCache
+from chatbot.rag.service import RAGService
+from chatbot.rag.sparse import (
+    SparseEncoder, SparseStatsBuilder, fuse_results, hybrid_query, term_id, tokenize,
+)
+from project import ingest_embeddings
+
+RICE_QUESTION = "leaves have small brown spots"
+TOMATO_QUESTION = "leaves turn black and rot"
+UNKNOWN_QUESTION = "my tractor makes a strange noise"
+
+
+class FakeProvider:
+    """Embedding provider with fixed vectors per question, so no model is loaded."""
+
+    vectors = {
+        RICE_QUESTION: [1.0, 0.1, 0.0],
+        TOMATO_QUESTION: [0.1, 1.0, 0.0],
+        UNKNOWN_QUESTION: [0.0, 0.0, 1.0],
+    }
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode_query(self, text):
+        self.encoded.append(text)
+        return np.array(self.vectors[text], dtype=np.float32)
+
+    async def aencode_query(self, text):
+        return self.encode_query(text)
+
+
+def make_index(name="test"):
+    index = InMemoryIndex(name, dim=3)
+    index.upsert([
+        {
+            "id": "rice-blast",
+            "vector": [1.0, 0.0, 0.0],
+            "meta": {"crop": "Rice", "disease": "Blast", "text": "Blast causes brown spots on rice leaves."},
+            "filter": {"crop": canonical_crop("rice")},
+        },
+        {
+            "id": "tomato-blight",
+            "vector": [0.0, 1.0, 0.0],
+            "meta": {"crop": "Tomato", "disease": "Late Blight", "text": "Late blight turns tomato leaves black."},
+            "filter": {"crop": canonical_crop("tomato")},
+        },
+    ])
+    return index
+
+
+def make_service(index, **kwargs):
+    return RAGService(index_name=index.name, index=index, provider=FakeProvider(), hybrid=False, **kwargs)
+
+
+def make_answer_cache(test, **kwargs):
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    return AnswerCache(path=os.path.join(tmp.name, "answers.sqlite3"), llm_model="fake", **kwargs)
+
+
+class BrokenLLM(FakeLLM):
+    def stream(self, prompt):
+        yield "Blast"
+        raise ConnectionError("model server went away")
+
+
+# ==============================
+# RAGService
+# ==============================
+class RAGServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.index = make_index()
+        self.service = make_service(self.index)
+
+    def test_answers_best_match(self):
+        result = self.service.answer(RICE_QUESTION)
+        self.assertIn("Disease: Blast", result["reply"])
+        self.assertGreater(result["confidence"], 0.9)
+        self.assertEqual(result["alternatives"][0]["disease"], "Late Blight")
+
+    def test_crop_restricts_search(self):
+        result = self.service.answer(RICE_QUESTION, crop="tomato")
+        self.assertIn("Tomato: Late Blight", result["reply"])
+        self.assertNotIn("Blast", result["reply"])
+        self.assertEqual(result["alternatives"], [])
+
+    def test_short_question_asks_for_symptoms(self):
+        result = self.service.answer("help")
+        self.assertIn("describe symptoms", result["reply"])
+        self.assertEqual(self.service.provider.encoded, [])
+
+    def test_empty_index_finds_nothing(self):
+        service = make_service(InMemoryIndex("empty", dim=3))
+        self.assertEqual(service.answer(RICE_QUESTION), {"reply": "No disease information found."})
+
+    def test_async_answer_matches_sync_answer(self):
+        for question in (RICE_QUESTION, UNKNOWN_QUESTION, "help"):
+            self.assertEqual(asyncio.run(self.service.aanswer(question)), self.service.answer(question))
+
+    def test_stream_answer_streams_llm_tokens(self):
+        llm = FakeLLM(reply="Spray tricyclazole early.")
+
+        events = list(self.service.stream_answer(RICE_QUESTION, llm))
+
+        self.assertEqual(events, [
+            ("token", "Spray"), ("token", " tricyclazole"), ("token", " early."),
+            ("done", {"confidence": 1.0}),
+        ])
+        self.assertIn("Blast causes brown spots", llm.prompts[0])
+        self.assertIn(RICE_QUESTION, llm.prompts[0])
+
+    def test_stream_answer_reuses_cached_answer(self):
+        answer_cache = make_answer_cache(self)
+        list(self.service.stream_answer(RICE_QUESTION, FakeLLM(reply="Spray early."), answer_cache))
+
+        llm = FakeLLM()
+        events = list(self.service.stream_answer(RICE_QUESTION, llm, answer_cache))
+
+        self.assertEqual(events, [("token", "Spray early."), ("done", {"confidence": 1.0, "cached": True})])
+        self.assertEqual(llm.prompts, [])
+
+    def test_stream_answer_skips_llm_below_threshold(self):
+        llm = FakeLLM()
+        (event, payload), = self.service.stream_answer(UNKNOWN_QUESTION, llm)
+
+        self.assertEqual(event, "done")
+        self.assertIn("not confident", payload["reply"])
+        self.assertEqual(llm.prompts, [])
+
+    def test_stream_answer_reports_llm_failure_without_caching(self):
+        answer_cache = make_answer_cache(self)
+
+        events = list(self.service.stream_answer(RICE_QUESTION, BrokenLLM(), answer_cache))
+
+        self.assertEqual(events[-1], ("error", {"reply": "The language model is not available."}))
+        self.assertEqual(answer_cache.stats()["entries"], 0)
+
+
+# ==============================
+# Response cache
+# ==============================
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch("chatbot.rag.index_state.INDEX_STATE_FILE",
+                             os.path.join(tmp.name, "index_state.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.index = make_index()
+        self.service = make_service(self.index, cache=ResponseCache(index_name=self.index.name))
+
+    def test_repeated_question_is_served_from_cache(self):
+        first = self.service.answer(RICE_QUESTION)
+        second = self.service.answer(RICE_QUESTION)
+
+        self.assertIs(second, first)
+        self.assertEqual(self.service.provider.encoded, [RICE_QUESTION])
+        self.assertEqual(self.service.cache.stats()["hits"], 1)
+
+    def test_generation_bump_invalidates_answers(self):
+        self.service.answer(RICE_QUESTION)
+        self.index.upsert([{
+            "id": "rice-blast",
+            "vector": [1.0, 0.0, 0.0],
+            "meta": {"crop": "Rice", "disease": "Blast", "text": "Updated advice on rice blast."},
+            "filter": {"crop": canonical_crop("rice")},
+        }])
+
+        # Until ingestion bumps the generation the old answer is still served
+        self.assertNotIn("Updated advice", self.service.answer(RICE_QUESTION)["reply"])
+
+        bump_generation(self.index.name)
+        self.assertIn("Updated advice", self.service.answer(RICE_QUESTION)["reply"])
+        self.assertEqual(self.service.provider.encoded, [RICE_QUESTION, RICE_QUESTION])
+
+    def test_answer_without_rerank_is_not_cached(self):
+        reranker = CrossEncoderReranker(model_name="fake", budget_ms=100)
+        reranker._model, reranker.pair_ms = FakeCrossEncoder(), 500.0  # always over budget
+        self.service.reranker = reranker
+
+        self.service.answer(RICE_QUESTION)
+        self.service.answer(RICE_QUESTION)
+
+        self.assertEqual(self.service.provider.encoded, [RICE_QUESTION, RICE_QUESTION])
+        self.assertEqual(self.service.cache.stats()["entries"], 0)
+
+
+# ==============================
+# Circuit breaker
+# ==============================
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch("chatbot.rag.endee_client.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=30.0)
+
+    def test_opens_after_threshold_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        self.now += 31.0
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())  # the trial is still running
+
+        self.breaker.record_success()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+
+        self.now += 31.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def open_for_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 31.0
+
+    def test_cancelled_async_trial_is_released(self):
+        self.open_for_trial()
+        client = AsyncEndeeClient(breaker=self.breaker)
+
+        with mock.patch.object(client.http, "request", side_effect=asyncio.CancelledError):
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(client.request("GET", "/index/list"))
+
+        # The next call gets to be the trial instead of the breaker staying shut
+        self.assertTrue(self.breaker.allow())
+
+    def test_interrupted_sync_trial_is_released(self):
+        self.open_for_trial()
+        client = EndeeClient(breaker=self.breaker)
+
+        with mock.patch.object(client.session, "request", side_effect=RuntimeError("interrupted")):
+            with self.assertRaises(RuntimeError):
+                client.request("GET", "/index/list")
+
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.failures, 2)
+
+
+# ==============================
+# Embedding batcher
+# ==============================
+class EmbeddingBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+    def encode_batch(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+    def test_concurrent_texts_share_one_batch(self):
+        batcher = EmbeddingBatcher(self.encode_batch, max_wait_ms=200)
+        futures = [batcher.submit(text) for text in ("a", "bb", "ccc")]
+
+        vectors = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(self.calls, [["a", "bb", "ccc"]])
+        self.assertEqual([v[0] for v in vectors], [1, 2, 3])
+        # Each caller gets its own array, not a view of the batch
+        self.assertIsNone(vectors[0].base)
+        self.assertEqual(batcher.stats()["batches"], 1)
+
+    def test_batch_size_is_capped(self):
+        batcher = EmbeddingBatcher(self.encode_batch, max_batch_size=2, max_wait_ms=200)
+        futures = [batcher.submit(text) for text in ("a", "b", "c")]
+        for f in futures:
+            f.result(timeout=5)
+
+        self.assertEqual([len(call) for call in self.calls], [2, 1])
+
+    def test_cancelled_text_is_dropped(self):
+        batcher = EmbeddingBatcher(self.encode_batch, max_wait_ms=200)
+        kept = batcher.submit("kept")
+        dropped = batcher.submit("dropped")
+        dropped.cancel()
+
+        kept.result(timeout=5)
+        self.assertEqual(self.calls, [["kept"]])
+        with self.assertRaises(CancelledError):
+            dropped.result()
+
+    def test_model_error_reaches_callers_and_worker_survives(self):
+        fail = threading.Event()
+        fail.set()
+
+        def encode_batch(texts):
+            if fail.is_set():
+                raise RuntimeError("model failed")
+            return self.encode_batch(texts)
+
+        batcher = EmbeddingBatcher(encode_batch, max_wait_ms=1)
+        with self.assertRaisesMessage(RuntimeError, "model failed"):
+            batcher.encode("a", timeout=5)
+
+        fail.clear()
+        self.assertEqual(batcher.encode("bb", timeout=5)[0], 2)
+
+
+# ==============================
+# Ranking
+# ==============================
+def make_result(disease, similarity, crop="Rice", text=None, **extra):
+    meta = {"crop": crop, "disease": disease, "text": text or f"{disease} details."}
+    return dict({"id": f"{crop}-{disease}", "similarity": similarity, "meta": meta}, **extra)
+
+
+class RankingTests(SimpleTestCase):
+    def test_clear_winner_is_confident(self):
+        answer = format_answer([make_result("Blast", 0.72), make_result("Brown Spot", 0.5)])
+        self.assertIn("Disease: Blast", answer["reply"])
+        self.assertGreater(answer["confidence"], 0.9)
+        self.assertNotIn("It could also be", answer["reply"])
+
+    def test_close_runner_up_is_offered(self):
+        answer = format_answer([make_result("Blast", 0.62), make_result("Brown Spot", 0.6)])
+        self.assertIn("It could also be:\n- Rice: Brown Spot", answer["reply"])
+        self.assertLess(answer["confidence"], 0.7)
+
+    def test_chunks_of_one_disease_are_one_candidate(self):
+        ranked = rank_candidates([
+            make_result("Blast", 0.7),
+            dict(make_result("Blast", 0.65), id="other-chunk"),
+            make_result("Brown Spot", 0.5),
+        ])
+        self.assertEqual([r["meta"]["disease"] for r in ranked], ["Blast", "Brown Spot"])
+
+    def test_lone_weak_match_is_not_confident(self):
+        # With a single candidate left the softmax alone would say 1.0
+        answer = format_answer([make_result("Blast", 0.22)])
+        self.assertIn("not confident", answer["reply"])
+        self.assertLess(answer["confidence"], 0.1)
+
+    def test_lone_strong_match_is_confident(self):
+        self.assertGreater(format_answer([make_result("Blast", 0.7)])["confidence"], 0.9)
+
+    def test_hybrid_confidence_uses_the_cosine(self):
+        # Fused 0.42 is below SIM_THRESHOLD, but the cosine 0.6 is a clear match
+        answer = format_answer([make_result("Blast", 0.42, dense_similarity=0.6)])
+        self.assertIn("Disease: Blast", answer["reply"])
+        self.assertEqual(answer["score"], 0.6)
+        self.assertGreater(answer["confidence"], 0.9)
+
+    def test_keyword_hit_does_not_inflate_confidence(self):
+        answer = format_answer([make_result("Blast", 0.55, dense_similarity=0.3)])
+        self.assertIn("not confident", answer["reply"])
+        self.assertLess(answer["confidence"], 0.1)
+
+    def test_hybrid_order_follows_the_fused_score(self):
+        ranked = rank_candidates([
+            make_result("Blast", 0.6, dense_similarity=0.5),
+            make_result("Brown Spot", 0.5, dense_similarity=0.55),
+        ])
+        self.assertEqual([r["meta"]["disease"] for r in ranked], ["Blast", "Brown Spot"])
+
+
+# ==============================
+# Rerank
+# ==============================
+class FakeCrossEncoder:
+    """Scores a pair by the number of question words in the text."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [len(set(q.split()) & set(t.split())) for q, t in pairs]
+
+
+def rerank_results():
+    return [
+        make_result("Brown Spot", 0.7, text="spots on old leaves"),
+        make_result("Blast", 0.65, text="brown spots with grey centres on leaves"),
+        make_result("Sheath Blight", 0.6, text="lesions on the sheath"),
+    ]
+
+
+class RerankTests(SimpleTestCase):
+    def make_reranker(self, pair_ms=1.0, budget_ms=100, model=None):
+        reranker = CrossEncoderReranker(model_name="fake", candidates=3, budget_ms=budget_ms)
+        reranker._model = model or FakeCrossEncoder()
+        reranker.pair_ms = pair_ms
+        return reranker
+
+    def test_reorders_by_cross_encoder_score(self):
+        reranked = self.make_reranker().rerank("brown spots on leaves", rerank_results())
+
+        self.assertEqual([r["meta"]["disease"] for r in reranked], ["Blast", "Brown Spot", "Sheath Blight"])
+        self.assertEqual(reranked[0]["rerank_score"], 4)
+        self.assertEqual(reranked[0]["similarity"], 0.65)
+
+    def test_skips_when_over_budget(self):
+        reranker = self.make_reranker(pair_ms=50.0, budget_ms=100)
+
+        skipped = reranker.rerank("brown spots on leaves", rerank_results())
+
+        self.assertEqual([r["meta"]["disease"] for r in skipped], ["Brown Spot", "Blast", "Sheath Blight"])
+        self.assertTrue(all(r["rerank_skipped"] for r in skipped))
+        self.assertEqual(reranker.model.calls, 0)
+        self.assertEqual(reranker.stats()["skipped"], 1)
+
+    def test_time_already_spent_counts_against_budget(self):
+        reranker = self.make_reranker(pair_ms=1.0, budget_ms=100)
+        results = rerank_results()
+
+        started = time.perf_counter() - 0.099  # encode and search took 99 ms
+        self.assertIn("rerank_skipped", reranker.rerank("brown spots on leaves", results, started)[0])
+
+    def test_skips_while_model_loads(self):
+        reranker = self.make_reranker()
+        reranker._model = None
+        results = rerank_results()
+
+        with mock.patch.object(reranker, "_load_in_background") as load:
+            self.assertIn("rerank_skipped", reranker.rerank("brown spots on leaves", results)[0])
+        load.assert_called_once()
+
+    def test_probe_restarts_the_estimate(self):
+        reranker = self.make_reranker(pair_ms=500.0, budget_ms=100)
+        reranker._skips_in_row = PROBE_INTERVAL
+
+        reranked = reranker.rerank("brown spots on leaves", rerank_results())
+
+        self.assertIn("rerank_score", reranked[0])
+        # The old estimate is replaced by the measured pass, not averaged in
+        self.assertLess(reranker.pair_ms, 100.0)
+        self.assertEqual(reranker._skips_in_row, 0)
+
+    def test_one_probe_at_a_time(self):
+        reranker = self.make_reranker(pair_ms=500.0, budget_ms=1000, model=FakeCrossEncoder(delay=0.05))
+        reranker._skips_in_row = PROBE_INTERVAL
+
+        threads = [threading.Thread(target=reranker.rerank, args=("brown spots on leaves", rerank_results()))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(reranker.model.calls, 1)
+        self.assertEqual(reranker.stats()["skipped"], 3)
+
+    def test_failed_background_load_is_retried(self):
+        reranker = self.make_reranker()
+        with mock.patch.object(reranker, "warm_up", side_effect=OSError("no model")):
+            reranker._load_in_background()
+            reranker._loader.join()
+        self.assertIsNone(reranker._loader)
+
+
+# ==============================
+# Chunking
+# ==============================
+def count_words(text):
+    return len(text.split())
+
+
+class ChunkingTests(SimpleTestCase):
+    def write_source(self, text):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "source.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_units_carry_their_heading_path(self):
+        path = self.write_source(
+            "# Rice\nIntro line.\n## Blast\nBrown spots appear. Leaves dry out.\n# Tomato\nLate blight.\n"
+        )
+
+        self.assertEqual(list(prepare_chunks.iter_units(path)), [
+            ("Rice", "Intro line."),
+            ("Rice > Blast", "Brown spots appear."),
+            ("Rice > Blast", "Leaves dry out."),
+            ("Tomato", "Late blight."),
+        ])
+
+    def test_chunks_respect_budget_and_sentences(self):
+        units = [("A", "one two three."), ("A", "four five."), ("A", "six seven eight nine.")]
+
+        chunks = list(prepare_chunks.create_chunks(units, count_words, max_tokens=5, overlap=0))
+
+        self.assertEqual(chunks, [("A", "one two three.\nfour five."), ("A", "six seven eight nine.")])
+
+    def test_chunks_never_span_sections(self):
+        units = [("A", "one."), ("B", "two.")]
+        chunks = list(prepare_chunks.create_chunks(units, count_words, max_tokens=50, overlap=0))
+        self.assertEqual(chunks, [("A", "one."), ("B", "two.")])
+
+    def test_long_sentence_is_split_on_words(self):
+        units = [("A", "a b c d e f g")]
+        chunks = list(prepare_chunks.create_chunks(units, count_words, max_tokens=3, overlap=0))
+        self.assertEqual([text for _, text in chunks], ["a b c", "d e f", "g"])
+
+    def test_overlap_repeats_last_sentence(self):
+        units = [("A", "one two."), ("A", "three four."), ("A", "five six.")]
+        chunks = list(prepare_chunks.create_chunks(units, count_words, max_tokens=4, overlap=1))
+        self.assertEqual([text for _, text in chunks],
+                         ["one two.\nthree four.", "three four.\nfive six."])
+
+    def test_counts_tokens_with_the_embedding_model_tokenizer(self):
+        tokenizer = mock.Mock()
+        tokenizer.encode.side_effect = lambda text, add_special_tokens: list(text)
+        provider = mock.Mock()
+        provider.model.tokenizer = tokenizer
+
+        with mock.patch.object(prepare_chunks, "get_embedding_provider", return_value=provider) as get:
+            count_tokens = prepare_chunks.load_token_counter("some-model")
+
+        get.assert_called_once_with("some-model")
+        self.assertEqual(count_tokens("abc"), 3)
+
+    def test_estimates_tokens_without_a_model(self):
+        with mock.patch.object(prepare_chunks, "get_embedding_provider", side_effect=OSError("offline")):
+            count_tokens = prepare_chunks.load_token_counter("some-model")
+        self.assertEqual(count_tokens("one two three"), 4)
+
+
+# ==============================
+# Sparse vectors and hybrid fusion
+# ==============================
+def sparse_dot(query, document):
+    weights = dict(zip(*document))
+    return sum(v * weights.get(i, 0.0) for i, v in zip(*query))
+
+
+class SparseTests(SimpleTestCase):
+    docs = [
+        "rice blast causes diamond shaped lesions on rice leaves",
+        "brown spot causes small brown lesions on rice leaves",
+        "late blight turns tomato leaves black",
+    ]
+
+    def setUp(self):
+        builder = SparseStatsBuilder()
+        for text in self.docs:
+            builder.add(text)
+        self.encoder = builder.build()
+
+    def test_tokenize_drops_stopwords_and_single_letters(self):
+        self.assertEqual(tokenize("The symptoms of Rice blast: a lesion on leaves"),
+                         ["rice", "blast", "lesion", "leaves"])
+
+    def test_query_weights_rare_terms_higher(self):
+        indices, values = self.encoder.encode_query("blast leaves")
+        weights = dict(zip(indices, values))
+        self.assertGreater(weights[term_id("blast")], weights[term_id("leaves")])
+
+    def test_unknown_terms_are_dropped(self):
+        self.assertEqual(self.encoder.encode_query("tractor noise"), ([], []))
+
+    def test_bm25_scores_keyword_matches(self):
+        query = self.encoder.encode_query("blast")
+        scores = [sparse_dot(query, self.encoder.encode_document(text)) for text in self.docs]
+        self.assertGreater(scores[0], 0)
+        self.assertEqual(scores[1:], [0, 0])
+
+    def test_stats_round_trip(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "sparse.json")
+
+        self.encoder.save(path)
+        loaded = SparseEncoder.load(path)
+
+        self.assertEqual(loaded.encode_query("blast leaves"), self.encoder.encode_query("blast leaves"))
+
+
+class FuseResultsTests(SimpleTestCase):
+    def test_without_sparse_hits_keeps_dense_results(self):
+        dense = [{"id": "a", "similarity": 0.8}, {"id": "b", "similarity": 0.5}]
+        self.assertEqual(fuse_results(dense, [], [1.0, 0.0], top_k=1), dense[:1])
+
+    def test_fused_score_and_dense_similarity(self):
+        dense = [{"id": "a", "similarity": 0.8}, {"id": "b", "similarity": 0.6}]
+        sparse = [{"id": "b", "similarity": 4.0}, {"id": "a", "similarity": 1.0}]
+
+        fused = fuse_results(dense, sparse, [1.0, 0.0], top_k=2, alpha=0.5)
+
+        self.assertEqual([r["id"] for r in fused], ["b", "a"])
+        self.assertAlmostEqual(fused[0]["similarity"], 0.5 * 0.6 + 0.5 * 1.0)
+        self.assertAlmostEqual(fused[1]["similarity"], 0.5 * 0.8 + 0.5 * 0.25)
+        self.assertEqual([r["dense_similarity"] for r in fused], [0.6, 0.8])
+
+    def test_sparse_only_hit_gets_its_cosine(self):
+        sparse = [{"id": "c", "similarity": 2.0, "vector": [3.0, 4.0]}]
+
+        fused, = fuse_results([], sparse, [1.0, 0.0], top_k=5, alpha=0.5)
+
+        self.assertAlmostEqual(fused["dense_similarity"], 0.6)
+        self.assertNotIn("vector", fused)
+
+
+# ==============================
+# Prompt assembly
+# ==============================
+class PromptTests(SimpleTestCase):
+    def test_orders_by_score(self):
+        context = assemble_context([
+            make_result("Brown Spot", 0.5, text="Brown spot text."),
+            make_result("Blast", 0.7, text="Blast text."),
+        ], max_tokens=100)
+        self.assertEqual(context, ["Blast text.", "Brown spot text."])
+
+    def test_reranked_results_come_first(self):
+        context = assemble_context([
+            make_result("Blast", 0.7, text="Blast text."),
+            make_result("Brown Spot", 0.5, text="Brown spot text.", rerank_score=2.0),
+        ], max_tokens=100)
+        self.assertEqual(context, ["Brown spot text.", "Blast text."])
+
+    def test_drops_second_chunk_of_a_disease(self):
+        context = assemble_context([
+            make_result("Blast", 0.7, text="Blast text."),
+            dict(make_result("Blast", 0.6, text="More about blast."), id="blast-2"),
+        ], max_tokens=100)
+        self.assertEqual(context, ["Blast text."])
+
+    def test_drops_near_identical_text(self):
+        text = "Spray tricyclazole at tillering and keep the field flooded"
+        context = assemble_context([
+            make_result(None, 0.7, crop=None, text=text),
+            make_result(None, 0.6, crop=None, text=text + "."),
+        ], max_tokens=100)
+        self.assertEqual(context, [text])
+
+    def test_missing_crop_and_disease_are_allowed(self):
+        results = [{"id": "x", "similarity": 0.7, "meta": {"crop": None, "disease": None, "text": None}},
+                   {"id": "y", "similarity": 0.6, "meta": {"crop": None, "disease": None, "text": "Kept."}}]
+        self.assertEqual(assemble_context(results, max_tokens=100), ["Kept."])
+
+    def test_trims_to_budget(self):
+        results = [
+            make_result("Blast", 0.7, text="a" * 40),       # 10 tokens
+            make_result("Brown Spot", 0.6, text="b" * 40),  # 10 tokens, doesn't fit
+            make_result("Sheath Blight", 0.5, text="c" * 8),  # 2 tokens, fits
+        ]
+        self.assertEqual(assemble_context(results, max_tokens=15), ["a" * 40, "c" * 8])
+
+    def test_best_chunk_is_cut_to_fit(self):
+        context = assemble_context([make_result("Blast", 0.7, text="word " * 100)], max_tokens=11)
+        self.assertLessEqual(count_tokens(context[0]), 10)
+
+    def test_non_latin_text_counts_a_token_per_character(self):
+        self.assertEqual(count_tokens("पत्ती"), 5)
+        self.assertEqual(count_tokens("leaf spots"), 3)
+
+    def test_prompt_leaves_room_for_the_answer(self):
+        results = [make_result(f"Disease {i}", 0.9 - i / 100, text=f"Disease {i} " + "x" * 1000)
+                   for i in range(20)]
+        prompt = build_prompt(RICE_QUESTION, results, model="tinyllama")
+        self.assertLessEqual(count_tokens(prompt) + LLM_ANSWER_TOKENS, 2048 * TOKEN_ESTIMATE_MARGIN)
+        self.assertIn("Disease 0 ", prompt)
+
+
+# ==============================
+# Endee wire format
+# ==============================
+def vector_result(vector_id, similarity, meta, filter=None, norm=1.0, vector=()):
+    """One search hit in ndd::VectorResult field order (endee/src/utils/msgpack_ndd.hpp)."""
+    return [similarity, vector_id, encode_meta(meta), json.dumps(filter or {}), norm, list(vector)]
+
+
+class FakeResponse:
+    status_code = 200
+    text = ""
+
+    def __init__(self, content=b""):
+        self.content = content
+
+
+class WireFormatTests(SimpleTestCase):
+    def setUp(self):
+        self.client = EndeeClient()
+        self.sent = []
+        patcher = mock.patch.object(self.client.session, "request", side_effect=self.respond)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = EndeeIndex(self.client, "crops")
+        self.hits = {"dense": [], "sparse": []}
+
+    def respond(self, method, url, **kwargs):
+        self.sent.append((method, url, kwargs))
+        body = kwargs.get("json") or {}
+        hits = self.hits["sparse" if "sparse_indices" in body else "dense"]
+        return FakeResponse(msgpack.packb(hits, use_bin_type=True))
+
+    def test_meta_round_trip(self):
+        meta = {"crop": "Rice", "disease": "Blast", "text": "Brown spots"}
+        self.assertEqual(decode_meta(encode_meta(meta)), meta)
+        self.assertEqual(decode_meta(json.dumps(meta).encode("utf-8")), meta)  # stored without zlib
+        self.assertEqual(decode_meta(b""), {})
+
+    def test_decode_results_reads_vector_result_fields(self):
+        payload = msgpack.packb([
+            vector_result("rice-blast", 0.9, {"disease": "Blast"}, {"crop": "Rice"}, 2.0, [0.6, 0.8]),
+            vector_result("rice-smut", 0.5, {"disease": "Smut"}),
+        ], use_bin_type=True)
+
+        first, second = decode_results(payload)
+        self.assertEqual(first, {
+            "id": "rice-blast", "similarity": 0.9, "meta": {"disease": "Blast"},
+            "filter": {"crop": "Rice"}, "norm": 2.0, "vector": [0.6, 0.8],
+        })
+        self.assertEqual(second["id"], "rice-smut")
+        self.assertNotIn("vector", second)
+
+    def test_upsert_packs_hybrid_vector_objects(self):
+        self.index.upsert([{
+            "id": 7, "vector": [3.0, 4.0], "meta": {"disease": "Blast"}, "filter": {"crop": "Rice"},
+            "sparse_indices": [5, 9], "sparse_values": [0.5, 1.5],
+        }])
+
+        method, url, kwargs = self.sent[0]
+        self.assertEqual((method, url), ("POST", f"{ENDEE_BASE_URL}/index/crops/vector/insert"))
+        self.assertEqual(kwargs["headers"]["Content-Type"], "application/msgpack")
+
+        # ndd::HybridVectorObject: id, meta, filter, norm, vector, sparse_ids, sparse_values
+        [(vector_id, meta, filter, norm, vector, sparse_ids, sparse_values)] = msgpack.unpackb(
+            kwargs["data"], raw=False
+        )
+        self.assertEqual(vector_id, "7")
+        self.assertIsInstance(meta, bytes)
+        self.assertEqual(decode_meta(meta), {"disease": "Blast"})
+        self.assertEqual(json.loads(filter), {"crop": "Rice"})
+        self.assertAlmostEqual(norm, 5.0)
+        np.testing.assert_allclose(vector, [0.6, 0.8], rtol=1e-6)  # cosine indexes store unit vectors
+        self.assertEqual((sparse_ids, sparse_values), ([5, 9], [0.5, 1.5]))
+
+    def test_search_body(self):
+        body = search_body("cosine", [3.0, 4.0], top_k=3, filter=[{"crop": {"$eq": "Rice"}}], ef=64,
+                           sparse_indices=[5], sparse_values=[1.0])
+
+        np.testing.assert_allclose(body.pop("vector"), [0.6, 0.8], rtol=1e-6)
+        self.assertEqual(body, {
+            "k": 3, "include_vectors": False, "ef": 64,
+            "filter": json.dumps([{"crop": {"$eq": "Rice"}}]),
+            "sparse_indices": [5], "sparse_values": [1.0],
+        })
+        self.assertEqual(search_body("l2", [3.0, 4.0])["vector"], [3.0, 4.0])
+
+    def test_hybrid_query_decodes_both_searches(self):
+        self.hits["dense"] = [vector_result("rice-blast", 0.9, {"disease": "Blast"})]
+        self.hits["sparse"] = [vector_result("rice-smut", 4.0, {"disease": "Smut"}, vector=[0.6, 0.8])]
+
+        results = hybrid_query(self.index, [1.0, 0.0], ([5], [1.0]), top_k=2)
+
+        dense_body, sparse_body = (kwargs["json"] for _, _, kwargs in self.sent)
+        self.assertNotIn("sparse_indices", dense_body)
+        self.assertEqual((sparse_body["sparse_indices"], sparse_body["include_vectors"]), ([5], True))
+
+        by_id = {r["id"]: r for r in results}
+        self.assertEqual(set(by_id), {"rice-blast", "rice-smut"})
+        self.assertEqual(by_id["rice-smut"]["meta"], {"disease": "Smut"})
+        # The sparse-only hit's cosine comes from the vector Endee sent back
+        self.assertAlmostEqual(by_id["rice-smut"]["dense_similarity"], 0.6, places=6)
+        self.assertAlmostEqual(by_id["rice-blast"]["dense_similarity"], 0.9)
+
+
+# ==============================
+# Local fallback index
+# ==============================
+LOCAL_RECORDS = [
+    {"crop": "Rice", "disease": "Blast", "text": "Blast causes brown spots on rice leaves.",
+     "filter": {"crop": canonical_crop("rice")}},
+    {"id": "tomato-blight", "crop": "Tomato", "disease": "Late Blight",
+     "text": "Late blight turns tomato leaves black.", "filter": {"crop": canonical_crop("tomato")}},
+]
+
+
+class DownIndex:
+    name = "test"
+
+    def query(self, **kwargs):
+        raise EndeeUnavailable("connection refused")
+
+
+class FakeAnnIndex:
+    """Stands in for a FAISS index: returns every row as a candidate."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def search(self, q, k):
+        return None, np.arange(self.count).reshape(1, -1)
+
+
+class LocalIndexTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.prefix = os.path.join(tmp.name, "local", "kb")
+        write_local_index(self.prefix, [[2.0, 0.2, 0.0], [0.0, 3.0, 0.0]], LOCAL_RECORDS,
+                          dtype="float16", model="fake")
+        self.local = LocalIndex(self.prefix)
+
+        patcher = mock.patch("chatbot.rag.index_state.INDEX_STATE_FILE",
+                             os.path.join(tmp.name, "index_state.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.local), 2)
+        self.assertEqual(self.local.model, "fake")
+        self.assertEqual(self.local.vectors.dtype, np.float16)
+        np.testing.assert_allclose(np.linalg.norm(self.local.vectors.astype(np.float32), axis=1), 1.0,
+                                   rtol=1e-3)
+
+        first = self.local.record(0)
+        self.assertEqual(first, dict(LOCAL_RECORDS[0], id=record_id(LOCAL_RECORDS[0])))
+        self.assertEqual(self.local.record(1), LOCAL_RECORDS[1])
+
+    def test_query_matches_endee_result_shape(self):
+        best, second = self.local.query(vector=[1.0, 0.1, 0.0], top_k=2, include_vectors=True)
+
+        self.assertEqual(best["id"], record_id(LOCAL_RECORDS[0]))
+        self.assertAlmostEqual(best["similarity"], 1.0, places=3)
+        self.assertEqual(best["meta"]["disease"], "Blast")
+        self.assertEqual(best["filter"], LOCAL_RECORDS[0]["filter"])
+        self.assertEqual(len(best["vector"]), 3)
+        self.assertEqual(second["id"], "tomato-blight")
+
+    def test_query_applies_filter(self):
+        results = self.local.query(vector=[1.0, 0.1, 0.0], top_k=2,
+                                   filter=[{"crop": {"$eq": canonical_crop("tomato")}}])
+        self.assertEqual([r["id"] for r in results], ["tomato-blight"])
+
+    def test_ann_search_leaves_query_vector_alone(self):
+        self.local.ann = FakeAnnIndex(len(self.local))
+        vector = np.array([2.0, 0.2, 0.0], dtype=np.float32)
+        original = vector.copy()
+
+        best = self.local.query(vector=vector, top_k=1)[0]
+
+        self.assertAlmostEqual(best["similarity"], 1.0, places=3)
+        np.testing.assert_array_equal(vector, original)
+
+    def test_search_falls_back_when_endee_is_down(self):
+        with mock.patch("chatbot.rag.endee_index.get_fallback_index", return_value=self.local):
+            results = search_with_fallback(DownIndex(), [1.0, 0.1, 0.0], top_k=2)
+
+        self.assertEqual(results[0]["meta"]["disease"], "Blast")
+        self.assertTrue(all(r["fallback"] for r in results))
+
+    def test_search_without_fallback_index_raises(self):
+        with mock.patch("chatbot.rag.endee_index.get_fallback_index", return_value=None):
+            with self.assertRaises(EndeeUnavailable):
+                search_with_fallback(DownIndex(), [1.0, 0.1, 0.0], top_k=2)
+
+    def test_fallback_answer_is_not_cached(self):
+        service = make_service(DownIndex(), cache=ResponseCache(index_name="test"))
+
+        with mock.patch("chatbot.rag.endee_index.get_fallback_index", return_value=self.local):
+            first = service.answer(RICE_QUESTION)
+            service.answer(RICE_QUESTION)
+
+        self.assertIn("Disease: Blast", first["reply"])
+        self.assertEqual(service.provider.encoded, [RICE_QUESTION, RICE_QUESTION])
+        self.assertEqual(service.cache.stats()["entries"], 0)
+
+
+# ==============================
+# Embedding cache
+# ==============================
+def vec(*values):
+    return np.array(values, dtype=np.float32)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch("chatbot.rag.embedding_cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = EmbeddingCache("fake", max_entries=2, ttl=60)
+
+    def test_hit_ignores_case_and_punctuation(self):
+        self.cache.put("Brown spots on leaves!", vec(1.0, 0.0))
+
+        np.testing.assert_array_equal(self.cache.get("brown  spots on leaves"), [1.0, 0.0])
+        self.assertIsNone(self.cache.get("black spots on leaves"))
+        self.assertEqual(self.cache.stats()["hit_ratio"], 0.5)
+
+    def test_keys_are_per_model(self):
+        self.assertNotEqual(self.cache.key("spots"), EmbeddingCache("other").key("spots"))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put("a", vec(1.0))
+        self.cache.put("b", vec(2.0))
+        self.cache.get("a")
+        self.cache.put("c", vec(3.0))
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+    def test_evicts_past_memory_limit(self):
+        cache = EmbeddingCache("fake", max_bytes=8)
+        cache.put("a", vec(1.0))
+        cache.put("b", vec(2.0))
+        cache.put("c", vec(3.0))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 8)
+
+    def test_entries_expire(self):
+        self.cache.put("a", vec(1.0))
+
+        self.now += 59.0
+        self.assertIsNotNone(self.cache.get("a"))
+        self.now += 2.0
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_cached_vectors_are_read_only(self):
+        self.cache.put("a", vec(1.0))
+        with self.assertRaises(ValueError):
+            self.cache.get("a")[0] = 2.0
+
+    def test_shared_tier_fills_local_tier(self):
+        writer = EmbeddingCache("fake", django_cache_alias="default")
+        reader = EmbeddingCache("fake", django_cache_alias="default")
+        self.addCleanup(caches["default"].clear)
+        writer.put("a", vec(1.0))
+
+        np.testing.assert_array_equal(reader.get("a"), [1.0])
+        reader.get("a")
+        self.assertEqual((reader.stats()["shared_hits"], reader.stats()["hits"]), (1, 1))
+
+
+# ==============================
+# Crop filters
+# ==============================
+class RecordingIndex:
+    """Wraps an index and records the filter of every query."""
+
+    def __init__(self, index):
+        self.index = index
+        self.filters = []
+
+    def query(self, **kwargs):
+        self.filters.append(kwargs.get("filter"))
+        return self.index.query(**kwargs)
+
+
+class AsyncRecordingIndex:
+    """RecordingIndex with the AsyncEndeeIndex interface."""
+
+    def __init__(self, index):
+        self.index = index
+
+    async def query(self, **kwargs):
+        return self.index.query(**kwargs)
+
+
+class CropTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch("chatbot.rag.crops.CROP_VOCAB_FILE", os.path.join(tmp.name, "crops.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = RecordingIndex(make_index())
+
+    def test_detects_single_crop(self):
+        self.assertEqual(detect_crop("My tomatoes have black spots"), "Tomato")
+        self.assertEqual(detect_crop("spots on paddy leaves"), "Rice")
+        self.assertIsNone(detect_crop("spots on rice and wheat"))
+        self.assertIsNone(detect_crop(RICE_QUESTION))
+
+    def test_canonical_crop(self):
+        self.assertEqual(canonical_crop("  RICE "), "Rice")
+        self.assertEqual(canonical_crop("Okra"), "Okra")
+        self.assertIsNone(canonical_crop(""))
+
+    def test_vocabulary_follows_ingested_crops(self):
+        save_vocabulary(["Okra", "Rice"])
+
+        self.assertEqual(detect_crop("okra leaves curl"), "Okra")
+        self.assertIsNone(detect_crop("tomato leaves curl"))
+
+    def test_crop_filter_is_pushed_to_the_index(self):
+        results = query_for_crop(self.index, [1.0, 0.1, 0.0], top_k=2, crop="Tomato")
+
+        self.assertEqual(self.index.filters, [crop_filter("Tomato")])
+        self.assertEqual([r["id"] for r in results], ["tomato-blight"])
+
+    def test_unknown_crop_falls_back_to_every_crop(self):
+        results = query_for_crop(self.index, [1.0, 0.1, 0.0], top_k=2, crop="Wheat")
+
+        self.assertEqual(self.index.filters, [crop_filter("Wheat"), None])
+        self.assertEqual(results[0]["id"], "rice-blast")
+
+    def test_hybrid_search_filters_both_queries(self):
+        query_for_crop(self.index, [1.0, 0.1, 0.0], top_k=2, crop="Tomato", sparse_query=([5], [1.0]))
+        self.assertEqual(self.index.filters, [crop_filter("Tomato")] * 2)
+
+    def test_async_query_matches_sync_query(self):
+        expected = query_for_crop(self.index, [1.0, 0.1, 0.0], top_k=2, crop="Tomato")
+        self.assertEqual(
+            asyncio.run(query_for_crop_async(AsyncRecordingIndex(self.index), [1.0, 0.1, 0.0], 2, crop="Tomato")),
+            expected,
+        )
+
+
+# ==============================
+# Answer cache
+# ==============================
+class AnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("chatbot.rag.answer_cache.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = make_answer_cache(self, max_entries=2, max_distance=0.05, ttl=60)
+
+    def put(self, answer, vector=(1.0, 0.0, 0.0), chunk_ids=("rice-blast",)):
+        self.now += 1.0
+        self.cache.put(answer, vector, list(chunk_ids), answer)
+
+    def get(self, vector=(1.0, 0.0, 0.0), chunk_ids=("rice-blast",)):
+        self.now += 1.0
+        return self.cache.get(vector, list(chunk_ids))
+
+    def test_close_question_reuses_answer(self):
+        self.put("Spray early.")
+
+        self.assertEqual(self.get((2.0, 0.2, 0.0)), "Spray early.")  # cosine distance ~0.005
+        self.assertIsNone(self.get((1.0, 0.5, 0.0)))  # ~0.106
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_chunk_ids_must_match_exactly(self):
+        self.put("Spray early.", chunk_ids=("rice-blast", "rice-smut"))
+
+        self.assertIsNone(self.get(chunk_ids=("rice-blast",)))
+        self.assertIsNone(self.get(chunk_ids=("rice-smut", "rice-blast")))
+        self.assertEqual(self.get(chunk_ids=("rice-blast", "rice-smut")), "Spray early.")
+
+    def test_answers_are_per_llm_model(self):
+        self.put("Spray early.")
+        other = AnswerCache(path=self.cache.path, llm_model="other")
+        self.assertIsNone(other.get([1.0, 0.0, 0.0], ["rice-blast"]))
+
+    def test_other_embedding_size_never_matches(self):
+        self.put("Spray early.")
+        self.assertIsNone(self.get((1.0, 0.0)))
+
+    def test_evicts_least_recently_used(self):
+        self.put("blast", chunk_ids=("rice-blast",))
+        self.put("blight", chunk_ids=("tomato-blight",))
+        self.get(chunk_ids=("rice-blast",))
+        self.put("smut", chunk_ids=("rice-smut",))
+
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertIsNone(self.get(chunk_ids=("tomato-blight",)))
+        self.assertEqual(self.get(chunk_ids=("rice-blast",)), "blast")
+
+    def test_expired_answers_are_not_served(self):
+        self.put("Spray early.")
+        self.now += 60.0
+        self.assertIsNone(self.get())
+
+        self.put("Spray later.", chunk_ids=("rice-smut",))
+        self.assertEqual(self.cache.stats()["entries"], 1)  # the expired entry was dropped
+
+
+# ==============================
+# Metrics
+# ==============================
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        for name in ("_stages", "_errors"):
+            patcher = mock.patch(f"chatbot.rag.metrics.{name}", {})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_summary_quantiles(self):
+        summary = LatencySummary(window=100)
+        for ms in range(1, 101):
+            summary.observe(ms / 1000)
+
+        count, total, quantiles = summary.snapshot()
+        self.assertEqual(count, 100)
+        self.assertAlmostEqual(total, 5.05)
+        self.assertEqual(quantiles, {0.5: 0.051, 0.95: 0.096, 0.99: 0.1})
+
+    def test_renders_stages_caches_and_errors(self):
+        observe("search", 0.25)
+        observe("search", 0.75)
+        count_endee_error("unavailable")
+        cache = EmbeddingCache("fake")
+        cache.put("a", np.zeros(1, dtype=np.float32))
+        cache.get("a")
+        cache.get("b")
+
+        lines = render_prometheus({"embedding": cache, "response": None}).splitlines()
+
+        self.assertIn("# TYPE chatbot_stage_seconds summary", lines)
+        self.assertIn('chatbot_stage_seconds{stage="search",quantile="0.5"} 0.750000', lines)
+        self.assertIn('chatbot_stage_seconds_sum{stage="search"} 1.000000', lines)
+        self.assertIn('chatbot_stage_seconds_count{stage="search"} 2', lines)
+        self.assertIn('chatbot_cache_hits_total{cache="embedding"} 1', lines)
+        self.assertIn('chatbot_cache_misses_total{cache="embedding"} 1', lines)
+        self.assertIn('chatbot_cache_hit_ratio{cache="embedding"} 0.5', lines)
+        self.assertIn('chatbot_endee_errors_total{kind="unavailable"} 1', lines)
+        self.assertFalse(any('cache="response"' in line for line in lines))
+
+    def test_escapes_label_values(self):
+        observe('say "hi"\n', 0.1)
+        self.assertIn('stage="say \\"hi\\"\\n"', render_prometheus())
+
+
+# ==============================
+# Incremental ingestion
+# ==============================
+def disease_record(disease, symptoms):
+    return {"disease": disease, "symptoms": symptoms, "temporary_solution": "Remove leaves.",
+            "permanent_solution": "Spray fungicide.", "prevention_advice": "Rotate crops."}
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size):
+        self.encoded.extend(texts)
+        return np.ones((len(texts), 3), dtype=np.float32)
+
+
+class IngestManifestTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.manifest = os.path.join(tmp.name, "manifest.json")
+        self.index = InMemoryIndex("crops", dim=3)
+        self.model = FakeModel()
+        patcher = mock.patch.object(ingest_embeddings, "load_model", return_value=self.model)
+        self.load_model = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_ingest(self, records):
+        """main() without argparse: returns (vectors upserted, ids deleted)."""
+        manifest_ids, reusable = ingest_embeddings.load_manifest(self.manifest, index_name="crops")
+        if reusable and ingest_embeddings.index_count(self.index) != len(manifest_ids):
+            reusable = False
+        known_ids = manifest_ids if reusable else set()
+
+        seen_ids, seen_crops = set(), set()
+        changed = ingest_embeddings.iter_changed(records, known_ids, seen_ids, seen_crops)
+        batches = ingest_embeddings.batched(changed, 2)
+        total = ingest_embeddings.ingest(self.index, ingest_embeddings.encode_local(batches, 2))
+
+        removed = manifest_ids - seen_ids
+        ingest_embeddings.delete_vectors(self.index, removed)
+        ingest_embeddings.save_manifest(self.manifest, seen_ids, index_name="crops")
+        return total, removed
+
+    def test_unchanged_dataset_does_no_encoder_work(self):
+        records = [("Rice", disease_record("Blast", "Brown spots")),
+                   ("Tomato", disease_record("Late Blight", "Black leaves"))]
+        self.assertEqual(self.run_ingest(records), (2, set()))
+
+        self.assertEqual(self.run_ingest(records), (0, set()))
+        self.assertEqual(self.load_model.call_count, 1)
+        self.assertEqual(len(self.model.encoded), 2)
+
+    def test_only_changed_records_are_reembedded(self):
+        blast = ("Rice", disease_record("Blast", "Brown spots"))
+        self.run_ingest([blast, ("Tomato", disease_record("Late Blight", "Black leaves"))])
+        self.model.encoded.clear()
+
+        total, removed = self.run_ingest([blast, ("Tomato", disease_record("Late Blight", "Black rot"))])
+
+        self.assertEqual(total, 1)
+        self.assertEqual(len(removed), 1)
+        self.assertIn("Symptoms: Black rot", self.model.encoded[0])
+        self.assertEqual(len(self.index), 2)
+
+    def test_ids_are_content_hashes(self):
+        text = ingest_embeddings.build_text("Rice", disease_record("Blast", "Brown spots"))
+        self.assertEqual(ingest_embeddings.record_id("Rice", "Blast", text),
+                         ingest_embeddings.record_id("Rice", "Blast", text))
+        self.assertNotEqual(ingest_embeddings.record_id("Rice", "Blast", text),
+                            ingest_embeddings.record_id("Rice", "Blast", text + " "))
+
+    def test_manifest_from_other_model_or_mode_is_not_reused(self):
+        ingest_embeddings.save_manifest(self.manifest, {"a"}, index_name="crops", model_name="old")
+        self.assertEqual(ingest_embeddings.load_manifest(self.manifest, index_name="crops"), ({"a"}, False))
+
+        ingest_embeddings.save_manifest(self.manifest, {"a"}, index_name="crops")
+        self.assertEqual(ingest_embeddings.load_manifest(self.manifest, index_name="crops", sparse=True),
+                         ({"a"}, False))
+        self.assertEqual(ingest_embeddings.load_manifest(self.manifest, index_name="other"), (set(), False))
+
+    def test_recreated_index_is_refilled(self):
+        records = [("Rice", disease_record("Blast", "Brown spots"))]
+        self.run_ingest(records)
+        self.index = InMemoryIndex("crops", dim=3)  # deleted and recreated under the same name
+
+        self.assertEqual(self.run_ingest(records), (1, set()))
+
+
+# ==============================
+# Flask app
+# ==============================
+def load_flask_app(test):
+    """Import project/app.py without loading models or touching the real answer cache."""
+    with mock.patch("chatbot.rag.service.get_rag_service"), \
+            mock.patch("chatbot.rag.llm.get_llm", return_value=FakeLLM()), \
+            mock.patch("chatbot.rag.answer_cache.AnswerCache",
+                       side_effect=lambda **kwargs: make_answer_cache(test)):
+        return importlib.import_module("project.app")
+
+
+def parse_sse(body):
+    """[(event, data), ...] from a Server-Sent Events body."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+@skipUnless(importlib.util.find_spec("flask_cors"), "flask_cors is not installed")
+class FlaskChatStreamTests(SimpleTestCase):
+    def setUp(self):
+        self.app = load_flask_app(self)
+        self.llm = FakeLLM(reply="Spray tricyclazole early.")
+        for name, value in (("rag_service", make_service(make_index())), ("llm", self.llm),
+                            ("answer_cache", make_answer_cache(self))):
+            patcher = mock.patch.object(self.app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = self.app.app.test_client()
+
+    def stream(self, message):
+        resp = self.client.post("/chat/stream", json={"message": message})
+        self.assertEqual(resp.mimetype, "text/event-stream")
+        return parse_sse(resp.get_data(as_text=True))
+
+    def test_streams_tokens_then_done(self):
+        self.assertEqual(self.stream(RICE_QUESTION), [
+            ("message", {"token": "Spray"}), ("message", {"token": " tricyclazole"}),
+            ("message", {"token": " early."}), ("done", {"confidence": 1.0}),
+        ])
+
+    def test_second_ask_is_served_from_answer_cache(self):
+        self.stream(RICE_QUESTION)
+        events = self.stream(RICE_QUESTION)
+
+        self.assertEqual(events[0], ("message", {"token": "Spray tricyclazole early."}))
+        self.assertEqual(events[-1], ("done", {"confidence": 1.0, "cached": True}))
+        self.assertEqual(len(self.llm.prompts), 1)
+
+    def test_unanswerable_question_is_one_done_event(self):
+        [(event, data)] = self.stream(UNKNOWN_QUESTION)
+        self.assertEqual(event, "done")
+        self.assertIn("not confident", data["reply"])
+
+    def test_llm_failure_ends_with_error_event(self):
+        with mock.patch.object(self.app, "llm", BrokenLLM()):
+            events = self.stream(RICE_QUESTION)
+        self.assertEqual(events[-1], ("error", {"reply": "The language model is not available."}))
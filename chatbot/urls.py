@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.chat_page, name='chat_page'),        # /chat/
     path('ragbot/', views.rag_chatbot, name='rag_chatbot'),  # /chat/ragbot/
+    path('ragbot/async/', views.rag_chatbot_async, name='rag_chatbot_async'),  # /chat/ragbot/async/
+    path('metrics/', views.metrics, name='chat_metrics'),  # /chat/metrics/
 ]
@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration for the Smart Farm Django app.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+
+The app (and the chatbot embedding model) is loaded once in the master
+process and shared copy-on-write by the forked workers, instead of every
+worker loading its own ~100 MB copy of the model.
+"""
+
+import gc
+import os
+
+wsgi_app = "user_dashboard.wsgi:application"
+raw_env = ["DJANGO_SETTINGS_MODULE=user_dashboard.settings"]
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+preload_app = True
+
+# Torch threads per worker. Keep workers * threads <= CPU cores.
+TORCH_THREADS = int(os.getenv("TORCH_THREADS_PER_WORKER", "1"))
+
+
+def when_ready(server):
+    from chatbot.rag.embeddings import warm_up
+    from chatbot.rag.rerank import get_reranker
+
+    server.log.info("Preloading chatbot embedding model...")
+    warm_up()
+    reranker = get_reranker()
+    if reranker is not None:
+        server.log.info("Preloading chatbot rerank model...")
+        reranker.warm_up()
+    # Move everything loaded so far out of the GC's reach so that garbage
+    # collection in the workers doesn't touch (and copy) the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS)
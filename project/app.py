@@ -1,16 +1,15 @@
-from flask import Flask, request, jsonify
+import json
+import os
+import sys
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
-from endee import Endee
-import ollama
 
-# ==============================
-# Configuration
-# ==============================
-INDEX_NAME = "crop_diseases"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-LLM_MODEL = "tinyllama"   # or "phi"
-SIM_THRESHOLD = 0.45
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.answer_cache import AnswerCache  # noqa: E402
+from chatbot.rag.config import LLM_BACKEND, LLM_MODEL  # noqa: E402
+from chatbot.rag.llm import get_llm  # noqa: E402
+from chatbot.rag.service import get_rag_service  # noqa: E402
 
 # ==============================
 # Flask Setup
@@ -21,18 +20,17 @@ CORS(app)
 # ==============================
 # Load Models (load once)
 # ==============================
+# The chat pipeline shared with the Django app (chatbot/rag/service.py):
+# the embedding model is loaded once per process, and the vector index is
+# looked up per request, so a missing index or stopped Endee server
+# degrades to the local fallback or an error reply instead of keeping the
+# app from starting. VECTOR_BACKEND=memory runs without any server.
 print("Loading embedding model...")
-embed_model = SentenceTransformer(MODEL_NAME)
+rag_service = get_rag_service()
+rag_service.provider.warm_up()
 
-print("Connecting to Endee...")
-client = Endee()
-client.set_base_url("http://localhost:8080/api/v1")
-
-try:
-    index = client.get_index(name=INDEX_NAME)
-except:
-    print("Index not found! Create index and run ingestion first.")
-    exit()
+llm = get_llm(LLM_BACKEND, LLM_MODEL)
+answer_cache = AnswerCache(llm_model=LLM_MODEL)
 
 print("System Ready")
 
@@ -51,49 +49,52 @@ def chat():
     data = request.json
     user_query = data.get("message", "").strip()
 
-    if not user_query:
-        return jsonify({"reply": "Please enter symptoms."})
+    return jsonify(rag_service.answer(user_query))
 
-    if len(user_query.split()) < 3:
-        return jsonify({
-            "reply": "Please describe symptoms clearly (example: 'tomato leaves yellow with brown spots')."
-        })
 
-    # Embed query
-    query_vector = embed_model.encode(user_query).tolist()
+# ==============================
+# Streaming LLM Chat Route
+# ==============================
+def sse(data, event=None):
+    """Format one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-    # Retrieve best match
-    results = index.query(vector=query_vector, top_k=1)
 
-    if not results:
-        return jsonify({"reply": "No disease information found."})
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    LLM-augmented answer, streamed as Server-Sent Events:
 
-    best = results[0]
-    score = best["similarity"]
+        data: {"token": "..."}                  one per generated piece
+        event: done   data: {"confidence": ..}  when the answer is complete
+        event: error  data: {"reply": "..."}    if the LLM fails midway
 
-    if score < 0.45:
-        return jsonify({
-            "reply": "I’m not confident. Please provide more detailed symptoms.",
-            "confidence": round(score, 2)
-        })
+    Answers that don't need the LLM (empty/short query, no match, low
+    confidence) are sent as a single `done` event carrying the reply.
+    Cached answers (see chatbot/rag/answer_cache.py) arrive as one token.
+    """
+    data = request.json
+    user_query = data.get("message", "").strip()
 
-    # ===== Use stored metadata directly =====
-    text = best["meta"]["text"]
-    crop = best["meta"].get("crop", "Unknown")
-    disease = best["meta"].get("disease", "Unknown")
+    def generate():
+        for event, payload in rag_service.stream_answer(user_query, llm, answer_cache):
+            if event == "token":
+                yield sse({"token": payload})
+            else:
+                yield sse(payload, event=event)
 
-    reply = f"""
-Crop: {crop}
-Disease: {disease}
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-Details:
-{text}
-"""
 
-    return jsonify({
-        "reply": reply,
-        "confidence": round(score, 2)
-    })
+@app.route("/chat/stats")
+def chat_stats():
+    return jsonify({"answer_cache": answer_cache.stats()})
 
 
 # ==============================
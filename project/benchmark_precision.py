@@ -0,0 +1,141 @@
+"""
+benchmark_precision.py
+
+Compare Endee vector precisions on the crop disease corpus.
+
+For each precision a temporary index is created and filled with the same
+embeddings, then queried with symptom texts. Results are compared with
+exact float32 cosine search done in NumPy:
+
+    recall@k   overlap between Endee's top-k and the exact top-k
+    memory     estimated vector + HNSW graph bytes for the index
+    p50/p99    query latency as seen by the client
+
+Usage:
+    python benchmark_precision.py [--data data.json] [--k 5] [--queries queries.txt]
+                                  [--precisions float32 int8d binary] [--output results.json]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from ingest_embeddings import (
+    MODEL_NAME,
+    INDEX_NAME,
+    batched,
+    build_text,
+    iter_records,
+    make_vector,
+    record_id,
+    upsert_with_retry,
+)
+from manage_index import PRECISIONS, create_index, delete_index, storage_bytes
+from chatbot.rag.endee_client import get_client
+
+HNSW_M = 16  # Endee default; level-0 nodes keep 2*M 4-byte links
+
+
+def load_corpus(path):
+    ids, texts, queries = [], [], []
+    for crop, d in iter_records(path):
+        text = build_text(crop, d)
+        ids.append(record_id(crop, d["disease"], text))
+        texts.append((crop, d, text))
+        queries.append(f"{crop} {d['symptoms']}")
+    return ids, texts, queries
+
+
+def exact_top_k(query_vectors, doc_vectors, k):
+    sims = query_vectors @ doc_vectors.T
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def benchmark(client, precision, ids, texts, doc_vectors, query_vectors, truth, k):
+    name = f"{INDEX_NAME}_bench_{precision}"
+    try:
+        delete_index(name)
+    except Exception:
+        pass
+    create_index(name, precision=precision, dim=doc_vectors.shape[1])
+    index = client.get_index(name=name)
+
+    vectors = [
+        make_vector(vector_id, crop, d, text, vector)
+        for vector_id, (crop, d, text), vector in zip(ids, texts, doc_vectors)
+    ]
+    for chunk in batched(vectors, 500):
+        upsert_with_retry(index, chunk)
+
+    latencies = []
+    recalls = []
+    for query_vector, expected in zip(query_vectors, truth):
+        started = time.perf_counter()
+        results = index.query(vector=query_vector.tolist(), top_k=k)
+        latencies.append(time.perf_counter() - started)
+
+        expected_ids = {ids[i] for i in expected}
+        found_ids = {r["id"] for r in results}
+        recalls.append(len(expected_ids & found_ids) / len(expected_ids))
+
+    delete_index(name)
+
+    latencies_ms = 1000.0 * np.array(latencies)
+    n, dim = doc_vectors.shape
+    return {
+        "precision": precision,
+        f"recall@{k}": float(np.mean(recalls)),
+        "bytes_per_vector": storage_bytes(precision, dim),
+        "estimated_memory_mb": n * (storage_bytes(precision, dim) + 2 * HNSW_M * 4) / 1e6,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Endee precisions")
+    parser.add_argument("--data", default="data.json")
+    parser.add_argument("--queries", default=None,
+                        help="file with one query per line (default: crop + symptoms of each record)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--precisions", nargs="+", default=PRECISIONS, choices=PRECISIONS)
+    parser.add_argument("--output", default=None, help="save results as JSON")
+    args = parser.parse_args()
+
+    ids, texts, queries = load_corpus(args.data)
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    k = min(args.k, len(ids))
+
+    print(f"🔄 Embedding {len(ids)} documents and {len(queries)} queries...")
+    model = SentenceTransformer(MODEL_NAME)
+    doc_vectors = model.encode([text for _, _, text in texts], normalize_embeddings=True)
+    query_vectors = model.encode(queries, normalize_embeddings=True)
+    truth = exact_top_k(query_vectors, doc_vectors, k)
+
+    client = get_client()
+
+    results = []
+    for precision in args.precisions:
+        print(f"⏱ Benchmarking {precision}...")
+        results.append(benchmark(client, precision, ids, texts, doc_vectors, query_vectors, truth, k))
+
+    print()
+    print(f"{'precision':10} {f'recall@{k}':>10} {'bytes/vec':>10} {'memory MB':>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['precision']:10} {r[f'recall@{k}']:>10.3f} {r['bytes_per_vector']:>10} "
+              f"{r['estimated_memory_mb']:>10.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
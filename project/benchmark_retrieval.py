@@ -0,0 +1,248 @@
+"""
+benchmark_retrieval.py
+
+Benchmark the crop disease RAG path: retrieval quality and serving speed.
+
+A labeled query set (symptom text -> expected disease) is run through the
+same code the chatbot uses, against either the live Endee index or an
+in-process stand-in built from the data file, so it also works offline.
+
+    quality    recall@1, recall@k and MRR of the expected disease, plus
+               mean encode and search time per query
+    rerank     (--rerank) the same with the cross-encoder reranking the top
+               RERANK_CANDIDATES, plus its mean time per query
+    load       get_endee_response() end to end at each concurrency level:
+               p50/p95/p99 latency and queries per second
+
+Results are saved as JSON so runs can be compared for regressions.
+
+Labeled queries are a .jsonl file, one {"query": ..., "disease": ...,
+"crop": ...} object per line ("crop" is optional). Without --queries,
+each record's crop and symptoms are used as its query.
+
+Usage:
+    python benchmark_retrieval.py [--backend endee|memory|local] [--data data.json]
+                                  [--queries labeled.jsonl] [--k 5]
+                                  [--concurrency 1 4 16] [--requests 200]
+                                  [--embedding-cache] [--rerank] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ingest_embeddings import INDEX_NAME, build_text, iter_records, make_vector, record_id
+
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.crops import canonical_crop, detect_crop, query_for_crop  # noqa: E402
+from chatbot.rag.embeddings import get_embedding_provider  # noqa: E402
+from chatbot.rag.endee_client import get_index  # noqa: E402
+from chatbot.rag.endee_service import get_endee_response  # noqa: E402
+from chatbot.rag.local_index import LocalIndex, write_local_index  # noqa: E402
+from chatbot.rag.memory_index import InMemoryIndex  # noqa: E402
+from chatbot.rag.rerank import CrossEncoderReranker  # noqa: E402
+
+
+# ==============================
+# Inputs
+# ==============================
+def load_queries(path, data_path):
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return [
+        {"query": f"{crop} {d['symptoms']}", "disease": d["disease"], "crop": crop}
+        for crop, d in iter_records(data_path)
+    ]
+
+
+def build_memory_index(data_path, provider):
+    """Embed the data file into an InMemoryIndex (VECTOR_BACKEND=memory)."""
+    rows = [(crop, d, build_text(crop, d)) for crop, d in iter_records(data_path)]
+    print(f"🔄 Embedding {len(rows)} documents for the in-memory index...")
+    vectors = provider.encode_batch([text for _, _, text in rows])
+
+    index = InMemoryIndex(INDEX_NAME)
+    index.upsert([
+        make_vector(record_id(crop, d["disease"], text), crop, d, text, vector)
+        for (crop, d, text), vector in zip(rows, vectors)
+    ])
+    return index
+
+
+def build_local_index(data_path, provider, directory):
+    """Embed the data file into a LocalIndex (the offline fallback for Endee)."""
+    records, texts = [], []
+    for crop, d in iter_records(data_path):
+        text = build_text(crop, d)
+        records.append({
+            "id": record_id(crop, d["disease"], text),
+            "crop": crop,
+            "disease": d["disease"],
+            "text": text,
+            "filter": {"crop": crop},
+        })
+        texts.append(text)
+
+    print(f"🔄 Embedding {len(texts)} documents for the local index...")
+    prefix = os.path.join(directory, "kb")
+    write_local_index(prefix, provider.encode_batch(texts), records, model=provider.model_name)
+    return LocalIndex(prefix)
+
+
+# ==============================
+# Quality
+# ==============================
+def rank_of(results, expected):
+    """1-based rank of the first result for the expected disease, or None."""
+    for rank, r in enumerate(results, 1):
+        meta = r["meta"]
+        if meta.get("disease", "").lower() != expected["disease"].lower():
+            continue
+        if expected.get("crop") and meta.get("crop", "").lower() != expected["crop"].lower():
+            continue
+        return rank
+    return None
+
+
+def evaluate_quality(index, provider, queries, k, reranker=None):
+    ranks, encode_ms, search_ms, rerank_ms = [], [], [], []
+    # The reranker can only promote what the search returned
+    top_k = max(k, reranker.candidates) if reranker else k
+
+    for q in queries:
+        started = time.perf_counter()
+        vector = provider.encode(q["query"]).tolist()
+        encoded = time.perf_counter()
+        crop = canonical_crop(q.get("crop")) or detect_crop(q["query"])
+        results = query_for_crop(index, vector, top_k=top_k, crop=crop)
+        searched = time.perf_counter()
+        if reranker:
+            results = reranker.rerank(q["query"], results)
+            rerank_ms.append(1000.0 * (time.perf_counter() - searched))
+
+        encode_ms.append(1000.0 * (encoded - started))
+        search_ms.append(1000.0 * (searched - encoded))
+        ranks.append(rank_of(results[:k], q))
+
+    quality = {
+        "queries": len(queries),
+        "recall@1": float(np.mean([r == 1 for r in ranks])),
+        f"recall@{k}": float(np.mean([r is not None for r in ranks])),
+        "mrr": float(np.mean([1.0 / r if r else 0.0 for r in ranks])),
+        "encode_ms": float(np.mean(encode_ms)),
+        "search_ms": float(np.mean(search_ms)),
+    }
+    if reranker:
+        quality["rerank_ms"] = float(np.mean(rerank_ms))
+        quality["rerank_p95_ms"] = float(np.percentile(rerank_ms, 95))
+    return quality
+
+
+# ==============================
+# Load
+# ==============================
+def run_load(index, queries, concurrency, total_requests):
+    """Run `total_requests` get_endee_response() calls with `concurrency` threads."""
+    questions = [queries[i % len(queries)]["query"] for i in range(total_requests)]
+
+    def timed(question):
+        started = time.perf_counter()
+        get_endee_response(question, index=index)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, questions))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = 1000.0 * np.array(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "qps": total_requests / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crop disease retrieval")
+    parser.add_argument("--backend", default="endee", choices=["endee", "memory", "local"],
+                        help="live Endee index, or an in-process (memory) or memory-mapped "
+                             "(local) index built from --data")
+    parser.add_argument("--index", default=INDEX_NAME, help="Endee index name")
+    parser.add_argument("--data", default="data.json")
+    parser.add_argument("--queries", default=None, help="labeled queries (.jsonl)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200,
+                        help="end-to-end requests per concurrency level")
+    parser.add_argument("--embedding-cache", action="store_true",
+                        help="keep the query embedding cache on during the load test")
+    parser.add_argument("--rerank", action="store_true",
+                        help="also score with the cross-encoder rerank (no budget applied)")
+    parser.add_argument("--output", default=None, help="save results as JSON")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries, args.data)
+    provider = get_embedding_provider()
+    provider.warm_up()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.backend == "memory":
+            index = build_memory_index(args.data, provider)
+        elif args.backend == "local":
+            index = build_local_index(args.data, provider, tmp)
+        else:
+            index = get_index(args.index)
+
+        print(f"⏱ Scoring {len(queries)} labeled queries...")
+        quality = evaluate_quality(index, provider, queries, args.k)
+
+        reranked = None
+        if args.rerank:
+            reranker = CrossEncoderReranker(budget_ms=float("inf"))
+            reranker.warm_up()
+            print(f"⏱ Scoring {len(queries)} labeled queries with rerank...")
+            reranked = evaluate_quality(index, provider, queries, args.k, reranker)
+
+        if not args.embedding_cache:
+            provider.cache = None
+
+        load = []
+        for concurrency in args.concurrency:
+            print(f"⏱ Load test at concurrency {concurrency}...")
+            load.append(run_load(index, queries, concurrency, args.requests))
+
+    print()
+    print(f"recall@1 {quality['recall@1']:.3f}   recall@{args.k} {quality[f'recall@{args.k}']:.3f}   "
+          f"MRR {quality['mrr']:.3f}")
+    print(f"encode {quality['encode_ms']:.2f} ms   search {quality['search_ms']:.2f} ms  (mean per query)")
+    if reranked:
+        print(f"rerank: recall@1 {reranked['recall@1']:.3f}   "
+              f"recall@{args.k} {reranked[f'recall@{args.k}']:.3f}   MRR {reranked['mrr']:.3f}   "
+              f"+{reranked['rerank_ms']:.2f} ms (p95 {reranked['rerank_p95_ms']:.2f} ms)")
+    print()
+    print(f"{'concurrency':>11} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in load:
+        print(f"{r['concurrency']:>11} {r['qps']:>8.1f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    if args.output:
+        results = {"config": vars(args), "quality": quality, "rerank": reranked, "load": load}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,411 @@
+"""
+ingest_embeddings.py
+
+Embed the crop disease knowledge base and upload it to Endee.
+
+Records are streamed through the pipeline: read lazily, encoded in model
+batches, and upserted in bounded chunks, so memory stays flat no matter
+how large the knowledge base is.
+
+Ingestion is incremental. Vector ids are a hash of (crop, disease, text),
+and a local manifest records which ids were embedded with which model, so
+a re-run only encodes and upserts new or changed records and deletes the
+ones that disappeared. Re-running on an unchanged dataset does no encoder
+work at all (the model is not even loaded).
+
+Input formats:
+    - data.json:  {"Rice": [{"disease": ..., "symptoms": ...}, ...], ...}
+      (the nested structure has to be parsed as a whole)
+    - *.jsonl:    one {"crop": ..., "disease": ..., ...} record per line
+      (fully streamed; use this for large corpora)
+
+For bulk (re)embedding on a CPU-only machine, --workers N shards the
+batches across N processes, each with its own model copy and a share of
+the CPU cores; results are merged back in order into the upsert stream.
+
+--sparse also stores a BM25 term vector with every record, for the
+hybrid (dense + keyword) search mode of the chatbot (HYBRID_SEARCH=1).
+
+--memory writes to the in-process vector store (chatbot/rag/memory_index.py)
+instead of Endee, for running the chatbot with VECTOR_BACKEND=memory and
+no server.
+
+Usage:
+    python ingest_embeddings.py [--data data.json] [--batch-size 64] [--upsert-chunk 500]
+                                [--manifest ingest_manifest.json] [--full]
+                                [--workers 4] [--threads-per-worker 2] [--sparse] [--memory]
+"""
+
+import argparse
+import collections
+import hashlib
+import itertools
 import json
-import uuid
-from sentence_transformers import SentenceTransformer
-from endee import Endee
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.config import INDEX_NAME, MODEL_NAME  # noqa: E402
+from chatbot.rag.crops import save_vocabulary  # noqa: E402
+from chatbot.rag.endee_client import EndeeError, get_index  # noqa: E402
+from chatbot.rag.index_state import bump_generation  # noqa: E402
+from chatbot.rag.memory_index import InMemoryIndex, memory_index_path  # noqa: E402
+from chatbot.rag.sparse import SparseEncoder, SparseStatsBuilder  # noqa: E402
 
-# Configuration
-INDEX_NAME = "crop_diseases"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Configuration (index and model names come from chatbot/rag/config.py,
+# so ingestion and the chatbot agree on both)
 DATA_FILE = "data.json"
+MANIFEST_FILE = "ingest_manifest.json"
+
+BATCH_SIZE = 64       # Texts per model.encode() call
+UPSERT_CHUNK = 500    # Vectors per index.upsert() call
+MAX_RETRIES = 3       # Upsert attempts before giving up
+RETRY_BACKOFF = 1.0   # Seconds, doubled after each failed attempt
+
+
+# ==============================
+# Reading
+# ==============================
+def iter_records(path):
+    """Yield (crop, disease_record) pairs from a .json or .jsonl file."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["crop"], record
+        else:
+            data = json.load(f)
+            for crop, diseases in data.items():
+                for d in diseases:
+                    yield crop, d
+
+
+def build_text(crop, d):
+    return (
+        f"Crop: {crop}. "
+        f"Disease: {d['disease']}. "
+        f"Symptoms: {d['symptoms']}. "
+        f"Temporary solution: {d['temporary_solution']}. "
+        f"Permanent solution: {d['permanent_solution']}. "
+        f"Prevention advice: {d['prevention_advice']}."
+    )
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items without materializing `iterable`."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def record_id(crop, disease, text):
+    """Deterministic vector id: the same record always maps to the same id."""
+    key = "\x1f".join([crop, disease, text])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+# ==============================
+# Manifest
+# ==============================
+def load_manifest(path, index_name=INDEX_NAME, model_name=MODEL_NAME, sparse=False):
+    """
+    Return (ids, reusable): the ids previously written to `index_name`, and
+    whether they were embedded with `model_name`, with sparse vectors iff
+    `sparse` (and can be skipped).
+    """
+    if not os.path.exists(path):
+        return set(), False
+
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if manifest.get("index") != index_name:
+        return set(), False
+
+    ids = set(manifest.get("ids", []))
+    if manifest.get("model") != model_name:
+        print("⚠ Manifest was built with a different model, re-embedding everything")
+        return ids, False
+    if manifest.get("sparse", False) != sparse:
+        print("⚠ Manifest was built " + ("without" if sparse else "with")
+              + " sparse vectors, re-embedding everything")
+        return ids, False
+    return ids, True
+
+
+def index_count(index):
+    """Number of vectors `index` reports holding, or None if it can't say."""
+    try:
+        return index.describe().get("total_elements")
+    except EndeeError as e:
+        print(f"⚠ Could not read index size: {e}")
+        return None
+
+
+def save_manifest(path, ids, index_name=INDEX_NAME, model_name=MODEL_NAME, sparse=False):
+    manifest = {"index": index_name, "model": model_name, "sparse": sparse, "ids": sorted(ids)}
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def iter_changed(records, known_ids, seen_ids, seen_crops, sparse_stats=None):
+    """
+    Yield (id, crop, record, text) for records not in `known_ids`.
+    Every id and crop encountered is added to `seen_ids` / `seen_crops`,
+    and every text to `sparse_stats` if given.
+    """
+    for crop, d in records:
+        text = build_text(crop, d)
+        vector_id = record_id(crop, d["disease"], text)
+        seen_ids.add(vector_id)
+        seen_crops.add(crop)
+        if sparse_stats is not None:
+            sparse_stats.add(text)
+        if vector_id not in known_ids:
+            yield vector_id, crop, d, text
+
+
+# ==============================
+# Writing
+# ==============================
+def make_vector(vector_id, crop, d, text, embedding, sparse_encoder=None):
+    vector = {
+        "id": vector_id,
+        "vector": embedding.tolist(),
+        "meta": {
+            "crop": crop,
+            "disease": d["disease"],
+            "text": text
+        },
+        "filter": {
+            "crop": crop
+        }
+    }
+
+    if sparse_encoder is not None:
+        vector["sparse_indices"], vector["sparse_values"] = sparse_encoder.encode_document(text)
+    return vector
+
+
+def upsert_with_retry(index, vectors, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    for attempt in range(1, retries + 1):
+        try:
+            index.upsert(vectors)
+            return
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"⚠ Upsert failed ({e}), retrying in {backoff:.1f}s...")
+            time.sleep(backoff)
+            backoff *= 2
+
+
+def delete_vectors(index, ids):
+    for vector_id in ids:
+        index.delete_vector(vector_id)
+
+
+# ==============================
+# Encoding
+# ==============================
+def load_model():
+    from sentence_transformers import SentenceTransformer
+
+    print("🔄 Loading embedding model (384-dim)...")
+    return SentenceTransformer(MODEL_NAME)
+
+
+def encode_local(batches, batch_size=BATCH_SIZE):
+    """
+    Yield (batch, embeddings) for each batch of changed records, encoding in
+    this process. The model is only loaded if there is something to encode.
+    """
+    model = None
+    for batch in batches:
+        if model is None:
+            model = load_model()
+        texts = [text for _, _, _, text in batch]
+        yield batch, model.encode(texts, batch_size=batch_size)
+
+
+# Model owned by each pool worker (see _init_worker)
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _encode_in_worker(texts, batch_size):
+    return _worker_model.encode(texts, batch_size=batch_size)
+
+
+def encode_parallel(batches, batch_size=BATCH_SIZE, workers=2, threads_per_worker=None):
+    """
+    Like encode_local(), but shards batches across a process pool where each
+    worker owns one model copy. Results are yielded in input order, and at
+    most 2 batches per worker are in flight so memory stays bounded.
+    """
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        return
+
+    print(f"🔄 Starting {workers} embedding workers ({threads_per_worker} torch threads each)...")
+    with multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(MODEL_NAME, threads_per_worker)
+    ) as pool:
+        in_flight = collections.deque()
+
+        for batch in itertools.chain([first], batches):
+            texts = [text for _, _, _, text in batch]
+            in_flight.append((batch, pool.apply_async(_encode_in_worker, (texts, batch_size))))
+
+            if len(in_flight) >= 2 * workers:
+                done, result = in_flight.popleft()
+                yield done, result.get()
+
+        while in_flight:
+            done, result = in_flight.popleft()
+            yield done, result.get()
+
+
+# ==============================
+# Pipeline
+# ==============================
+def ingest(index, encoded_batches, upsert_chunk=UPSERT_CHUNK, sparse_encoder=None):
+    """
+    Upsert (batch, embeddings) pairs in chunks of `upsert_chunk` vectors,
+    with BM25 sparse vectors if `sparse_encoder` is given.
+    Returns the number of vectors upserted.
+    """
+    pending = []
+    total = 0
+    started = time.perf_counter()
+
+    for batch, embeddings in encoded_batches:
+        for (vector_id, crop, d, text), embedding in zip(batch, embeddings):
+            pending.append(make_vector(vector_id, crop, d, text, embedding, sparse_encoder))
+
+        if len(pending) >= upsert_chunk:
+            upsert_with_retry(index, pending)
+            total += len(pending)
+            pending = []
+            rate = total / (time.perf_counter() - started)
+            print(f"  {total} vectors uploaded ({rate:.1f} docs/sec)")
+
+    if pending:
+        upsert_with_retry(index, pending)
+        total += len(pending)
+
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed crop disease data into Endee")
+    parser.add_argument("--data", default=DATA_FILE, help="data.json or .jsonl file")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--upsert-chunk", type=int, default=UPSERT_CHUNK)
+    parser.add_argument("--manifest", default=None,
+                        help="file recording what has already been embedded "
+                             f"(default: {MANIFEST_FILE}, or next to the --memory store)")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest and re-embed every record")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="embedding processes (each loads its own model copy)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--sparse", action="store_true",
+                        help="also store BM25 sparse vectors for hybrid search "
+                             "(index must be created with --sparse-dim)")
+    parser.add_argument("--memory", action="store_true",
+                        help="write to the in-process store used with VECTOR_BACKEND=memory "
+                             "instead of an Endee server")
+    args = parser.parse_args()
+
+    if args.memory:
+        store = memory_index_path(INDEX_NAME)
+        print(f"🔄 Loading in-memory store {store}...")
+        index = InMemoryIndex.load(store, name=INDEX_NAME)
+        args.manifest = args.manifest or f"{store}.manifest.json"
+    else:
+        print("🔄 Connecting to Endee...")
+        index = get_index(INDEX_NAME)
+        args.manifest = args.manifest or MANIFEST_FILE
+
+    manifest_ids, reusable = load_manifest(args.manifest, sparse=args.sparse)
+    if reusable and not args.full:
+        # A deleted and recreated index still matches its manifest by name
+        count = index_count(index)
+        if count is not None and count != len(manifest_ids):
+            print(f"⚠ Index holds {count} vectors but the manifest lists {len(manifest_ids)}, "
+                  "re-embedding everything")
+            reusable = False
+    known_ids = manifest_ids if reusable and not args.full else set()
+    seen_ids = set()
+    seen_crops = set()
+
+    # Document weights use the average length from the previous run; the
+    # statistics of this run are saved for query-side idf at the end.
+    sparse_encoder = SparseEncoder.load() if args.sparse else None
+    sparse_stats = SparseStatsBuilder() if args.sparse else None
+
+    print(f"🚀 Embedding and upserting new or changed records from {args.data}...")
+    started = time.perf_counter()
+    changed = iter_changed(iter_records(args.data), known_ids, seen_ids, seen_crops, sparse_stats)
+    batches = batched(changed, args.batch_size)
+    if args.workers > 1:
+        encoded = encode_parallel(batches, args.batch_size, args.workers, args.threads_per_worker)
+    else:
+        encoded = encode_local(batches, args.batch_size)
+    total = ingest(index, encoded, args.upsert_chunk, sparse_encoder)
+
+    removed = manifest_ids - seen_ids
+    if removed:
+        print(f"🗑 Deleting {len(removed)} vectors no longer in the dataset...")
+        delete_vectors(index, removed)
+    if args.memory:
+        index.save(store)
+    elapsed = time.perf_counter() - started
+
+    save_manifest(args.manifest, seen_ids, sparse=args.sparse)
+    # Crop names the chatbot can detect in questions and filter on
+    save_vocabulary(seen_crops)
+    if sparse_stats is not None:
+        sparse_stats.build().save()
+
+    if not total and not removed:
+        print("✅ Index already up to date, nothing to embed.")
+        return
+
+    # Invalidate cached chatbot answers built from the previous index contents
+    generation = bump_generation(INDEX_NAME)
+
+    print(f"✅ Uploaded {total} and deleted {len(removed)} vectors in {elapsed:.1f}s "
+          f"(index generation {generation})")
+    if total:
+        print(f"   Throughput: {total / elapsed:.1f} docs/sec with {args.workers} worker(s)")
+
 
-print("🔄 Loading embedding model (384-dim)...")
-model = SentenceTransformer(MODEL_NAME)
-
-print("🔄 Connecting to Endee...")
-client = Endee()
-client.set_base_url("http://localhost:8080/api/v1")   # as per docs
-
-index = client.get_index(name=INDEX_NAME)
-
-print("🔄 Loading data...")
-with open(DATA_FILE, "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-vectors = []
-
-print("🔄 Creating embeddings...")
-for crop, diseases in data.items():
-    for d in diseases:
-        text = (
-            f"Crop: {crop}. "
-            f"Disease: {d['disease']}. "
-            f"Symptoms: {d['symptoms']}. "
-            f"Temporary solution: {d['temporary_solution']}. "
-            f"Permanent solution: {d['permanent_solution']}. "
-            f"Prevention advice: {d['prevention_advice']}."
-        )
-
-        embedding = model.encode(text).tolist()
-
-        vectors.append({
-            "id": str(uuid.uuid4()),
-            "vector": embedding,
-            "meta": {
-                "crop": crop,
-                "disease": d["disease"],
-                "text": text
-            },
-            "filter": {
-                "crop": crop
-            }
-        })
-
-print(f"🚀 Upserting {len(vectors)} vectors to Endee...")
-
-index.upsert(vectors)
-
-print("✅ Upload completed successfully!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+manage_index.py
+
+Create and inspect Endee indexes, including the vector precision.
+
+The Endee server can store vectors as float32, float16, int16d, int8d or
+binary (see endee/src/quant/). Lower precision means less memory and
+faster distance computations at some cost in recall; run
+benchmark_precision.py to pick the cheapest setting that keeps accuracy
+for the crop disease corpus.
+
+Administration goes through the same pooled client as queries (see
+chatbot/rag/endee_client.py).
+
+Usage:
+    python manage_index.py create [--name crop_diseases] [--precision int8d] [--dim 384]
+                                  [--sparse-dim 262144]
+    python manage_index.py info [--name crop_diseases]
+    python manage_index.py list
+    python manage_index.py delete --name crop_diseases_old
+"""
+
+import argparse
+import json
+import os
+import sys
+
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.config import ENDEE_BASE_URL, INDEX_NAME  # noqa: E402
+from chatbot.rag.endee_client import EndeeClient, get_client  # noqa: E402
+from chatbot.rag.sparse import SPARSE_DIM  # noqa: E402
+
+# Configuration
+ENDEE_URL = ENDEE_BASE_URL
+DIMENSION = 384          # all-MiniLM-L6-v2
+SPACE_TYPE = "cosine"
+DEFAULT_PRECISION = "int8d"  # Endee's own default
+
+PRECISIONS = ["float32", "float16", "int16d", "int8d", "binary"]
+
+
+def storage_bytes(precision, dim=DIMENSION):
+    """Bytes Endee uses to store one vector at `precision` (see endee/src/quant/)."""
+    if precision == "float32":
+        return 4 * dim
+    if precision == "float16":
+        return 2 * dim
+    if precision == "int16d":
+        return 2 * dim + 4  # + float scale
+    if precision == "int8d":
+        return dim + 4      # + float scale
+    if precision == "binary":
+        return (dim + 63) // 64 * 8
+    raise ValueError(f"Unknown precision: {precision}")
+
+
+# ==============================
+# Index administration
+# ==============================
+def _client(base_url):
+    return get_client() if base_url == ENDEE_URL else EndeeClient(base_url)
+
+
+def create_index(name, precision=DEFAULT_PRECISION, dim=DIMENSION, space_type=SPACE_TYPE,
+                 m=None, ef_con=None, sparse_dim=0, base_url=ENDEE_URL):
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}")
+    _client(base_url).create_index(name, dim, space_type, precision, m, ef_con, sparse_dim)
+
+
+def index_info(name, base_url=ENDEE_URL):
+    return _client(base_url).index_info(name)
+
+
+def list_indexes(base_url=ENDEE_URL):
+    return _client(base_url).list_indexes()
+
+
+def delete_index(name, base_url=ENDEE_URL):
+    _client(base_url).delete_index(name)
+
+
+# ==============================
+# CLI
+# ==============================
+def main():
+    parser = argparse.ArgumentParser(description="Manage Endee indexes")
+    parser.add_argument("--url", default=ENDEE_URL, help="Endee API base URL")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="create an index")
+    create.add_argument("--name", default=INDEX_NAME)
+    create.add_argument("--precision", default=DEFAULT_PRECISION, choices=PRECISIONS)
+    create.add_argument("--dim", type=int, default=DIMENSION)
+    create.add_argument("--space-type", default=SPACE_TYPE, choices=["cosine", "l2", "ip"])
+    create.add_argument("--m", type=int, default=None, help="HNSW M")
+    create.add_argument("--ef-con", type=int, default=None, help="HNSW ef_construction")
+    create.add_argument("--sparse-dim", type=int, default=0,
+                        help=f"enable sparse (keyword) vectors, e.g. {SPARSE_DIM} for hybrid search")
+
+    info = sub.add_parser("info", help="show index configuration")
+    info.add_argument("--name", default=INDEX_NAME)
+
+    sub.add_parser("list", help="list indexes")
+
+    delete = sub.add_parser("delete", help="delete an index")
+    delete.add_argument("--name", required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_index(args.name, args.precision, args.dim, args.space_type,
+                     args.m, args.ef_con, args.sparse_dim, base_url=args.url)
+        print(f"✅ Created {args.name} ({args.dim}-dim, {args.space_type}, {args.precision}, "
+              f"{storage_bytes(args.precision, args.dim)} bytes/vector)")
+    elif args.command == "info":
+        print(json.dumps(index_info(args.name, args.url), indent=2))
+    elif args.command == "list":
+        for idx in list_indexes(args.url):
+            print(f"{idx['name']:30} {idx['dimension']:>5}-dim  {idx['precision']:8} "
+                  f"{idx['total_elements']:>8} vectors")
+    elif args.command == "delete":
+        delete_index(args.name, args.url)
+        print(f"🗑 Deleted {args.name}")
+
+
+if __name__ == "__main__":
+    main()
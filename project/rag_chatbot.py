@@ -1,33 +1,30 @@
-from sentence_transformers import SentenceTransformer
-from endee import Endee
-import ollama
+import os
+import sys
 
-# =========================
-# Configuration
-# =========================
-INDEX_NAME = "crop_diseases"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-LLM_MODEL = "tinyllama"   # use "phi" if you prefer
-SIMILARITY_THRESHOLD = 0.45
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.answer_cache import AnswerCache  # noqa: E402
+from chatbot.rag.config import INDEX_NAME, LLM_BACKEND, LLM_MODEL  # noqa: E402
+from chatbot.rag.endee_index import get_index  # noqa: E402
+from chatbot.rag.llm import get_llm  # noqa: E402
+from chatbot.rag.service import get_rag_service  # noqa: E402
 
 # =========================
 # Load Embedding Model
 # =========================
 print("🔄 Loading embedding model...")
-embed_model = SentenceTransformer(MODEL_NAME)
+rag_service = get_rag_service()
+rag_service.provider.warm_up()
 
 # =========================
 # Connect to Endee
 # =========================
 print("🔄 Connecting to Endee...")
-client = Endee()
-client.set_base_url("http://localhost:8080/api/v1")
+if get_index(INDEX_NAME) is None:
+    print("⚠ Index not available; answers will come from the local index if one is built.")
 
-try:
-    index = client.get_index(name=INDEX_NAME)
-except:
-    print("❌ Index not found. Create index and run ingest first.")
-    exit()
+llm = get_llm(LLM_BACKEND, LLM_MODEL)
+answer_cache = AnswerCache(llm_model=LLM_MODEL)
 
 print("\n🌾 Smart AI Crop Assistant Ready (type 'exit')\n")
 
@@ -38,59 +35,26 @@ while True:
     user_query = input("You: ")
 
     if user_query.lower() == "exit":
+        stats = answer_cache.stats()
+        print(f"Answer cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_ratio']:.0%}), {stats['entries']} entries")
         break
 
-    # Step 1: Convert query to embedding
-    query_vector = embed_model.encode(user_query).tolist()
-
-    # Step 2: Retrieve from Endee
-    results = index.query(vector=query_vector, top_k=3)
-
-    if not results:
-        print("AI: No relevant information found.\n")
-        continue
-
-    best_score = results[0]["similarity"]
-
-    # Step 3: If similarity too low → skip LLM
-    if best_score < SIMILARITY_THRESHOLD:
-        print("AI: I’m not confident about the disease. Please provide more details.\n")
-        continue
-
-    # Step 4: Build context for LLM
-    context = "\n".join([r["meta"]["text"] for r in results])
-
-    prompt = f"""
-You are an agricultural expert helping farmers.
-
-User Query:
-{user_query}
-
-Relevant Information:
-{context}
-
-Provide:
-1. Most likely disease
-2. Cause
-3. Immediate solution
-4. Permanent treatment
-5. Prevention tips
-
-Give a clear and farmer-friendly answer.
-"""
-
-    # Step 5: Call lightweight LLM
-    try:
-        response = ollama.chat(
-            model=LLM_MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        print("\nAI Response:\n")
-        print(response["message"]["content"])
-        print("\nConfidence:", round(best_score, 2))
-        print("-" * 50, "\n")
-
-    except Exception as e:
-        print("❌ LLM Error:", e)
-        print("Try running: ollama pull tinyllama\n")
+    # Embed, retrieve, then stream the LLM answer (or reuse a cached one)
+    # as it is generated; see RAGService.stream_answer()
+    started = False
+    for event, payload in rag_service.stream_answer(user_query, llm, answer_cache):
+        if event == "token":
+            if not started:
+                print("\nAI Response:\n")
+                started = True
+            print(payload, end="", flush=True)
+        elif event == "error":
+            print(f"\n❌ {payload['reply']}")
+            print(f"Try running: ollama pull {LLM_MODEL}\n")
+        elif "reply" in payload:
+            print(f"AI: {payload['reply']}\n")
+        else:
+            cached = " (cached)" if payload.get("cached") else ""
+            print(f"\n\nConfidence: {payload['confidence']}{cached}")
+            print("-" * 50, "\n")
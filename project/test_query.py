@@ -1,33 +1,26 @@
-from sentence_transformers import SentenceTransformer
-from endee import Endee
+import os
+import sys
 
-# Configuration
-INDEX_NAME = "crop_diseases"
-MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Allow importing the chatbot package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbot.rag.endee_client import EndeeError  # noqa: E402
+from chatbot.rag.service import get_rag_service  # noqa: E402
 
+# Same embedding model, index and client as the chatbot (see chatbot/rag/config.py)
 print("🔄 Loading embedding model...")
-model = SentenceTransformer(MODEL_NAME)
-
-print("🔄 Connecting to Endee...")
-client = Endee()
-client.set_base_url("http://localhost:8080/api/v1")
-
-index = client.get_index(name=INDEX_NAME)
+rag = get_rag_service()
 
 # Test query (change this text to test)
 query_text = "diamond shaped gray spots on rice leaves"
 
 print("🔍 Query:", query_text)
 
-# Create embedding
-query_vector = model.encode(query_text).tolist()
-
-# Search
-results = index.query(
-    vector=query_vector,
-    top_k=5,
-    include_vectors=False
-)
+# Embed and search
+try:
+    _, results = rag.retrieve(query_text, top_k=5)
+except EndeeError as e:
+    print(f"❌ Search failed: {e}")
+    sys.exit(1)
 
 print("\n✅ Results:\n")
 
@@ -1,7 +1,10 @@
 """
-ASGI config for user_site project.
+ASGI config for user_dashboard project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server to use the async chat endpoint (/chat/ragbot/async/):
+
+    uvicorn user_dashboard.asgi:application --workers 2
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +14,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "user_site.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "user_dashboard.settings")
 
 application = get_asgi_application()